@@ -3,91 +3,1269 @@ DermAI - AI Skin Analysis Backend
 Advanced skin analysis using Deep Learning and Computer Vision
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, url_for
 from flask_cors import CORS
+import os
+import json
+import time
+import hashlib
+import hmac
+import gzip
+import re
+import sqlite3
+import threading
+import queue
+import uuid
+import multiprocessing
+import random
+import tempfile
+import cProfile
+import shutil
+import importlib.util
+import warnings
+import weakref
+import atexit
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
 import numpy as np
 import cv2
 import base64
 from io import BytesIO
-from PIL import Image
-import tensorflow as tf
-from sklearn.cluster import KMeans
-import colorsys
-from flask import Flask
-from flask_cors import CORS
+from PIL import Image, ImageSequence
+from functools import cached_property
 
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess as prometheus_multiprocess
+except ImportError:
+    prometheus_client = None
 
-app = Flask(__name__)
-CORS(app)
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-@app.route("/")
-def home():
-    return "DermAI Backend is running successfully!"
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
-if __name__ == "__main__":
-    app.run(debug=True)
 
 app = Flask(__name__)
 CORS(app)
 
-class SkinAnalyzer:
-    """Advanced skin analysis using computer vision and deep learning"""
+# Version of the analysis results, part of every result cache key: bump it
+# with any change to the metrics, their thresholds or calibrations that
+# changes what analyze_image returns, so shared caches stop serving
+# results computed by the previous version
+ANALYZER_VERSION = '4'
+
+# Working resolutions used by the colour and texture metrics
+TONE_ANALYSIS_SIZE = (300, 300)
+TEXTURE_ANALYSIS_SIZE = (400, 400)
+
+# JPEGs are decoded at a reduced DCT scale down to at least this size
+# (0 decodes at full resolution); every metric downsamples further anyway
+DECODE_DRAFT_SIZE = int(os.environ.get('DERMAI_DECODE_DRAFT_SIZE', '1024'))
+
+# Pixel budget per decoded image, checked from the header before decoding;
+# larger JPEGs are drafted down to fit, anything else is rejected with 413.
+# Pillow's own bomb check refuses sources over twice this at open time.
+MAX_IMAGE_PIXELS = int(os.environ.get('DERMAI_MAX_IMAGE_PIXELS', str(50_000_000)))
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+# Per-worker budget for decoded image memory held at once; a decode that
+# would exceed it waits up to DECODE_ADMISSION_WAIT seconds, then gets a 503.
+# Run threaded workers with MALLOC_ARENA_MAX=2 so glibc reuses freed decode
+# buffers across threads instead of growing one arena per thread.
+DECODE_MEMORY_BUDGET = int(os.environ.get('DERMAI_DECODE_MEMORY_MB', '1024')) * 2 ** 20
+DECODE_ADMISSION_WAIT = float(os.environ.get('DERMAI_DECODE_ADMISSION_WAIT', '5'))
+
+# Content types accepted as a raw image request body
+RAW_IMAGE_MIMETYPES = ('image/jpeg', 'image/png', 'image/webp')
+
+# Upload contract published at /api/config: clients downscale photos to at
+# most UPLOAD_MAX_SIDE pixels per side and re-encode them in the first of
+# UPLOAD_FORMATS they support, at UPLOAD_QUALITY (0-1)
+UPLOAD_MAX_SIDE = int(os.environ.get('DERMAI_UPLOAD_MAX_SIDE', str(DECODE_DRAFT_SIZE or 1024)))
+UPLOAD_FORMATS = ('image/webp', 'image/jpeg')
+UPLOAD_QUALITY = 0.85
+# Request bodies larger than this are rejected with 413
+MAX_UPLOAD_BYTES = int(os.environ.get('DERMAI_MAX_UPLOAD_BYTES', str(16 * 1024 * 1024)))
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+
+# Skin colour range in YCrCb shared by the tone mask and the ROI fallback
+SKIN_YCRCB_LOWER = np.array([0, 133, 77], dtype=np.uint8)
+SKIN_YCRCB_UPPER = np.array([255, 173, 127], dtype=np.uint8)
+
+# Crop every frame to the detected face/skin region before the metrics run
+ROI_DETECTION = os.environ.get('DERMAI_ROI_DETECTION', '1') != '0'
+# Haar cascade used to find the face; the skin mask is the fallback
+FACE_CASCADE_PATH = os.environ.get(
+    'DERMAI_FACE_CASCADE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'haarcascade_frontalface_default.xml')
+)
+# Detection runs on a copy downscaled to at most this many pixels per side
+ROI_DETECTION_SIZE = 480
+# Margin added around a detected face, as a fraction of its width/height
+ROI_FACE_PADDING = 0.2
+# Skin mask fallback needs at least this fraction of the frame to be skin
+ROI_MIN_SKIN_FRACTION = 0.02
+# The cropped region is downscaled to at most this many pixels per side
+ROI_MAX_SIDE = int(os.environ.get('DERMAI_ROI_MAX_SIDE', '1024'))
+
+# Rows per tile for the sharpness Laplacian; bounds its temporaries to one strip
+SHARPNESS_TILE_ROWS = 256
+
+# Moment engine behind the texture and region statistics: 'numpy', 'numba'
+# (single-pass compiled kernels) or 'auto' for numba when it is installed
+STATS_ENGINE = os.environ.get('DERMAI_STATS_ENGINE', 'auto')
+
+# Hydration estimator fidelity: 'exact' bilateral filter, 'guided' filter,
+# 'downsampled' bilateral or 'box' filter proxy; ?hydration= overrides it
+HYDRATION_MODE = os.environ.get('DERMAI_HYDRATION_MODE', 'exact')
+# Smoothing residual std (exact bilateral scale) read as fully smooth and
+# fully rough skin; texture-size residuals of real and synthetic skin fall
+# between about 1 and 20, and hydration is scored linearly in between
+HYDRATION_RESIDUAL_RANGE = (1.0, 16.0)
+# Per-mode (scale, offset) mapping the smoothing residual std of each
+# approximation onto the exact bilateral's, fitted for the smallest worst
+# case on 78 frames spanning the low, mid and high hydration bands: flat
+# skin with 0-70 noise, blurred and coarse-bump texture, synthetic photos
+# and the benchmark corpus. Against exact, guided stays within 2 hydration
+# points, downsampled within 7 and box within 14; the box and downsampled
+# filters do not preserve edges, so they count strong edges as texture
+HYDRATION_CALIBRATION = {
+    'exact': (1.0, 0.0),
+    'guided': (1.130, -0.240),
+    'downsampled': (0.955, -1.540),
+    'box': (0.885, 0.180)
+}
+
+# Skin types in the order learned classifiers score them, unless the model
+# lists its own order in a "labels" metadata entry
+SKIN_TYPE_LABELS = ('Normal', 'Dry', 'Oily', 'Combination', 'Sensitive')
+# Learned skin-type classifier: a local .onnx or .tflite file taking the
+# texture-size RGB skin region at its own input size; '' (or a model that
+# fails to load) keeps the threshold rules
+SKIN_TYPE_MODEL = os.environ.get('DERMAI_SKIN_TYPE_MODEL', '')
+# Use the int8 variant saved next to the model as <name>.int8.<ext> if present
+SKIN_TYPE_QUANTIZED = os.environ.get('DERMAI_SKIN_TYPE_QUANTIZED', '0') != '0'
+# Intra-op threads per inference session; 0 lets the runtime decide. With
+# the process executor, 1 avoids oversubscribing the cores.
+SKIN_TYPE_THREADS = int(os.environ.get('DERMAI_SKIN_TYPE_THREADS', '0'))
+# Micro-batching: most frames per inference call, and how long the first
+# frame waits for concurrent ones (0 batches only frames already queued)
+SKIN_TYPE_MAX_BATCH = int(os.environ.get('DERMAI_SKIN_TYPE_MAX_BATCH', '8'))
+SKIN_TYPE_BATCH_WAIT_MS = float(os.environ.get('DERMAI_SKIN_TYPE_BATCH_WAIT_MS', '0'))
+
+# Largest number of images accepted by one batch request
+MAX_BATCH_IMAGES = int(os.environ.get('DERMAI_MAX_BATCH_IMAGES', '32'))
+
+# Burst/video analysis: frames scoring below BURST_MIN_QUALITY on
+# assess_photo_quality are skipped as blurry (sharp frames score about 90,
+# motion-blurred ones bottom out near 80)
+BURST_MIN_QUALITY = int(os.environ.get('DERMAI_BURST_MIN_QUALITY', '83'))
+# Most frames one burst request decodes
+BURST_MAX_FRAMES = int(os.environ.get('DERMAI_BURST_MAX_FRAMES', '60'))
+# Analysis stops early once BURST_STABLE_FRAMES accepted frames in a row
+# leave every score unchanged, after at least BURST_MIN_FRAMES accepted
+BURST_MIN_FRAMES = 3
+BURST_STABLE_FRAMES = 3
+# Only every Nth frame of a video clip is decoded and analysed
+BURST_VIDEO_STRIDE = int(os.environ.get('DERMAI_BURST_VIDEO_STRIDE', '3'))
+
+
+# Dominant skin colour estimator ('mean', 'histogram' or 'minibatch')
+DOMINANT_COLOR_MODE = os.environ.get('DERMAI_DOMINANT_COLOR_MODE', 'mean')
+# Number of tone clusters fitted by the 'minibatch' estimator
+SKIN_TONE_CLUSTERS = int(os.environ.get('DERMAI_SKIN_TONE_CLUSTERS', '3'))
+
+# Histogram estimator: bin width per RGB channel and mean-shift window radius
+COLOR_HISTOGRAM_BIN = 8
+COLOR_MODE_RADIUS = 24.0
+
+
+def dominant_color_mean(pixels, n_clusters=1):
+    """
+    Exact dominant colour for a single cluster: the mean skin pixel.
+    A one-cluster K-Means converges to this value, so no fitting is needed.
+    """
+    return pixels.mean(axis=0)
+
+
+def dominant_color_histogram(pixels, n_clusters=1):
+    """
+    Mode of the skin colour distribution.
+    Pixels are binned into a coarse 3D RGB histogram, the densest bin seeds
+    a mean-shift over the occupied bins, and the converged window is refined
+    with the pixels that fall inside it. Robust to highlights and shadows
+    that pull the plain mean away from the most common tone.
+    """
+    bins = 256 // COLOR_HISTOGRAM_BIN
+    quantized = pixels // COLOR_HISTOGRAM_BIN
+    flat = (quantized[:, 0].astype(np.int32) * bins + quantized[:, 1]) * bins + quantized[:, 2]
+    counts = np.bincount(flat, minlength=bins ** 3)
+    
+    # Occupied bins as (center, weight) pairs
+    occupied = np.flatnonzero(counts)
+    weights = counts[occupied].astype(np.float64)
+    centers = np.stack([
+        occupied // (bins * bins),
+        (occupied // bins) % bins,
+        occupied % bins
+    ], axis=1) * COLOR_HISTOGRAM_BIN + (COLOR_HISTOGRAM_BIN - 1) / 2
+    
+    # Mean-shift from the densest bin with a flat kernel
+    mode = centers[np.argmax(weights)]
+    for _ in range(10):
+        inside = np.sum((centers - mode) ** 2, axis=1) <= COLOR_MODE_RADIUS ** 2
+        shifted = np.average(centers[inside], axis=0, weights=weights[inside])
+        if np.sum((shifted - mode) ** 2) < 0.25:
+            mode = shifted
+            break
+        mode = shifted
+    
+    # Refine on the raw pixels inside the converged window
+    inside = np.sum((pixels - mode) ** 2, axis=1) <= COLOR_MODE_RADIUS ** 2
+    if np.any(inside):
+        return pixels[inside].mean(axis=0)
+    return mode
+
+
+def dominant_color_minibatch(pixels, n_clusters=SKIN_TONE_CLUSTERS):
+    """
+    Centre of the largest of n_clusters mini-batch K-Means clusters.
+    For multi-tone faces (tanned areas, shadows, blush) where a single
+    average lands between tones. Needs scikit-learn.
+    """
+    from sklearn.cluster import MiniBatchKMeans
+    
+    n_clusters = max(1, min(n_clusters, len(pixels)))
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3, batch_size=1024)
+    labels = kmeans.fit_predict(pixels)
+    largest = np.argmax(np.bincount(labels, minlength=n_clusters))
+    return kmeans.cluster_centers_[largest]
+
+
+DOMINANT_COLOR_ESTIMATORS = {
+    'mean': dominant_color_mean,
+    'histogram': dominant_color_histogram,
+    'minibatch': dominant_color_minibatch
+}
+
+
+def laplacian_variance(gray, tile_rows=SHARPNESS_TILE_ROWS):
+    """
+    Variance of the 3x3 Laplacian of a uint8 plane, computed in row strips
+    Each strip is filtered with a one-row halo into int16 (the responses of
+    a uint8 plane fit exactly) and folded into integer running sums, so the
+    largest temporary is one strip instead of a float64 copy of the frame.
+    Matches cv2.Laplacian(gray, cv2.CV_64F).var() up to float rounding.
+    """
+    h = gray.shape[0]
+    total = 0
+    total_sq = 0
+    for y0 in range(0, h, tile_rows):
+        y1 = min(h, y0 + tile_rows)
+        top = max(0, y0 - 1)
+        bottom = min(h, y1 + 1)
+        # Image edges keep OpenCV's default reflected border
+        lap = cv2.Laplacian(gray[top:bottom], cv2.CV_16S)[y0 - top:y1 - top]
+        total += int(lap.sum(dtype=np.int64))
+        total_sq += int(np.square(lap, dtype=np.int32).sum(dtype=np.int64))
+    n = gray.size
+    return (n * total_sq - total * total) / (n * n)
+
+
+class Moments(namedtuple('Moments', 'count mean var')):
+    """Pixel count, mean and variance of one plane"""
+    __slots__ = ()
+    
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+
+# Moments of the texture-size gray plane, its 3x3 Laplacian and its
+# residual after bilateral smoothing
+TextureStats = namedtuple('TextureStats', 'gray laplacian smoothing')
+# Per-channel Moments of the skin pixels and Moments of the whole gray
+# plane of the analysed region
+RegionStats = namedtuple('RegionStats', 'channels gray')
+
+
+def integer_moments(count, total, squares):
+    """Moments from exact integer sums, rounded once at the end"""
+    return Moments(count, total / count, (count * squares - total * total) / (count * count))
+
+
+def numpy_texture_stats(gray, smoothed):
+    """
+    TextureStats with NumPy and OpenCV
+    The Laplacian and the residual are signed int16 planes, and the sums
+    are kept in integers, so nothing wraps around and the moments are exact.
+    """
+    laplacian = cv2.Laplacian(gray, cv2.CV_16S)
+    residual = cv2.subtract(gray, smoothed, dtype=cv2.CV_16S)
+    planes = np.stack([gray, laplacian, residual]).reshape(3, -1).astype(np.int32)
+    totals = planes.sum(axis=1, dtype=np.int64)
+    squares = np.einsum('ij,ij->i', planes, planes, dtype=np.int64)
+    return TextureStats(*(
+        integer_moments(planes.shape[1], int(total), int(square))
+        for total, square in zip(totals, squares)
+    ))
+
+
+def masked_region_stats(image, mask, gray):
+    """RegionStats from cv2.meanStdDev over the skin pixels and the gray plane"""
+    count = image.shape[0] * image.shape[1] if mask is None else cv2.countNonZero(mask)
+    means, stds = cv2.meanStdDev(image, mask=mask)
+    channels = tuple(Moments(count, m, s * s) for m, s in zip(means.ravel(), stds.ravel()))
+    gray_mean, gray_std = cv2.meanStdDev(gray)
+    return RegionStats(channels, Moments(gray.size, gray_mean[0, 0], gray_std[0, 0] ** 2))
+
+
+def _texture_sums(gray, smoothed):
+    """
+    Integer sums behind TextureStats, in one pass over the texture plane
+    Plain Python; numba_texture_stats compiles it with numba on first use.
+    """
+    h, w = gray.shape
+    g1 = g2 = l1 = l2 = r1 = r2 = 0
+    for y in range(h):
+        # OpenCV's default border reflects without repeating the edge
+        up = y - 1 if y > 0 else min(1, h - 1)
+        down = y + 1 if y < h - 1 else max(h - 2, 0)
+        for x in range(w):
+            left = x - 1 if x > 0 else min(1, w - 1)
+            right = x + 1 if x < w - 1 else max(w - 2, 0)
+            g = np.int64(gray[y, x])
+            lap = (np.int64(gray[up, x]) + np.int64(gray[down, x]) + np.int64(gray[y, left])
+                   + np.int64(gray[y, right]) - 4 * g)
+            residual = g - np.int64(smoothed[y, x])
+            g1 += g
+            g2 += g * g
+            l1 += lap
+            l2 += lap * lap
+            r1 += residual
+            r2 += residual * residual
+    return g1, g2, l1, l2, r1, r2
+
+
+_numba_kernels = {}
+
+
+def numba_texture_stats(gray, smoothed):
+    """TextureStats from one compiled pass computing the Laplacian and residual inline"""
+    kernel = _numba_kernels.get('texture')
+    if kernel is None:
+        import numba
+        kernel = _numba_kernels['texture'] = numba.njit(cache=True, nogil=True)(_texture_sums)
+    sums = [int(v) for v in kernel(gray, smoothed)]
+    return TextureStats(*(
+        integer_moments(gray.size, sums[i], sums[i + 1]) for i in (0, 2, 4)
+    ))
+
+
+def bilateral_smooth(gray):
+    """Edge-preserving smoothing the hydration estimate is defined by"""
+    return cv2.bilateralFilter(gray, 9, 75, 75)
+
+
+def guided_smooth(gray, radius=2, eps=40.0 ** 2):
+    """
+    Self-guided filter: edge-preserving like the bilateral, but built from
+    box filters so its cost does not grow with the window
+    """
+    window = (2 * radius + 1, 2 * radius + 1)
+    guide = gray.astype(np.float32)
+    mean = cv2.blur(guide, window)
+    var = cv2.blur(cv2.multiply(guide, guide), window) - cv2.multiply(mean, mean)
+    a = cv2.divide(var, var + eps)
+    b = mean - cv2.multiply(a, mean)
+    smoothed = cv2.multiply(cv2.blur(a, window), guide) + cv2.blur(b, window)
+    return cv2.convertScaleAbs(smoothed)
+
+
+def downsampled_bilateral_smooth(gray):
+    """Bilateral filter at half resolution, upsampled back to the plane size"""
+    h, w = gray.shape
+    half = cv2.resize(gray, (max(1, w // 2), max(1, h // 2)), interpolation=cv2.INTER_AREA)
+    return cv2.resize(cv2.bilateralFilter(half, 5, 75, 75), (w, h), interpolation=cv2.INTER_LINEAR)
+
+
+def box_smooth(gray):
+    """5x5 box blur; the residual becomes a plain high-pass variance proxy"""
+    return cv2.blur(gray, (5, 5))
+
+
+HYDRATION_SMOOTHERS = {
+    'exact': bilateral_smooth,
+    'guided': guided_smooth,
+    'downsampled': downsampled_bilateral_smooth,
+    'box': box_smooth
+}
+
+
+STATS_ENGINES = {
+    'numpy': (numpy_texture_stats, masked_region_stats),
+    # meanStdDev is already one vectorised pass; a compiled loop over the
+    # masked region measured slower, so both engines share it
+    'numba': (numba_texture_stats, masked_region_stats)
+}
+
+if STATS_ENGINE == 'auto':
+    STATS_ENGINE = 'numba' if importlib.util.find_spec('numba') else 'numpy'
+
+
+class OnnxSkinTypeModel:
+    """
+    Skin-type model on an ONNX Runtime CPU session
+    Takes NCHW or NHWC input, float (0-1) or uint8; a dynamic batch
+    dimension lets one call score several frames. session.run is thread-safe.
+    """
+    
+    def __init__(self, path, threads=SKIN_TYPE_THREADS):
+        import onnxruntime
+        
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        
+        spec = self.session.get_inputs()[0]
+        self.input_name = spec.name
+        batch, *dims = spec.shape
+        self.channels_first = dims[0] == 3
+        height, width = dims[1:] if self.channels_first else dims[:2]
+        self.size = (width, height)
+        self.uint8 = spec.type == 'tensor(uint8)'
+        self.max_batch = batch if isinstance(batch, int) else None
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.labels = tuple(metadata['labels'].split(',')) if 'labels' in metadata else SKIN_TYPE_LABELS
+    
+    def feed(self, frames):
+        """Session input for an (N, H, W, 3) uint8 stack at the model's input size"""
+        x = frames.transpose(0, 3, 1, 2) if self.channels_first else frames
+        x = x if self.uint8 else x.astype(np.float32) / 255
+        return {self.input_name: np.ascontiguousarray(x)}
+    
+    def predict(self, frames):
+        """Scores for an (N, H, W, 3) uint8 stack at the model's input size"""
+        return self.session.run(None, self.feed(frames))[0]
+
+
+class TFLiteSkinTypeModel:
+    """
+    Skin-type model on a TFLite interpreter (tflite_runtime or TensorFlow)
+    NHWC input, float (0-1) or quantised int8/uint8. The interpreter is
+    not thread-safe, so calls are serialised; a dynamic batch dimension is
+    resized per call.
+    """
+    
+    def __init__(self, path, threads=SKIN_TYPE_THREADS):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+        
+        self.interpreter = Interpreter(model_path=path, num_threads=threads or None)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        _, height, width, _ = self._input['shape']
+        self.size = (int(width), int(height))
+        dynamic = self._input.get('shape_signature', self._input['shape'])[0] == -1
+        self.max_batch = None if dynamic else int(self._input['shape'][0])
+        self.labels = SKIN_TYPE_LABELS
+        self._lock = threading.Lock()
+    
+    def predict(self, frames):
+        """Scores for an (N, H, W, 3) uint8 stack at the model's input size"""
+        x = frames.astype(np.float32) / 255
+        scale, zero_point = self._input['quantization']
+        if scale:
+            info = np.iinfo(self._input['dtype'])
+            x = np.clip(np.round(x / scale + zero_point), info.min, info.max)
+        x = x.astype(self._input['dtype'])
+        
+        with self._lock:
+            if self.interpreter.get_input_details()[0]['shape'][0] != len(x):
+                self.interpreter.resize_tensor_input(self._input['index'], x.shape)
+                self.interpreter.allocate_tensors()
+            self.interpreter.set_tensor(self._input['index'], x)
+            self.interpreter.invoke()
+            scores = self.interpreter.get_tensor(self._output['index'])
+        
+        scale, zero_point = self._output['quantization']
+        if scale:
+            scores = (scores.astype(np.float32) - zero_point) * scale
+        return scores
+
+
+SKIN_TYPE_BACKENDS = {
+    '.onnx': OnnxSkinTypeModel,
+    '.tflite': TFLiteSkinTypeModel
+}
+
+
+def skin_type_model_path(path, quantized=SKIN_TYPE_QUANTIZED):
+    """The model file to load: its int8 variant when requested and present"""
+    if quantized:
+        stem, ext = os.path.splitext(path)
+        if os.path.exists(f'{stem}.int8{ext}'):
+            return f'{stem}.int8{ext}'
+    return path
+
+
+class SkinTypeClassifier:
+    """
+    Learned skin-type classifier with micro-batching of concurrent frames
+    classify() queues one frame; a dispatcher thread scores everything
+    queued, up to max_batch, in one inference call, optionally waiting
+    wait_ms for more frames to join. Requests that overlap in a threaded
+    worker thus share calls without any delay when the worker is idle.
+    Batch analyses call predict() directly with all their frames.
+    """
+    
+    def __init__(self, model, max_batch=SKIN_TYPE_MAX_BATCH, wait_ms=SKIN_TYPE_BATCH_WAIT_MS):
+        self.model = model
+        self.labels = model.labels
+        self.max_batch = max(1, min(max_batch, model.max_batch or max_batch))
+        self.wait = wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._dispatcher_pid = None
+    
+    @classmethod
+    def load(cls, path):
+        """Load a model file with the backend for its extension"""
+        backend = SKIN_TYPE_BACKENDS.get(os.path.splitext(path)[1].lower())
+        if backend is None:
+            raise ValueError(f"Unsupported skin type model: {path}")
+        return cls(backend(path))
+    
+    def prepare(self, image):
+        """Model input for an analysis context: its texture-size RGB region"""
+        return cv2.resize(AnalysisContext.wrap(image).texture_rgb, self.model.size,
+                          interpolation=cv2.INTER_AREA)
+    
+    def predict(self, inputs):
+        """Class probabilities for a stack of prepared inputs, in chunks the model accepts"""
+        chunk = self.model.max_batch or len(inputs)
+        scores = np.concatenate([
+            self.model.predict(inputs[start:start + chunk]) for start in range(0, len(inputs), chunk)
+        ]).astype(np.float64)
+        if not np.allclose(scores.sum(axis=1), 1, atol=1e-3):
+            # Logits; convert to probabilities
+            scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+            scores /= scores.sum(axis=1, keepdims=True)
+        return scores
+    
+    def classify(self, prepared):
+        """Class probabilities for one prepared input, batched with concurrent calls"""
+        if self.max_batch == 1:
+            return self.predict(prepared[None])[0]
+        self._ensure_dispatcher()
+        future = Future()
+        self._queue.put((prepared, future))
+        return future.result()
+    
+    def _ensure_dispatcher(self):
+        # Threads do not survive a fork, so each worker process starts its own
+        with self._lock:
+            if self._dispatcher_pid != os.getpid():
+                self._dispatcher_pid = os.getpid()
+                threading.Thread(target=self._dispatch, name='skin-type-batcher', daemon=True).start()
+    
+    def _dispatch(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.perf_counter() + self.wait
+            while len(items) < self.max_batch:
+                try:
+                    items.append(self._queue.get(timeout=max(0, deadline - time.perf_counter()))
+                                 if self.wait else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                scores = self.predict(np.stack([prepared for prepared, _ in items]))
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            for (_, future), row in zip(items, scores):
+                future.set_result(row)
+
+
+_face_detectors = threading.local()
+
+
+def _face_cascade():
+    """This thread's face cascade, or None if OpenCV or the model file lacks one"""
+    cascade = getattr(_face_detectors, 'cascade', False)
+    if cascade is False:
+        cascade = None
+        if hasattr(cv2, 'CascadeClassifier') and os.path.exists(FACE_CASCADE_PATH):
+            cascade = cv2.CascadeClassifier(FACE_CASCADE_PATH)
+            if cascade.empty():
+                cascade = None
+        _face_detectors.cascade = cascade
+    return cascade
+
+
+def detect_skin_roi(image):
+    """
+    Locate the face/skin region of an RGB frame
+    Tries the face cascade first, then the bounding box of the largest
+    YCrCb skin blob, then falls back to the whole frame.
+    Returns (x, y, width, height, method) in frame coordinates.
+    """
+    h, w = image.shape[:2]
+    scale = min(1.0, ROI_DETECTION_SIZE / max(h, w))
+    small = cv2.resize(image, (max(1, round(w * scale)), max(1, round(h * scale))),
+                       interpolation=cv2.INTER_AREA)
+    
+    cascade = _face_cascade()
+    if cascade is not None:
+        gray = cv2.equalizeHist(cv2.cvtColor(small, cv2.COLOR_RGB2GRAY))
+        faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(40, 40))
+        if len(faces):
+            fx, fy, fw, fh = max(faces, key=lambda face: face[2] * face[3])
+            box = (fx - fw * ROI_FACE_PADDING, fy - fh * ROI_FACE_PADDING,
+                   fx + fw * (1 + ROI_FACE_PADDING), fy + fh * (1 + ROI_FACE_PADDING))
+            return _scale_roi(box, scale, w, h) + ('face',)
+    
+    # Fall back to the largest connected skin-coloured area
+    mask = cv2.inRange(cv2.cvtColor(small, cv2.COLOR_RGB2YCrCb), SKIN_YCRCB_LOWER, SKIN_YCRCB_UPPER)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((5, 5), np.uint8))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if contours:
+        largest = max(contours, key=cv2.contourArea)
+        if cv2.contourArea(largest) >= ROI_MIN_SKIN_FRACTION * mask.size:
+            bx, by, bw, bh = cv2.boundingRect(largest)
+            return _scale_roi((bx, by, bx + bw, by + bh), scale, w, h) + ('skin',)
+    
+    return (0, 0, w, h, 'frame')
+
+
+def _scale_roi(box, scale, width, height):
+    """Map a detection-scale (x0, y0, x1, y1) box to a clamped frame box"""
+    x0 = max(0, int(box[0] / scale))
+    y0 = max(0, int(box[1] / scale))
+    x1 = min(width, int(np.ceil(box[2] / scale)))
+    y1 = min(height, int(np.ceil(box[3] / scale)))
+    return (x0, y0, max(1, x1 - x0), max(1, y1 - y0))
+
+
+# Add a Server-Timing header with per-stage durations to analysis responses
+SERVER_TIMING = os.environ.get('DERMAI_SERVER_TIMING', '0') != '0'
+# Fraction of analysis requests run under cProfile; adjustable at runtime
+PROFILE_SAMPLE_RATE = float(os.environ.get('DERMAI_PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.environ.get('DERMAI_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'dermai-profiles'))
+# Token for the admin endpoints; they are disabled when unset
+ADMIN_TOKEN = os.environ.get('DERMAI_ADMIN_TOKEN', '')
+
+# Histogram buckets for stage latency, in seconds, and input sizes
+STAGE_SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+INPUT_MEGAPIXELS_BUCKETS = (0.1, 0.3, 1, 2, 5, 8, 12, 24, 48, 100)
+INPUT_BYTES_BUCKETS = tuple(2 ** n for n in range(14, 28, 2))
+
+
+class AnalysisError(Exception):
+    """Analysis failure, tagged with the pipeline stage that raised it"""
+    
+    def __init__(self, stage, error):
+        super().__init__(f"Analysis failed: {str(error)}")
+        self.stage = stage
+
+
+class PipelineMetrics:
+    """
+    Prometheus instruments for the analysis pipeline
+    A no-op when prometheus_client is not installed. Under gunicorn, set
+    PROMETHEUS_MULTIPROC_DIR to an empty directory before the workers start
+    so every worker and pool process writes its samples there; /metrics then
+    aggregates them all.
+    """
     
     def __init__(self):
-        # Initialize models (in production, load pre-trained models)
-        self.skin_type_labels = ['Normal', 'Dry', 'Oily', 'Combination', 'Sensitive']
-        self.skin_tone_labels = ['Fair', 'Light', 'Medium', 'Tan', 'Deep']
+        self.enabled = prometheus_client is not None
+        if not self.enabled:
+            return
+        self.stage_seconds = prometheus_client.Histogram(
+            'dermai_stage_seconds', 'Time spent in each analysis pipeline stage',
+            ['stage'], buckets=STAGE_SECONDS_BUCKETS
+        )
+        self.stage_errors = prometheus_client.Counter(
+            'dermai_stage_errors', 'Analysis failures by pipeline stage', ['stage']
+        )
+        self.input_megapixels = prometheus_client.Histogram(
+            'dermai_input_megapixels', 'Decoded image size in megapixels',
+            buckets=INPUT_MEGAPIXELS_BUCKETS
+        )
+        self.input_bytes = prometheus_client.Histogram(
+            'dermai_input_bytes', 'Encoded upload size in bytes',
+            buckets=INPUT_BYTES_BUCKETS
+        )
+    
+    def observe_stage(self, stage, seconds):
+        if self.enabled:
+            self.stage_seconds.labels(stage).observe(seconds)
+    
+    def count_error(self, stage):
+        if self.enabled:
+            self.stage_errors.labels(stage).inc()
+    
+    def observe_input(self, image=None, nbytes=None):
+        if not self.enabled:
+            return
+        if image is not None:
+            self.input_megapixels.observe(image.shape[0] * image.shape[1] / 1e6)
+        if nbytes is not None:
+            self.input_bytes.observe(nbytes)
+    
+    def export(self):
+        """Exposition-format body and content type for /metrics"""
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            registry = prometheus_client.CollectorRegistry()
+            prometheus_multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = prometheus_client.REGISTRY
+        return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+pipeline_metrics = PipelineMetrics()
+
+
+@contextmanager
+def pipeline_stage(stage, timings=None):
+    """
+    Time one pipeline stage and tag its failures with the stage name
+    Durations go to the stage histogram and, if given, into timings.
+    AnalysisContext planes are computed lazily, so a plane shared by several
+    metrics is charged to the first stage that touches it.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except AnalysisError:
+        raise
+    except (ImageTooLarge, ExecutorSaturated):
+        # Admission refusals, not analysis failures; routes map them to 413/503
+        pipeline_metrics.count_error(stage)
+        raise
+    except Exception as e:
+        pipeline_metrics.count_error(stage)
+        raise AnalysisError(stage, e) from e
+    finally:
+        elapsed = time.perf_counter() - start
+        pipeline_metrics.observe_stage(stage, elapsed)
+        if timings is not None:
+            timings[stage] = elapsed
+
+
+def server_timing(timings, cache_status=None):
+    """Server-Timing header value for stage durations in seconds"""
+    entries = [f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in timings.items()]
+    if cache_status:
+        entries.append(f'cache;desc="{cache_status}"')
+    return ', '.join(entries)
+
+
+class RequestProfiler:
+    """
+    Runs a sampled fraction of requests under cProfile
+    Profiles land in PROFILE_DIR as .prof files for pstats or snakeviz. The
+    sample rate is kept in a file there, so a change made through the admin
+    endpoint on one gunicorn worker reaches every worker within a couple of
+    seconds. With the process executor only the serving process is profiled
+    (decode, cache and response encoding), not the pool worker.
+    """
+    
+    def __init__(self, directory=PROFILE_DIR, rate=PROFILE_SAMPLE_RATE, reload_interval=2.0):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self._rate_path = os.path.join(directory, 'sample_rate')
+        self._rate = rate
+        self._checked = 0.0
+        self._mtime = None
+    
+    @property
+    def rate(self):
+        now = time.monotonic()
+        if now - self._checked >= self.reload_interval:
+            self._checked = now
+            try:
+                mtime = os.stat(self._rate_path).st_mtime_ns
+                if mtime != self._mtime:
+                    with open(self._rate_path) as f:
+                        self._rate = float(f.read())
+                    self._mtime = mtime
+            except (OSError, ValueError):
+                pass
+        return self._rate
+    
+    def set_rate(self, rate):
+        """Change the sample rate for every worker sharing PROFILE_DIR"""
+        if not 0 <= rate <= 1:
+            raise ValueError('Sample rate must be between 0 and 1')
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f'{self._rate_path}.{os.getpid()}'
+        with open(tmp_path, 'w') as f:
+            f.write(repr(rate))
+        os.replace(tmp_path, self._rate_path)
+        self._rate = rate
+        self._checked = 0.0
+    
+    @contextmanager
+    def sample(self, name):
+        """Profile the enclosed block if this request is sampled"""
+        rate = self.rate
+        if rate <= 0 or random.random() >= rate:
+            yield
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            os.makedirs(self.directory, exist_ok=True)
+            profile.dump_stats(os.path.join(
+                self.directory, f'{name}-{int(time.time())}-{os.getpid()}-{uuid.uuid4().hex[:8]}.prof'
+            ))
+    
+    def stats(self):
+        return {
+            'sampleRate': self.rate,
+            'directory': self.directory
+        }
+
+
+request_profiler = RequestProfiler()
+
+
+class ImageTooLarge(Exception):
+    """Raised when an image exceeds MAX_IMAGE_PIXELS or the decode memory budget"""
+
+
+class UnsupportedUpload(Exception):
+    """Raised for request bodies that are neither an image, multipart nor JSON"""
+
+
+def check_pixel_budget(width, height):
+    """Raise ImageTooLarge for frames above MAX_IMAGE_PIXELS"""
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ImageTooLarge(
+            f'Image is {width}x{height}; at most {MAX_IMAGE_PIXELS / 1e6:g} megapixels are accepted'
+        )
+
+
+def decode_cost(image):
+    """
+    Estimated peak bytes of decoding a PIL image into an RGB array
+    Pillow's own buffer (4 bytes per pixel for colour modes), the byte copy
+    NumPy takes from it, the array, and the RGB conversion when one is needed.
+    Measured peaks are 10, 5 and 12 bytes per pixel for RGB, L and RGBA.
+    """
+    bands = len(image.getbands())
+    per_pixel = (4 if bands > 1 else 1) + 2 * bands + (0 if bands == 3 else 3)
+    return image.size[0] * image.size[1] * per_pixel
+
+
+class DecodeBudget:
+    """
+    Per-worker accounting of decoded image memory
+    A decode reserves its estimated peak before any pixel is decoded,
+    waiting up to wait seconds for room and raising ExecutorSaturated after
+    that. Once decoded, the reservation shrinks to the frame itself and is
+    released when the array is garbage collected, so frames still held by
+    running analyses, batches and jobs keep counting against the budget.
+    """
+    
+    def __init__(self, budget=DECODE_MEMORY_BUDGET, wait=DECODE_ADMISSION_WAIT):
+        self.budget = budget
+        self.wait = wait
+        self._in_flight = 0
+        self._cond = threading.Condition()
+    
+    @property
+    def in_flight(self):
+        """Bytes currently reserved"""
+        return self._in_flight
+    
+    def acquire(self, nbytes):
+        """Reserve nbytes, waiting for other decodes to release theirs"""
+        if nbytes > self.budget:
+            raise ImageTooLarge(
+                f'Decoding this image needs about {nbytes / 2 ** 20:.0f} MB, over the '
+                f'{self.budget / 2 ** 20:.0f} MB decode budget'
+            )
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._in_flight + nbytes <= self.budget, self.wait):
+                raise ExecutorSaturated('Decode memory budget is full')
+            self._in_flight += nbytes
+    
+    def release(self, nbytes):
+        with self._cond:
+            self._in_flight -= nbytes
+            self._cond.notify_all()
+    
+    def hold(self, array, reserved):
+        """Shrink a reservation of reserved bytes to array until it is collected"""
+        self.release(reserved - array.nbytes)
+        weakref.finalize(array, self.release, array.nbytes)
+        return array
+    
+    def stats(self):
+        return {
+            'budgetBytes': self.budget,
+            'inFlightBytes': self._in_flight
+        }
+
+
+decode_budget = DecodeBudget()
+
+
+class AnalysisContext:
+    """
+    Per-request image planes shared by every metric.
+    The decoded frame is cropped once to the detected face/skin region and
+    each derived plane is computed on first use and cached, so detection,
+    colour conversions and resizes run once per request however many
+    metrics read them.
+    """
+
+    def __init__(self, image, detect_roi=None, hydration_mode=None):
+        self.source = image
+        self.detect_roi = ROI_DETECTION if detect_roi is None else detect_roi
+        self.hydration_mode = hydration_mode or HYDRATION_MODE
+        if self.hydration_mode not in HYDRATION_SMOOTHERS:
+            raise ValueError(f"Unknown hydration mode: {self.hydration_mode}")
+
+    @classmethod
+    def wrap(cls, image, **options):
+        """Return image as an AnalysisContext, reusing it if it already is one"""
+        if isinstance(image, cls):
+            return image
+        return cls(image, **options)
+
+    @cached_property
+    def roi(self):
+        """(x, y, width, height, method) of the analysed region in the decoded frame"""
+        if not self.detect_roi:
+            h, w = self.source.shape[:2]
+            return (0, 0, w, h, 'frame')
+        return detect_skin_roi(self.source)
+
+    @cached_property
+    def image(self):
+        """RGB region every metric analyses, bounded to ROI_MAX_SIDE"""
+        x, y, w, h, _ = self.roi
+        crop = self.source[y:y + h, x:x + w]
+        scale = ROI_MAX_SIDE / max(w, h)
+        if scale < 1:
+            crop = cv2.resize(crop, (max(1, round(w * scale)), max(1, round(h * scale))),
+                              interpolation=cv2.INTER_AREA)
+        return crop
+
+    @cached_property
+    def skin_mask(self):
+        """YCrCb skin mask over image, or None when too little skin is visible"""
+        ycrcb = cv2.cvtColor(self.image, cv2.COLOR_RGB2YCrCb)
+        mask = cv2.inRange(ycrcb, SKIN_YCRCB_LOWER, SKIN_YCRCB_UPPER)
+        if cv2.countNonZero(mask) < ROI_MIN_SKIN_FRACTION * mask.size:
+            return None
+        return mask
+
+    @cached_property
+    def gray(self):
+        """Grayscale plane of the analysed region"""
+        return cv2.cvtColor(self.image, cv2.COLOR_RGB2GRAY)
+
+    @cached_property
+    def sharpness(self):
+        """Laplacian variance of the grayscale region"""
+        return laplacian_variance(self.gray)
+
+    @cached_property
+    def tone_rgb(self):
+        """RGB frame downscaled for colour analysis"""
+        return cv2.resize(self.image, TONE_ANALYSIS_SIZE)
+
+    @cached_property
+    def tone_mask(self):
+        """skin_mask at the tone size, or None when too little skin is visible"""
+        if self.skin_mask is None:
+            return None
+        return cv2.resize(self.skin_mask, TONE_ANALYSIS_SIZE, interpolation=cv2.INTER_NEAREST)
+
+    @cached_property
+    def texture_gray(self):
+        """Grayscale plane downscaled for texture analysis"""
+        return cv2.resize(self.gray, TEXTURE_ANALYSIS_SIZE)
+
+    @cached_property
+    def texture_rgb(self):
+        """RGB frame area-averaged to the texture size, the skin-type model's input"""
+        return cv2.resize(self.image, TEXTURE_ANALYSIS_SIZE, interpolation=cv2.INTER_AREA)
+
+    @cached_property
+    def texture_stats(self):
+        """TextureStats of texture_gray, shared by the type and hydration metrics"""
+        smoothed = HYDRATION_SMOOTHERS[self.hydration_mode](self.texture_gray)
+        return STATS_ENGINES[STATS_ENGINE][0](self.texture_gray, smoothed)
+
+    @cached_property
+    def region_stats(self):
+        """RegionStats of the analysed region, shared by the barrier and quality metrics"""
+        return STATS_ENGINES[STATS_ENGINE][1](self.image, self.skin_mask, self.gray)
+
+
+class FrozenDict(dict):
+    """
+    Read-only dict for static tables shared by every request
+    Still a dict, so both JSON encoders and dict(...) copies handle it;
+    any in-place change raises TypeError.
+    """
+    
+    def _readonly(self, *args, **kwargs):
+        raise TypeError(f'{type(self).__name__} is read-only')
+    
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+    
+    def __reduce__(self):
+        # Rebuild from a plain copy; the default dict protocol would set items one by one
+        return type(self), (dict(self),)
+
+
+def freeze(value):
+    """value with every nested dict made a FrozenDict and every list a tuple"""
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+SKIN_TONE_LABELS = ('Fair', 'Light', 'Medium', 'Tan', 'Deep')
+
+# Concerns every analysis of a skin type reports; detect_concerns adds
+# metric-based ones to a copy
+SKIN_CONCERNS = freeze({
+    'Dry': ['Dehydration lines', 'Rough texture', 'Flakiness', 'Tightness'],
+    'Oily': ['Excess sebum production', 'Enlarged pores', 'Shine in T-zone', 'Potential blackheads'],
+    'Combination': ['T-zone oiliness', 'Dry cheeks', 'Uneven texture', 'Mixed concerns'],
+    'Sensitive': ['Redness', 'Potential irritation', 'Reactive skin', 'Barrier compromise'],
+    'Normal': ['Minimal concerns', 'Preventive care recommended', 'Maintain current routine']
+})
+
+# Skincare tips per skin type
+SKINCARE_TIPS = freeze({
+    'Dry': [
+        'Use a rich, creamy moisturizer with ceramides and hyaluronic acid twice daily',
+        'Incorporate facial oils (rosehip, argan) to lock in moisture',
+        'Avoid harsh, foaming cleansers - use gentle, milk-based cleansers',
+        'Use a humidifier at night to prevent moisture loss',
+        'Drink 8-10 glasses of water daily and eat omega-3 rich foods',
+        'Apply moisturizer on damp skin for better absorption',
+        'Use overnight sleeping masks 2-3 times per week'
+    ],
+    'Oily': [
+        'Use oil-free, non-comedogenic, gel-based products',
+        'Cleanse twice daily with salicylic acid (BHA) cleanser',
+        'Apply lightweight, water-based moisturizers',
+        'Incorporate niacinamide serum to regulate sebum production',
+        'Use clay or charcoal masks 2-3 times per week',
+        'Avoid over-cleansing which can trigger more oil production',
+        'Use blotting papers instead of washing face multiple times'
+    ],
+    'Combination': [
+        'Multi-masking: use different masks on different zones',
+        'Apply lightweight gel moisturizer on T-zone, richer cream on cheeks',
+        'Use gentle, pH-balanced cleansers',
+        'Incorporate niacinamide to balance oil production',
+        'Exfoliate with AHAs/BHAs 2-3 times per week',
+        'Don\'t skip moisturizer even on oily areas',
+        'Use mattifying primer on oily zones if wearing makeup'
+    ],
+    'Sensitive': [
+        'Patch test all new products on inner arm for 24-48 hours',
+        'Use fragrance-free, hypoallergenic products only',
+        'Avoid alcohol, essential oils, and harsh exfoliants',
+        'Choose mineral-based sunscreens (zinc oxide, titanium dioxide)',
+        'Keep skincare routine simple: cleanser, moisturizer, SPF',
+        'Use lukewarm water, never hot',
+        'Look for soothing ingredients: centella, oat, calendula'
+    ],
+    'Normal': [
+        'Maintain consistent routine: cleanse, tone, moisturize, SPF',
+        'Use broad-spectrum SPF 30+ daily, even indoors',
+        'Incorporate antioxidant serums (Vitamin C) in morning',
+        'Exfoliate 1-2 times per week with gentle AHAs',
+        'Stay hydrated and eat antioxidant-rich fruits/vegetables',
+        'Remove makeup thoroughly before bed',
+        'Consider adding retinol at night for anti-aging prevention'
+    ]
+})
+
+
+class SkinAnalyzer:
+    """
+    Advanced skin analysis using computer vision and deep learning
+    Safe to share between threads: settings are fixed at construction,
+    per-image state lives in the AnalysisContext of each call, and the
+    lookup tables are frozen module constants. The one late assignment,
+    the lazily loaded skin-type classifier, happens once under a lock.
+    """
+    
+    def __init__(self, dominant_color_mode=None, skin_tone_clusters=None, skin_type_model=None):
+        self.skin_type_labels = SKIN_TYPE_LABELS
+        self.skin_tone_labels = SKIN_TONE_LABELS
+        
+        # Pluggable dominant skin colour estimator
+        mode = dominant_color_mode or DOMINANT_COLOR_MODE
+        if mode not in DOMINANT_COLOR_ESTIMATORS:
+            raise ValueError(f"Unknown dominant color mode: {mode}")
+        self.dominant_color_mode = mode
+        self.skin_tone_clusters = skin_tone_clusters or SKIN_TONE_CLUSTERS
+        
+        # Learned skin-type model, loaded on first use; the threshold rules
+        # stand in when none is configured or it fails to load
+        model = SKIN_TYPE_MODEL if skin_type_model is None else skin_type_model
+        self.skin_type_model = skin_type_model_path(model) if model else ''
+        self.skin_type_model_error = None
+        self._skin_type_classifier = None
+        self._skin_type_lock = threading.Lock()
+    
+    @property
+    def skin_type_classifier(self):
+        """SkinTypeClassifier for skin_type_model, or None for the threshold rules"""
+        if not self.skin_type_model or self.skin_type_model_error:
+            return None
+        if self._skin_type_classifier is None:
+            with self._skin_type_lock:
+                if self._skin_type_classifier is None and not self.skin_type_model_error:
+                    try:
+                        self._skin_type_classifier = SkinTypeClassifier.load(self.skin_type_model)
+                    except Exception as e:
+                        self.skin_type_model_error = f'{type(e).__name__}: {e}'
+        return self._skin_type_classifier
+    
+    def skin_type_backend(self):
+        """
+        Which skin-type classifier is in use, for health checks
+        Never loads the model itself, so a probe stays cheap on a cold
+        worker; a configured model not used yet reports backend None.
+        """
+        classifier = self._skin_type_classifier
+        if classifier is not None:
+            backend = type(classifier.model).__name__
+        elif self.skin_type_model and not self.skin_type_model_error:
+            backend = None
+        else:
+            backend = 'rules'
+        return {
+            'backend': backend,
+            'loaded': classifier is not None,
+            'model': self.skin_type_model or None,
+            'error': self.skin_type_model_error
+        }
         
     def preprocess_image(self, image_data):
-        """Preprocess image for analysis"""
-        # Decode base64 image
-        image_bytes = base64.b64decode(image_data.split(',')[1])
-        image = Image.open(BytesIO(image_bytes))
-        
-        # Convert to numpy array
-        img_array = np.array(image)
-        
-        # Convert to RGB if necessary
-        if len(img_array.shape) == 2:
-            img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
-        elif img_array.shape[2] == 4:
-            img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
-            
-        return img_array
+        """
+        Preprocess image for analysis
+        Accepts a base64 data URL, raw encoded bytes or a binary file object
+        """
+        if isinstance(image_data, str):
+            # Decode base64 image
+            image_data = base64.b64decode(image_data.split(',')[1])
+        if isinstance(image_data, (bytes, bytearray)):
+            image_data = BytesIO(image_data)
+        return self.load_image(image_data)
     
-    def analyze_skin_tone(self, image):
+    def load_image(self, fp, draft_size=None):
         """
-        Analyze skin tone using K-Means clustering on face region
-        Uses advanced color analysis in LAB color space
+        Decode an encoded image file object into an RGB array
+        Only the header is read before the pixel and memory budgets are
+        checked; see check_pixel_budget and DecodeBudget.
         """
-        # Resize image for faster processing
-        small_img = cv2.resize(image, (300, 300))
+        try:
+            image = Image.open(fp)
+        except Image.DecompressionBombError as e:
+            raise ImageTooLarge(str(e)) from e
         
-        # Convert to LAB color space for better skin tone detection
-        lab_img = cv2.cvtColor(small_img, cv2.COLOR_RGB2LAB)
+        # Let the JPEG decoder skip detail the metrics never look at, and
+        # scale oversized JPEGs down until they fit the pixel budget
+        draft_size = DECODE_DRAFT_SIZE if draft_size is None else draft_size
+        width, height = image.size
+        box = (draft_size, draft_size) if draft_size else (width, height)
+        if width * height > MAX_IMAGE_PIXELS:
+            # The draft scale keeps at least the requested size, at most
+            # twice it per side, so ask for half the fitting size
+            fit = (MAX_IMAGE_PIXELS / (width * height)) ** 0.5 / 2
+            box = (min(box[0], int(width * fit)), min(box[1], int(height * fit)))
+        if box != (width, height):
+            image.draft(None, box)
+        check_pixel_budget(*image.size)
+        
+        reserved = decode_cost(image)
+        decode_budget.acquire(reserved)
+        try:
+            # Convert to numpy array
+            img_array = np.array(image)
+            del image
+            
+            # Convert to RGB if necessary
+            if len(img_array.shape) == 2:
+                img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
+            elif img_array.shape[2] == 4:
+                img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
+        except BaseException:
+            decode_budget.release(reserved)
+            raise
         
-        # Create skin mask using color thresholding
-        lower_skin = np.array([0, 133, 77], dtype=np.uint8)
-        upper_skin = np.array([255, 173, 127], dtype=np.uint8)
+        return decode_budget.hold(img_array, reserved)
+    
+    def analyze_skin_tone(self, image):
+        """
+        Analyze skin tone from the dominant colour of the skin pixels
+        Uses the configured dominant colour estimator on the context's YCrCb
+        skin mask
+        """
+        ctx = AnalysisContext.wrap(image)
         
-        # Convert to YCrCb for better skin detection
-        ycrcb = cv2.cvtColor(small_img, cv2.COLOR_RGB2YCrCb)
-        skin_mask = cv2.inRange(ycrcb, lower_skin, upper_skin)
+        # Downscaled frame shared with the other metrics
+        small_img = ctx.tone_rgb
         
-        # Apply mask to get skin pixels
-        skin_pixels = small_img[skin_mask > 0]
+        # Skin mask shared with the other metrics
+        skin_mask = ctx.tone_mask
         
-        if len(skin_pixels) > 0:
-            # Use K-Means to find dominant skin color
-            kmeans = KMeans(n_clusters=1, random_state=42, n_init=10)
-            kmeans.fit(skin_pixels)
-            dominant_color = kmeans.cluster_centers_[0].astype(int)
+        if skin_mask is not None and cv2.countNonZero(skin_mask) > 0:
+            # Estimate the dominant skin color
+            skin_pixels = small_img[skin_mask > 0]
+            estimator = DOMINANT_COLOR_ESTIMATORS[self.dominant_color_mode]
+            dominant_color = estimator(skin_pixels, self.skin_tone_clusters).astype(int)
         else:
             # Fallback to center region
             h, w = small_img.shape[:2]
             center_region = small_img[h//3:2*h//3, w//3:2*w//3]
             dominant_color = np.mean(center_region, axis=(0, 1)).astype(int)
         
+        return self.classify_skin_tone(dominant_color)
+    
+    def classify_skin_tone(self, dominant_color):
+        """Map a dominant RGB colour to a skin tone category"""
         # Calculate skin tone category
         brightness = np.mean(dominant_color)
         
@@ -124,23 +1302,39 @@ class SkinAnalyzer:
         Analyze skin type using texture analysis and shine detection
         Uses Gabor filters and variance analysis
         """
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        
-        # Resize for consistent analysis
-        gray = cv2.resize(gray, (400, 400))
+        # Moments of the downscaled gray plane and its derived planes
+        stats = AnalysisContext.wrap(image).texture_stats
         
         # Calculate texture variance (roughness indicator)
-        laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
+        laplacian_var = stats.laplacian.var
         
         # Calculate shine/oil using brightness variance
-        brightness_mean = np.mean(gray)
-        brightness_std = np.std(gray)
+        brightness_std = stats.gray.std
         
-        # Analyze local contrast
-        kernel = np.ones((5, 5), np.float32) / 25
-        blurred = cv2.filter2D(gray, -1, kernel)
-        contrast = np.std(gray - blurred)
+        classifier = self.skin_type_classifier
+        if classifier is not None:
+            try:
+                scores = classifier.classify(classifier.prepare(image))
+            except Exception:
+                # Fall back to the threshold rules for this frame
+                pipeline_metrics.count_error('type_model')
+            else:
+                return self.model_skin_type(scores, laplacian_var, brightness_std)
         
+        return self.classify_skin_type(laplacian_var, brightness_std)
+    
+    def model_skin_type(self, scores, laplacian_var, brightness_std):
+        """Skin type result from classifier probabilities, shaped like classify_skin_type's"""
+        best = int(np.argmax(scores))
+        return {
+            'type': self.skin_type_classifier.labels[best],
+            'confidence': round(float(scores[best]), 2),
+            'texture_variance': float(laplacian_var),
+            'brightness_std': float(brightness_std)
+        }
+    
+    def classify_skin_type(self, laplacian_var, brightness_std):
+        """Map texture variance and brightness spread to a skin type"""
         # Decision logic based on features
         if laplacian_var > 500 and brightness_std > 40:
             skin_type = 'Oily'
@@ -168,33 +1362,54 @@ class SkinAnalyzer:
     def calculate_hydration(self, image):
         """
         Estimate skin hydration level using texture smoothness
+        The smoothing filter follows the context's hydration mode; its
+        residual is calibrated to the exact bilateral's scale.
         """
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        gray = cv2.resize(gray, (400, 400))
-        
-        # Calculate smoothness using bilateral filter difference
-        smoothed = cv2.bilateralFilter(gray, 9, 75, 75)
-        smoothness = 1 - (np.std(gray - smoothed) / 255)
+        return self.score_hydration(self.hydration_smoothness(image))
+    
+    def hydration_smoothness(self, image):
+        """Texture smoothness, 0-1, from the calibrated smoothing residual"""
+        ctx = AnalysisContext.wrap(image)
+        scale, offset = HYDRATION_CALIBRATION[ctx.hydration_mode]
+        residual_std = scale * ctx.texture_stats.smoothing.std + offset
         
-        # Convert to percentage (60-95 range)
-        hydration = int(60 + smoothness * 35)
+        # Calculate smoothness using the signed bilateral filter difference,
+        # placed within the range residuals actually take
+        low, high = HYDRATION_RESIDUAL_RANGE
+        return 1 - min(max((residual_std - low) / (high - low), 0), 1)
+    
+    def score_hydration(self, smoothness):
+        """Map texture smoothness to a hydration level"""
+        # Convert to percentage (40-95 range)
+        hydration = int(40 + smoothness * 55)
         
-        return max(60, min(95, hydration))
+        return max(40, min(95, hydration))
     
     def calculate_barrier_score(self, image):
         """
         Estimate skin barrier health using redness and uniformity
         """
-        # Analyze redness (potential irritation)
-        r_channel = image[:, :, 0]
-        g_channel = image[:, :, 1]
-        b_channel = image[:, :, 2]
+        return self.score_barrier(*self.barrier_inputs(image))
+    
+    def barrier_inputs(self, image):
+        """Redness and colour uniformity of the skin pixels"""
+        # Per-channel statistics over the skin pixels, so background and
+        # hair do not count as unevenness
+        channels = AnalysisContext.wrap(image).region_stats.channels
+        channel_means = np.array([m.mean for m in channels])
+        channel_vars = np.array([m.var for m in channels])
         
-        redness = np.mean(r_channel) - np.mean(g_channel)
+        # Analyze redness (potential irritation)
+        redness = channel_means[0] - channel_means[1]
         
-        # Analyze uniformity
-        uniformity = 1 - (np.std(image) / 255)
+        # Analyze uniformity across all channels pooled together
+        pooled_var = np.mean(channel_vars + channel_means ** 2) - np.mean(channel_means) ** 2
+        uniformity = 1 - (np.sqrt(max(pooled_var, 0)) / 255)
         
+        return redness, uniformity
+    
+    def score_barrier(self, redness, uniformity):
+        """Combine redness and uniformity into a barrier score"""
         # Calculate barrier score (70-95 range)
         barrier = int(70 + uniformity * 20 - (redness / 10))
         
@@ -204,14 +1419,13 @@ class SkinAnalyzer:
         """
         Assess photo clarity and quality
         """
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        ctx = AnalysisContext.wrap(image)
         
         # Calculate sharpness using Laplacian variance
-        laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-        sharpness = laplacian.var()
+        sharpness = ctx.sharpness
         
         # Calculate brightness uniformity
-        brightness_score = 1 - (np.std(gray) / 255)
+        brightness_score = 1 - (ctx.region_stats.gray.std / 255)
         
         # Normalize to percentage (75-98 range)
         quality = int(75 + (sharpness / 1000) * 15 + brightness_score * 8)
@@ -220,15 +1434,8 @@ class SkinAnalyzer:
     
     def detect_concerns(self, skin_type, metrics):
         """Detect skin concerns based on type and metrics"""
-        concerns_map = {
-            'Dry': ['Dehydration lines', 'Rough texture', 'Flakiness', 'Tightness'],
-            'Oily': ['Excess sebum production', 'Enlarged pores', 'Shine in T-zone', 'Potential blackheads'],
-            'Combination': ['T-zone oiliness', 'Dry cheeks', 'Uneven texture', 'Mixed concerns'],
-            'Sensitive': ['Redness', 'Potential irritation', 'Reactive skin', 'Barrier compromise'],
-            'Normal': ['Minimal concerns', 'Preventive care recommended', 'Maintain current routine']
-        }
-        
-        concerns = concerns_map.get(skin_type, [])
+        # A fresh list; the shared table entry is never extended
+        concerns = list(SKIN_CONCERNS.get(skin_type, ()))
         
         # Add hydration-based concerns
         if metrics['hydration'] < 70:
@@ -242,314 +1449,331 @@ class SkinAnalyzer:
     
     def generate_tips(self, skin_type):
         """Generate personalized skincare tips"""
-        tips_map = {
-            'Dry': [
-                'Use a rich, creamy moisturizer with ceramides and hyaluronic acid twice daily',
-                'Incorporate facial oils (rosehip, argan) to lock in moisture',
-                'Avoid harsh, foaming cleansers - use gentle, milk-based cleansers',
-                'Use a humidifier at night to prevent moisture loss',
-                'Drink 8-10 glasses of water daily and eat omega-3 rich foods',
-                'Apply moisturizer on damp skin for better absorption',
-                'Use overnight sleeping masks 2-3 times per week'
-            ],
-            'Oily': [
-                'Use oil-free, non-comedogenic, gel-based products',
-                'Cleanse twice daily with salicylic acid (BHA) cleanser',
-                'Apply lightweight, water-based moisturizers',
-                'Incorporate niacinamide serum to regulate sebum production',
-                'Use clay or charcoal masks 2-3 times per week',
-                'Avoid over-cleansing which can trigger more oil production',
-                'Use blotting papers instead of washing face multiple times'
-            ],
-            'Combination': [
-                'Multi-masking: use different masks on different zones',
-                'Apply lightweight gel moisturizer on T-zone, richer cream on cheeks',
-                'Use gentle, pH-balanced cleansers',
-                'Incorporate niacinamide to balance oil production',
-                'Exfoliate with AHAs/BHAs 2-3 times per week',
-                'Don\'t skip moisturizer even on oily areas',
-                'Use mattifying primer on oily zones if wearing makeup'
-            ],
-            'Sensitive': [
-                'Patch test all new products on inner arm for 24-48 hours',
-                'Use fragrance-free, hypoallergenic products only',
-                'Avoid alcohol, essential oils, and harsh exfoliants',
-                'Choose mineral-based sunscreens (zinc oxide, titanium dioxide)',
-                'Keep skincare routine simple: cleanser, moisturizer, SPF',
-                'Use lukewarm water, never hot',
-                'Look for soothing ingredients: centella, oat, calendula'
-            ],
-            'Normal': [
-                'Maintain consistent routine: cleanse, tone, moisturize, SPF',
-                'Use broad-spectrum SPF 30+ daily, even indoors',
-                'Incorporate antioxidant serums (Vitamin C) in morning',
-                'Exfoliate 1-2 times per week with gentle AHAs',
-                'Stay hydrated and eat antioxidant-rich fruits/vegetables',
-                'Remove makeup thoroughly before bed',
-                'Consider adding retinol at night for anti-aging prevention'
-            ]
-        }
-        
-        return tips_map.get(skin_type, tips_map['Normal'])
+        return list(SKINCARE_TIPS.get(skin_type, SKINCARE_TIPS['Normal']))
     
-    def analyze(self, image_data):
-        """Complete skin analysis pipeline"""
-        try:
-            # Preprocess image
+    def decode_image(self, image_data, timings=None):
+        """Preprocess image, reporting decode errors as analysis failures"""
+        with pipeline_stage('decode', timings):
             image = self.preprocess_image(image_data)
-            
-            # Run all analyses
-            skin_tone = self.analyze_skin_tone(image)
-            skin_type_result = self.analyze_skin_type(image)
-            
-            # Calculate metrics
-            metrics = {
-                'hydration': self.calculate_hydration(image),
-                'barrier_score': self.calculate_barrier_score(image),
-                'photo_clarity': self.assess_photo_quality(image)
-            }
-            
-            # Get concerns and tips
-            concerns = self.detect_concerns(skin_type_result['type'], metrics)
-            tips = self.generate_tips(skin_type_result['type'])
-            
-            # Compile results
-            results = {
-                'skinType': skin_type_result['type'],
-                'skinTypeConfidence': skin_type_result['confidence'],
-                'skinTone': skin_tone,
-                'hydration': metrics['hydration'],
-                'barrierScore': metrics['barrier_score'],
-                'photoClarity': metrics['photo_clarity'],
-                'concerns': concerns,
-                'tips': tips,
-                'technicalMetrics': {
-                    'textureVariance': skin_type_result['texture_variance'],
-                    'brightnessStd': skin_type_result['brightness_std'],
-                    'toneBrightness': skin_tone['brightness']
-                }
-            }
-            
-            return results
-            
-        except Exception as e:
-            raise Exception(f"Analysis failed: {str(e)}")
-
-
-# Indian Products Database
-INDIAN_PRODUCTS = {
-    'Dry': [
-        {
-            'name': 'Cetaphil DAM Daily Advance Ultra Hydrating Lotion',
-            'brand': 'Cetaphil',
-            'price': '₹749',
-            'rating': 4.6,
-            'reviews': 'Perfect for dry skin! Deeply moisturizing without being greasy.',
-            'url': 'https://www.amazon.in/Cetaphil-Daily-Advance-Hydrating-Lotion/dp/B00GFQVK1Y',
-            'category': 'Moisturizer'
-        },
-        {
-            'name': 'Neutrogena Deep Moisture Body Lotion',
-            'brand': 'Neutrogena',
-            'price': '₹599',
-            'rating': 4.5,
-            'reviews': 'Lasts all day! My skin feels soft and hydrated.',
-            'url': 'https://www.amazon.in/Neutrogena-Norwegian-Formula-Moisture-Lotion/dp/B00GFQVK1G',
-            'category': 'Body Care'
-        },
-        {
-            'name': 'Plum Green Tea Renewed Clarity Night Gel',
-            'brand': 'Plum',
-            'price': '₹475',
-            'rating': 4.4,
-            'reviews': 'Lightweight but super hydrating. Love this!',
-            'url': 'https://www.amazon.in/Plum-Green-Renewed-Clarity-Night/dp/B01HHL4RCY',
-            'category': 'Night Care'
-        },
-        {
-            'name': 'WOW Skin Science Vitamin C Face Serum',
-            'brand': 'WOW',
-            'price': '₹549',
-            'rating': 4.3,
-            'reviews': 'Brightens and hydrates. Perfect combo!',
-            'url': 'https://www.flipkart.com/wow-skin-science-vitamin-c-face-serum',
-            'category': 'Serum'
-        },
-        {
-            'name': 'Derma Co 10% Vitamin C Face Serum',
-            'brand': 'The Derma Co',
-            'price': '₹689',
-            'rating': 4.5,
-            'reviews': 'Game changer for dry, dull skin!',
-            'url': 'https://www.amazon.in/Derma-Vitamin-Serum-Hyperpigmentation-Brightening/dp/B08KGSBLF9',
-            'category': 'Serum'
-        }
-    ],
-    'Oily': [
-        {
-            'name': 'Biotique Bio Cucumber Pore Tightening Toner',
-            'brand': 'Biotique',
-            'price': '₹165',
-            'rating': 4.2,
-            'reviews': 'Controls oil and tightens pores effectively!',
-            'url': 'https://www.amazon.in/Biotique-Cucumber-Pore-Tightening-Toner/dp/B00MFZ6BKE',
-            'category': 'Toner'
-        },
-        {
-            'name': 'Minimalist Niacinamide 10% Face Serum',
-            'brand': 'Minimalist',
-            'price': '₹599',
-            'rating': 4.6,
-            'reviews': 'Reduced my oil production in just 2 weeks!',
-            'url': 'https://www.amazon.in/Minimalist-Niacinamide-Face-Serum-Women/dp/B08GKF9Z78',
-            'category': 'Serum'
-        },
-        {
-            'name': 'The Derma Co 2% Salicylic Acid Face Wash',
-            'brand': 'The Derma Co',
-            'price': '₹399',
-            'rating': 4.4,
-            'reviews': 'Clears pores and controls oil perfectly.',
-            'url': 'https://www.amazon.in/Derma-Salicylic-Acid-Face-Wash/dp/B08KGSCQFB',
-            'category': 'Cleanser'
-        },
-        {
-            'name': 'Mamaearth Oil-Free Face Moisturizer',
-            'brand': 'Mamaearth',
-            'price': '₹399',
-            'rating': 4.3,
-            'reviews': 'Lightweight and oil-free. No greasy feeling!',
-            'url': 'https://www.nykaa.com/mamaearth-oil-free-face-moisturizer',
-            'category': 'Moisturizer'
-        },
-        {
-            'name': 'Innisfree Jeju Volcanic Pore Clay Mask',
-            'brand': 'Innisfree',
-            'price': '₹695',
-            'rating': 4.5,
-            'reviews': 'Best clay mask for oily skin. Deep cleanses!',
-            'url': 'https://www.nykaa.com/innisfree-jeju-volcanic-pore-clay-mask',
-            'category': 'Mask'
-        }
-    ],
-    'Combination': [
-        {
-            'name': 'Himalaya Herbals Oil Clear Lemon Face Wash',
-            'brand': 'Himalaya',
-            'price': '₹145',
-            'rating': 4.3,
-            'reviews': 'Balances my combination skin beautifully!',
-            'url': 'https://www.amazon.in/Himalaya-Herbals-Oil-Clear-Lemon/dp/B00MFAK3FK',
-            'category': 'Cleanser'
-        },
-        {
-            'name': 'Dot & Key Vitamin C + E Super Bright Moisturizer',
-            'brand': 'Dot & Key',
-            'price': '₹645',
-            'rating': 4.5,
-            'reviews': 'Not too heavy, perfect for combination skin!',
-            'url': 'https://www.amazon.in/Dot-Key-Vitamin-Moisturizer-Niacinamide/dp/B08LQPJX2Y',
-            'category': 'Moisturizer'
-        },
-        {
-            'name': 'Forest Essentials Facial Toner Pure Rosewater',
-            'brand': 'Forest Essentials',
-            'price': '₹725',
-            'rating': 4.6,
-            'reviews': 'Luxurious and effective. Balances skin pH.',
-            'url': 'https://www.nykaa.com/forest-essentials-facial-toner-rosewater',
-            'category': 'Toner'
-        },
-        {
-            'name': 'Plum 15% Niacinamide Face Serum',
-            'brand': 'Plum',
-            'price': '₹596',
-            'rating': 4.4,
-            'reviews': 'Perfect for balancing combination skin!',
-            'url': 'https://www.amazon.in/Plum-Niacinamide-Face-Serum-Hyperpigmentation/dp/B08X4QZWM7',
-            'category': 'Serum'
+        pipeline_metrics.observe_input(image)
+        return image
+    
+    def result_settings(self, hydration_mode=None):
+        """
+        Everything besides the pixels that shapes analyze_image's results
+        The analyzer version, this analyzer's options and the active engine
+        modes with their calibrations.
+        """
+        hydration_mode = hydration_mode or HYDRATION_MODE
+        return (
+            ANALYZER_VERSION,
+            self.dominant_color_mode, self.skin_tone_clusters,
+            ROI_DETECTION, ROI_MAX_SIDE,
+            STATS_ENGINE,
+            hydration_mode, HYDRATION_CALIBRATION.get(hydration_mode),
+            self.skin_type_model
+        )
+    
+    def fingerprint(self, image, hydration_mode=None):
+        """
+        Content hash of a decoded image and the settings that shape its results
+        Identical pixels hash the same whatever container or metadata they
+        arrived in, so lossless re-encodes of a photo share one key. The
+        settings come from result_settings, so a deploy that changes them or
+        ANALYZER_VERSION misses results cached before it.
+        """
+        image = np.ascontiguousarray(image)
+        digest = hashlib.blake2b(digest_size=20)
+        settings = (self.result_settings(hydration_mode), image.shape)
+        digest.update(repr(settings).encode())
+        digest.update(image.data)
+        return digest.hexdigest()
+    
+    def analyze(self, image_data):
+        """Complete skin analysis pipeline"""
+        return self.analyze_image(self.decode_image(image_data))
+    
+    def analyze_image(self, image, progress=None, timings=None, hydration_mode=None):
+        """
+        Run every metric on a decoded RGB image
+        progress, if given, is called with each stage name as the stage starts;
+        timings, if given, is filled with each stage's duration in seconds.
+        hydration_mode overrides HYDRATION_MODE for this image.
+        Failures raise AnalysisError naming the stage.
+        """
+        if progress is None:
+            progress = lambda stage: None
+        
+        # Share one set of derived planes across all metrics; the skin region
+        # is located and cropped up front so its cost is timed on its own
+        with pipeline_stage('roi', timings):
+            image = AnalysisContext.wrap(image, hydration_mode=hydration_mode)
+            image.roi
+        
+        # Run all analyses
+        progress('tone')
+        with pipeline_stage('tone', timings):
+            skin_tone = self.analyze_skin_tone(image)
+        progress('type')
+        with pipeline_stage('type', timings):
+            skin_type_result = self.analyze_skin_type(image)
+        
+        # Calculate metrics
+        progress('hydration')
+        with pipeline_stage('hydration', timings):
+            hydration = self.calculate_hydration(image)
+        progress('barrier')
+        with pipeline_stage('barrier', timings):
+            barrier_score = self.calculate_barrier_score(image)
+        progress('quality')
+        with pipeline_stage('quality', timings):
+            photo_clarity = self.assess_photo_quality(image)
+        metrics = {
+            'hydration': hydration,
+            'barrier_score': barrier_score,
+            'photo_clarity': photo_clarity
         }
-    ],
-    'Sensitive': [
-        {
-            'name': 'Cetaphil Gentle Skin Cleanser',
-            'brand': 'Cetaphil',
-            'price': '₹759',
-            'rating': 4.7,
-            'reviews': 'Gentle and doesn\'t irritate my sensitive skin at all!',
-            'url': 'https://www.amazon.in/Cetaphil-Gentle-Skin-Cleanser-Face/dp/B001ET76EY',
-            'category': 'Cleanser'
-        },
-        {
-            'name': 'Aveeno Daily Moisturizing Lotion',
-            'brand': 'Aveeno',
-            'price': '₹899',
-            'rating': 4.6,
-            'reviews': 'Soothes and hydrates without any irritation.',
-            'url': 'https://www.amazon.in/Aveeno-Daily-Moisturizing-Lotion-591ml/dp/B00GFQVK26',
-            'category': 'Moisturizer'
-        },
-        {
-            'name': 'Sebamed Clear Face Care Gel',
-            'brand': 'Sebamed',
-            'price': '₹575',
-            'rating': 4.5,
-            'reviews': 'Perfect for sensitive skin. No breakouts!',
-            'url': 'https://www.amazon.in/Sebamed-Clear-Face-Care-Gel/dp/B00U2XQKPI',
-            'category': 'Gel'
-        },
-        {
-            'name': 'La Roche-Posay Toleriane Sensitive Fluid',
-            'brand': 'La Roche-Posay',
-            'price': '₹1,750',
-            'rating': 4.7,
-            'reviews': 'Best for extremely sensitive skin. Worth every penny!',
-            'url': 'https://www.nykaa.com/la-roche-posay-toleriane-sensitive-fluid',
-            'category': 'Moisturizer'
+        
+        with pipeline_stage('compile', timings):
+            return self.compile_results(skin_tone, skin_type_result, metrics, roi=image.roi)
+    
+    def compile_results(self, skin_tone, skin_type_result, metrics, roi=None):
+        """Assemble the analysis response from the individual metric results"""
+        # Get concerns and tips
+        concerns = self.detect_concerns(skin_type_result['type'], metrics)
+        tips = self.generate_tips(skin_type_result['type'])
+        
+        # Compile results
+        results = {
+            'skinType': skin_type_result['type'],
+            'skinTypeConfidence': skin_type_result['confidence'],
+            'skinTone': skin_tone,
+            'hydration': metrics['hydration'],
+            'barrierScore': metrics['barrier_score'],
+            'photoClarity': metrics['photo_clarity'],
+            'concerns': concerns,
+            'tips': tips,
+            'technicalMetrics': {
+                'textureVariance': skin_type_result['texture_variance'],
+                'brightnessStd': skin_type_result['brightness_std'],
+                'toneBrightness': skin_tone['brightness']
+            }
         }
-    ],
-    'Normal': [
-        {
-            'name': 'Plum Green Tea Renewed Clarity Face Wash',
-            'brand': 'Plum',
-            'price': '₹345',
-            'rating': 4.5,
-            'reviews': 'Maintains my skin\'s balance perfectly!',
-            'url': 'https://www.amazon.in/Plum-Green-Renewed-Clarity-Face/dp/B01HHL4RCW',
-            'category': 'Cleanser'
-        },
-        {
-            'name': 'Biotique Bio Morning Nectar Sunscreen',
-            'brand': 'Biotique',
-            'price': '₹265',
-            'rating': 4.4,
-            'reviews': 'Light protection without heaviness.',
-            'url': 'https://www.amazon.in/Biotique-Morning-Nectar-Flawless-Lotion/dp/B00MFZ6BKO',
-            'category': 'Sunscreen'
-        },
-        {
-            'name': 'Mamaearth Vitamin C Face Serum',
-            'brand': 'Mamaearth',
-            'price': '₹599',
-            'rating': 4.5,
-            'reviews': 'Brightens and evens skin tone beautifully!',
-            'url': 'https://www.amazon.in/Mamaearth-Vitamin-Serum-Reduce-Pigmentation/dp/B07VNMMV3Z',
-            'category': 'Serum'
-        },
-        {
-            'name': 'The Face Shop Rice Water Bright Cleansing Foam',
-            'brand': 'The Face Shop',
-            'price': '₹450',
-            'rating': 4.4,
-            'reviews': 'Gentle cleansing with brightening effect!',
-            'url': 'https://www.nykaa.com/the-face-shop-rice-water-bright-cleansing-foam',
-            'category': 'Cleanser'
+        
+        if roi is not None:
+            x, y, w, h, method = roi
+            results['technicalMetrics']['roi'] = {
+                'x': int(x),
+                'y': int(y),
+                'width': int(w),
+                'height': int(h),
+                'method': method
+            }
+        
+        return results
+    
+    def analyze_batch(self, images, hydration_mode=None):
+        """
+        Analyze several decoded images, batching the skin-type model
+        images may be any iterable of RGB arrays; an Exception in place of an
+        array marks an image that failed to decode. The metrics run per image
+        as each frame arrives, so only one full-resolution frame is held at a
+        time and every result matches analyze_image; each image's region has
+        its own size, so they are not stacked. Only the skin-type model
+        scores every prepared frame in one inference call.
+        Returns one {'success': ..., 'data' or 'error': ...} entry per image.
+        """
+        entries = []
+        classifier = self.skin_type_classifier
+        model_inputs = []
+        
+        for image in images:
+            if isinstance(image, Exception):
+                entries.append({'success': False, 'error': f"Analysis failed: {str(image)}"})
+                continue
+            try:
+                ctx = AnalysisContext.wrap(image, hydration_mode=hydration_mode)
+                partial = {
+                    'skin_tone': self.analyze_skin_tone(ctx),
+                    'texture_variance': ctx.texture_stats.laplacian.var,
+                    'brightness_std': ctx.texture_stats.gray.std,
+                    'hydration': self.calculate_hydration(ctx),
+                    'barrier_score': self.calculate_barrier_score(ctx),
+                    'photo_clarity': self.assess_photo_quality(ctx),
+                    'roi': ctx.roi
+                }
+                model_input = classifier.prepare(ctx) if classifier is not None else None
+                if model_input is not None:
+                    model_inputs.append(model_input)
+                entries.append(partial)
+            except Exception as e:
+                entries.append({'success': False, 'error': f"Analysis failed: {str(e)}"})
+        
+        # One inference call for every frame the model scores
+        if model_inputs:
+            try:
+                model_scores = classifier.predict(np.stack(model_inputs))
+            except Exception:
+                pipeline_metrics.count_error('type_model')
+                model_inputs = []
+        
+        results = []
+        index = 0
+        for entry in entries:
+            if 'success' in entry:
+                results.append(entry)
+                continue
+            try:
+                if model_inputs:
+                    skin_type_result = self.model_skin_type(
+                        model_scores[index], entry['texture_variance'], entry['brightness_std']
+                    )
+                else:
+                    skin_type_result = self.classify_skin_type(
+                        entry['texture_variance'], entry['brightness_std']
+                    )
+                metrics = {
+                    'hydration': entry['hydration'],
+                    'barrier_score': entry['barrier_score'],
+                    'photo_clarity': entry['photo_clarity']
+                }
+                results.append({
+                    'success': True,
+                    'data': self.compile_results(
+                        entry['skin_tone'], skin_type_result, metrics, roi=entry['roi']
+                    )
+                })
+            except Exception as e:
+                results.append({'success': False, 'error': f"Analysis failed: {str(e)}"})
+            index += 1
+        
+        return results
+    
+    def analyze_burst(self, frames, hydration_mode=None, min_quality=BURST_MIN_QUALITY):
+        """
+        Analyze a short clip or burst of frames into one result
+        frames may be any iterable of RGB arrays, with an Exception in place
+        of a frame that failed to decode; it is consumed lazily and closed on
+        return, so only the current frame is held in memory. Frames scoring
+        below min_quality on assess_photo_quality are skipped as blurry. Each
+        accepted frame updates running means of the inputs behind the tone,
+        type, hydration, barrier and clarity scores, and the scores are
+        recomputed from those means. Stops once they have converged (see
+        BURST_STABLE_FRAMES) or after BURST_MAX_FRAMES frames. If every frame
+        is blurry the sharpest one is used on its own.
+        """
+        counts = {'frames': 0, 'analyzed': 0, 'skippedBlurry': 0, 'failed': 0}
+        means = None
+        scores = None
+        stable = 0
+        converged = False
+        best_roi = (-1, None)
+        sharpest_blurry = (-1, None)
+        error = None
+        
+        frames = iter(frames)
+        try:
+            for frame in frames:
+                if counts['frames'] >= BURST_MAX_FRAMES:
+                    break
+                counts['frames'] += 1
+                if isinstance(frame, Exception):
+                    counts['failed'] += 1
+                    error = frame
+                    continue
+                try:
+                    ctx = AnalysisContext.wrap(frame, hydration_mode=hydration_mode)
+                    clarity = self.assess_photo_quality(ctx)
+                    if clarity < min_quality:
+                        counts['skippedBlurry'] += 1
+                        if clarity > sharpest_blurry[0]:
+                            sharpest_blurry = (clarity, ctx)
+                        continue
+                    features = self._burst_features(ctx, clarity)
+                except Exception as e:
+                    counts['failed'] += 1
+                    error = e
+                    continue
+                
+                counts['analyzed'] += 1
+                if clarity > best_roi[0]:
+                    best_roi = (clarity, ctx.roi)
+                # Running mean: one update per frame, nothing re-analysed
+                if means is None:
+                    means = features
+                else:
+                    means += (features - means) / counts['analyzed']
+                
+                # Converged once the scores stop moving
+                skin_tone, skin_type_result, metrics = self._burst_scores(means)
+                key = (skin_tone['name'], skin_type_result['type'],
+                       metrics['hydration'], metrics['barrier_score'])
+                stable = stable + 1 if key == scores else 0
+                scores = key
+                if counts['analyzed'] >= BURST_MIN_FRAMES and stable >= BURST_STABLE_FRAMES:
+                    converged = True
+                    break
+        finally:
+            close = getattr(frames, 'close', None)
+            if close is not None:
+                close()
+        
+        if means is None:
+            clarity, ctx = sharpest_blurry
+            if ctx is None:
+                if isinstance(error, (ImageTooLarge, ExecutorSaturated)):
+                    raise error
+                raise AnalysisError('decode', error or ValueError('No frames provided'))
+            # Every frame was blurry: fall back to the sharpest one
+            means = self._burst_features(ctx, clarity)
+            best_roi = (clarity, ctx.roi)
+        
+        skin_tone, skin_type_result, metrics = self._burst_scores(means)
+        results = self.compile_results(skin_tone, skin_type_result, metrics, roi=best_roi[1])
+        counts['converged'] = converged
+        results['burst'] = counts
+        return results
+    
+    def _burst_features(self, ctx, clarity):
+        """
+        Per-frame inputs averaged by analyze_burst, as a float vector
+        With a skin-type classifier its class probabilities follow the
+        fixed features, so the burst type comes from their average.
+        """
+        skin_tone = self.analyze_skin_tone(ctx)
+        redness, uniformity = self.barrier_inputs(ctx)
+        scores = []
+        classifier = self.skin_type_classifier
+        if classifier is not None:
+            scores = classifier.classify(classifier.prepare(ctx))
+        return np.array([
+            *skin_tone['rgb'],
+            ctx.texture_stats.laplacian.var,
+            ctx.texture_stats.gray.std,
+            self.hydration_smoothness(ctx),
+            redness,
+            uniformity,
+            clarity,
+            *scores
+        ], dtype=np.float64)
+    
+    def _burst_scores(self, means):
+        """Skin tone, skin type and metrics from averaged _burst_features"""
+        skin_tone = self.classify_skin_tone(means[:3].astype(int))
+        if len(means) > 9:
+            skin_type_result = self.model_skin_type(means[9:], means[3], means[4])
+        else:
+            skin_type_result = self.classify_skin_type(means[3], means[4])
+        metrics = {
+            'hydration': self.score_hydration(means[5]),
+            'barrier_score': self.score_barrier(means[6], means[7]),
+            'photo_clarity': int(means[8])
         }
-    ]
-}
+        return skin_tone, skin_type_result, metrics
+
 
 # Lipstick recommendations
-LIPSTICK_RECOMMENDATIONS = {
+LIPSTICK_RECOMMENDATIONS = freeze({
     'Fair': [
         {'name': 'Nude Pink', 'brand': 'Maybelline SuperStay Matte Ink - Dreamer', 'color': '#E6A9A3', 'price': '₹499'},
         {'name': 'Coral Blush', 'brand': 'Lakme 9to5 Primer + Matte - Rosy Plum', 'color': '#FF7F7F', 'price': '₹395'},
@@ -580,10 +1804,24 @@ LIPSTICK_RECOMMENDATIONS = {
         {'name': 'Dark Red', 'brand': 'Nykaa So Matte - Boss Lady', 'color': '#8B0000', 'price': '₹449'},
         {'name': 'Burgundy', 'brand': 'Sugar Nothing Else Matter - 06 Plum Yum', 'color': '#800020', 'price': '₹699'}
     ]
-}
+})
+
+# Representative skin brightness (mean RGB) of each tone bucket, between
+# the classify_skin_tone thresholds; the shade matcher's target colour is
+# interpolated between the bucket lists anchored here
+SKIN_TONE_BRIGHTNESS = freeze({'Deep': 120, 'Tan': 155, 'Medium': 182, 'Light': 207, 'Fair': 235})
+# Skin hue angle (degrees in CIELAB a*b*) read as a neutral undertone, and
+# the distance either side at which it counts as fully warm or cool
+UNDERTONE_NEUTRAL_HUE = 58.0
+UNDERTONE_HUE_RANGE = 15.0
+# How far a fully warm (cool) undertone moves the target shade towards
+# yellow (blue), in CIELAB b* units
+UNDERTONE_SHIFT = 10.0
+# Shades returned per analysis
+LIPSTICK_MATCHES = 4
 
 # Style recommendations
-STYLE_RECOMMENDATIONS = {
+STYLE_RECOMMENDATIONS = freeze({
     'Fair': {
         'colors': ['Soft pastels', 'Light blues and lavenders', 'Mint green', 'Blush pink', 'Powder blue'],
         'avoid': ['Neon colors', 'Very dark colors that create harsh contrast', 'Pure black'],
@@ -609,10 +1847,1459 @@ STYLE_RECOMMENDATIONS = {
         'avoid': ['Dull, muted colors', 'Dark navy that blends'],
         'metals': 'Gold jewelry creates stunning contrast against deep skin'
     }
+})
+
+# Product catalog file; edits are picked up without restarting workers
+CATALOG_PATH = os.environ.get(
+    'DERMAI_CATALOG_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'products.json')
+)
+# Seconds between checks of the catalog file for changes
+CATALOG_RELOAD_INTERVAL = float(os.environ.get('DERMAI_CATALOG_RELOAD_INTERVAL', '2'))
+# Page size bounds for filtered product queries
+CATALOG_PAGE_SIZE = 20
+CATALOG_MAX_PAGE_SIZE = 100
+
+# Product fields in response order
+PRODUCT_FIELDS = ('name', 'brand', 'price', 'rating', 'reviews', 'url', 'category')
+# ?sort= values for product queries
+# Rating sorts best first, the order shoppers expect; '-rating' reverses it
+PRODUCT_SORTS = {
+    'rating': 'rating DESC, position',
+    '-rating': 'rating ASC, position',
+    'price': 'price_value ASC, position',
+    '-price': 'price_value DESC, position',
+    'name': 'name COLLATE NOCASE, position'
+}
+
+# Browser/CDN cache lifetime for catalog responses, in seconds
+CATALOG_MAX_AGE = int(os.environ.get('DERMAI_CATALOG_MAX_AGE', '3600'))
+
+# Encoder behind encode_json and json_response: 'stdlib' (Flask's own),
+# 'orjson', or 'auto' for orjson when it is installed. Both write compact
+# JSON with sorted keys; orjson leaves non-ASCII text as UTF-8.
+JSON_ENCODER = os.environ.get('DERMAI_JSON_ENCODER', 'auto')
+
+# Top-level fields of a ?compact=1 analysis result: the measurements, with
+# catalog ids (resolved through /api/catalog) standing in for the catalog
+# text of the full result
+COMPACT_FIELDS = ('skinType', 'skinTypeConfidence', 'skinTone', 'hydration', 'barrierScore',
+                  'photoClarity', 'concerns', 'burst')
+# Every field ?fields= may select from a full or compact result
+RESULT_FIELDS = COMPACT_FIELDS + ('tips', 'technicalMetrics', 'products', 'lipsticks',
+                                  'styleRecommendations', 'productIds', 'lipstickIds',
+                                  'catalogVersion')
+
+# Negotiated response compression: bodies of these types and at least
+# COMPRESS_MIN_BYTES long are sent brotli (when installed) or gzip encoded;
+# DERMAI_COMPRESS_MIN_BYTES=0 turns compression off
+COMPRESS_MIN_BYTES = int(os.environ.get('DERMAI_COMPRESS_MIN_BYTES', '512'))
+COMPRESS_MIMETYPES = ('application/json', 'text/html', 'text/plain')
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def stdlib_encode_json(obj):
+    """Encode obj exactly as jsonify does outside debug mode, without the newline"""
+    return app.json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def orjson_encode_json(obj):
+    """Encode obj with orjson, key-sorted, falling back to Flask's default for other types"""
+    return orjson.dumps(
+        obj, default=app.json.default,
+        option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    )
+
+
+JSON_ENCODERS = {
+    'stdlib': stdlib_encode_json,
+    'orjson': orjson_encode_json
+}
+
+if JSON_ENCODER == 'auto':
+    JSON_ENCODER = 'orjson' if orjson is not None else 'stdlib'
+
+
+def encode_json(obj):
+    """Compact JSON bytes of obj from the configured encoder, without a newline"""
+    return JSON_ENCODERS[JSON_ENCODER](obj)
+
+
+def json_response(obj, status=200):
+    """jsonify for hot routes: one pass straight to bytes with the configured encoder"""
+    return app.response_class(encode_json(obj) + b'\n', status=status, mimetype='application/json')
+
+
+def catalog_id(item):
+    """Short id of a catalog product or lipstick shade, stable while its brand, name and colour are"""
+    key = '\0'.join(str(item.get(field, '')) for field in ('brand', 'name', 'color'))
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=6).hexdigest()
+
+
+class CatalogIndex:
+    """
+    Catalog responses compiled once at startup
+    For every skin type and tone this holds the complete pre-encoded
+    response body of the catalog endpoints with a strong ETag, plus the
+    encoded recommendation lists that the analysis response splices in.
+    The whole catalog by id, with the tips per skin type, is encoded once
+    more for /api/catalog; its ETag is the version compact results name.
+    The tables are read-only once built, so it is shared freely across
+    threads.
+    """
+    
+    def __init__(self, products, lipsticks, styles, tips):
+        self._responses = {}
+        self._fragments = {}
+        
+        for skin_type, items in products.items():
+            self._add('products', skin_type, items, {'skinType': skin_type, 'products': items})
+        for skin_tone, items in lipsticks.items():
+            self._add('lipsticks', skin_tone, items, {'skinTone': skin_tone, 'lipsticks': items})
+        for skin_tone, style in styles.items():
+            self._fragments[('styleRecommendations', skin_tone)] = encode_json(style)
+        
+        catalog = {
+            'products': {catalog_id(item): item for items in products.values() for item in items},
+            'lipsticks': {catalog_id(item): item for items in lipsticks.values() for item in items},
+            'tips': tips,
+            'styleRecommendations': styles
+        }
+        self.version = hashlib.blake2b(encode_json(catalog), digest_size=16).hexdigest()
+        body = encode_json(dict(catalog, success=True, version=self.version)) + b'\n'
+        self._responses[('catalog', None)] = (body, self.version)
+    
+    def _add(self, kind, key, items, payload):
+        body = encode_json(dict(payload, success=True)) + b'\n'
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self._responses[(kind, key)] = (body, etag)
+        self._fragments[(kind, key)] = encode_json(items)
+    
+    def response(self, kind, key):
+        """(body, etag) of a catalog endpoint, or None for an unknown key"""
+        return self._responses.get((kind, key))
+    
+    def fragment(self, kind, key, default):
+        """Encoded recommendation list for key, falling back to default's"""
+        fragment = self._fragments.get((kind, key))
+        if fragment is None:
+            fragment = self._fragments[(kind, default)]
+        return fragment
+
+
+def parse_hex_color(color):
+    """[r, g, b] of a '#rrggbb' colour; raises ValueError otherwise"""
+    color = str(color).lstrip('#')
+    if len(color) != 6:
+        raise ValueError(f"Invalid colour: {color}")
+    return [int(color[i:i + 2], 16) for i in (0, 2, 4)]
+
+
+def rgb_to_lab(colors):
+    """CIELAB (D65) of 0-255 sRGB colours, as an (N, 3) float32 array"""
+    colors = np.asarray(colors, dtype=np.float32).reshape(-1, 1, 3) / 255
+    return cv2.cvtColor(colors, cv2.COLOR_RGB2LAB).reshape(-1, 3)
+
+
+class ShadeIndex:
+    """
+    Lipstick shades in CIELAB for nearest-neighbour matching
+    Every shade's hex colour is converted once when the catalog loads and
+    kept in one float32 array with its squared norms, so ranking all
+    shades by ΔE (CIE76) against a batch of targets is one matrix product
+    and a partial sort. The target for a skin colour is interpolated by
+    brightness between the mean colours of the per-tone lists, so it
+    moves smoothly across bucket edges, then shifted by undertone.
+    Read-only once built.
+    """
+    
+    def __init__(self, lipsticks):
+        self.shades = []
+        seen = set()
+        for items in lipsticks.values():
+            for item in items:
+                key = (item['name'], item['brand'], item['color'])
+                if key not in seen:
+                    seen.add(key)
+                    self.shades.append(item)
+        self.lab = rgb_to_lab([parse_hex_color(item['color']) for item in self.shades])
+        self._norms = np.einsum('ij,ij->i', self.lab, self.lab)
+        
+        anchors = sorted((SKIN_TONE_BRIGHTNESS[tone], tone) for tone in lipsticks
+                         if tone in SKIN_TONE_BRIGHTNESS and lipsticks[tone])
+        self._anchor_brightness = np.array([brightness for brightness, _ in anchors])
+        self._anchor_lab = np.array([
+            rgb_to_lab([parse_hex_color(item['color']) for item in lipsticks[tone]]).mean(axis=0)
+            for _, tone in anchors
+        ])
+    
+    def targets(self, skin_rgb):
+        """Target shade Lab and undertone (-1 cool to 1 warm) for (N, 3) skin colours"""
+        skin_rgb = np.asarray(skin_rgb, dtype=np.float32).reshape(-1, 3)
+        brightness = skin_rgb.mean(axis=1)
+        target = np.stack([
+            np.interp(brightness, self._anchor_brightness, self._anchor_lab[:, c]) for c in range(3)
+        ], axis=1)
+        
+        skin_lab = rgb_to_lab(skin_rgb)
+        hue = np.degrees(np.arctan2(skin_lab[:, 2], skin_lab[:, 1]))
+        undertone = np.clip((hue - UNDERTONE_NEUTRAL_HUE) / UNDERTONE_HUE_RANGE, -1, 1)
+        target[:, 2] += UNDERTONE_SHIFT * undertone
+        return target.astype(np.float32), undertone
+    
+    def nearest(self, targets, k):
+        """Indices and ΔE of the k shades closest to each (M, 3) Lab target, nearest first"""
+        targets = np.asarray(targets, dtype=np.float32).reshape(-1, 3)
+        k = min(k, len(self.shades))
+        # |s - t|² = |s|² - 2 s·t + |t|² for every target/shade pair at once
+        distances = self._norms[None, :] - 2 * (targets @ self.lab.T)
+        distances += np.einsum('ij,ij->i', targets, targets)[:, None]
+        if k < len(self.shades):
+            candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(k), (len(targets), k))
+        order = np.take_along_axis(distances, candidates, axis=1).argsort(axis=1)
+        indices = np.take_along_axis(candidates, order, axis=1)
+        delta_e = np.sqrt(np.maximum(np.take_along_axis(distances, indices, axis=1), 0))
+        return indices, delta_e
+    
+    def match(self, skin_rgb, k=LIPSTICK_MATCHES):
+        """
+        Best k shades for each of (N, 3) skin colours, in one query
+        Returns one list per colour of catalog entries with their ΔE from
+        the target added, and the undertone label of each colour.
+        """
+        targets, undertone = self.targets(skin_rgb)
+        indices, delta_e = self.nearest(targets, k)
+        matches = [
+            [dict(self.shades[i], deltaE=round(float(d), 1)) for i, d in zip(row, distances)]
+            for row, distances in zip(indices, delta_e)
+        ]
+        labels = ['Warm' if u > 1 / 3 else 'Cool' if u < -1 / 3 else 'Neutral' for u in undertone]
+        return matches, labels
+
+
+def parse_price(price):
+    """Numeric value of a display price such as '₹1,750'"""
+    digits = ''.join(ch for ch in str(price) if ch.isdigit() or ch == '.')
+    return float(digits) if digits else None
+
+
+class ProductCatalog:
+    """
+    Product catalog loaded from CATALOG_PATH into an indexed SQLite table
+    Prices are parsed to numbers once at load time. The file is re-read
+    when its modification time changes, checked at most every
+    CATALOG_RELOAD_INTERVAL seconds, and the new table and pre-encoded
+    CatalogIndex replace the old ones in a single swap, so every gunicorn
+    worker picks up edits without a restart.
+    """
+    
+    def __init__(self, path=CATALOG_PATH, reload_interval=CATALOG_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._mtime = None
+        self._db = None
+        self._products = {}
+        self._index = None
+        self._shades = None
+        self._load()
+    
+    @property
+    def index(self):
+        """CatalogIndex of the current catalog version"""
+        self._maybe_reload()
+        return self._index
+    
+    @property
+    def shades(self):
+        """ShadeIndex of the current lipstick catalog"""
+        self._maybe_reload()
+        return self._shades
+    
+    def products_for(self, skin_type):
+        """Catalog list for skin_type, falling back to the Normal list"""
+        self._maybe_reload()
+        products = self._products
+        return products.get(skin_type, products['Normal'])
+    
+    def query(self, skin_type, category=None, brand=None, min_price=None, max_price=None,
+              min_rating=None, sort=None, page=1, per_page=CATALOG_PAGE_SIZE):
+        """
+        Filtered, sorted and paginated products for a skin type
+        Returns (products, total matching); per_page None returns every
+        match. Unknown skin types query the Normal list, like the
+        unfiltered endpoint.
+        """
+        self._maybe_reload()
+        if sort is not None and sort not in PRODUCT_SORTS:
+            raise ValueError(f"Unknown sort: {sort}")
+        
+        with self._lock:
+            db = self._db
+            if skin_type not in self._products:
+                skin_type = 'Normal'
+            
+            clauses = ['skin_type = ?']
+            params = [skin_type]
+            if category:
+                clauses.append('category = ? COLLATE NOCASE')
+                params.append(category)
+            if brand:
+                clauses.append('brand = ? COLLATE NOCASE')
+                params.append(brand)
+            if min_price is not None:
+                clauses.append('price_value >= ?')
+                params.append(min_price)
+            if max_price is not None:
+                clauses.append('price_value <= ?')
+                params.append(max_price)
+            if min_rating is not None:
+                clauses.append('rating >= ?')
+                params.append(min_rating)
+            where = ' AND '.join(clauses)
+            
+            total = db.execute(f'SELECT COUNT(*) FROM products WHERE {where}', params).fetchone()[0]
+            rows = db.execute(
+                f'SELECT {", ".join(PRODUCT_FIELDS)} FROM products WHERE {where} '
+                f'ORDER BY {PRODUCT_SORTS.get(sort, "position")} LIMIT ? OFFSET ?',
+                # SQLite reads a negative LIMIT as no limit
+                params + ([-1, 0] if per_page is None else [per_page, (page - 1) * per_page])
+            ).fetchall()
+        
+        return [dict(zip(PRODUCT_FIELDS, row)) for row in rows], total
+    
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < self.reload_interval:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            try:
+                self._load()
+            except (OSError, ValueError, KeyError):
+                # Keep serving the last good catalog while the file is mid-edit
+                pass
+    
+    def _load(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, encoding='utf-8') as f:
+            products = freeze(json.load(f))
+        if 'Normal' not in products:
+            raise KeyError('Catalog needs a Normal product list')
+        
+        db = sqlite3.connect(':memory:', check_same_thread=False)
+        db.execute(
+            'CREATE TABLE products (position INTEGER, skin_type TEXT, name TEXT, brand TEXT, '
+            'price TEXT, price_value REAL, rating REAL, reviews TEXT, url TEXT, category TEXT)'
+        )
+        db.executemany(
+            'INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [
+                (position, skin_type, item['name'], item['brand'], item['price'],
+                 parse_price(item['price']), item['rating'], item['reviews'], item['url'],
+                 item['category'])
+                for skin_type, items in products.items()
+                for position, item in enumerate(items)
+            ]
+        )
+        for column in ('category', 'brand', 'price_value', 'rating'):
+            db.execute(f'CREATE INDEX products_{column} ON products (skin_type, {column})')
+        db.commit()
+        
+        index = CatalogIndex(products, LIPSTICK_RECOMMENDATIONS, STYLE_RECOMMENDATIONS, SKINCARE_TIPS)
+        shades = ShadeIndex(LIPSTICK_RECOMMENDATIONS)
+        with self._lock:
+            self._db, self._products, self._index, self._shades, self._mtime = (
+                db, products, index, shades, mtime
+            )
+
+
+# Result cache limits; DERMAI_CACHE_MAX_ENTRIES=0 disables caching
+CACHE_MAX_ENTRIES = int(os.environ.get('DERMAI_CACHE_MAX_ENTRIES', '256'))
+CACHE_MAX_BYTES = int(os.environ.get('DERMAI_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.environ.get('DERMAI_CACHE_TTL', '3600'))
+# Optional SQLite file shared by every worker on the host
+CACHE_DB_PATH = os.environ.get('DERMAI_CACHE_DB', '')
+CACHE_DB_MAX_ENTRIES = int(os.environ.get('DERMAI_CACHE_DB_MAX_ENTRIES', '10000'))
+
+
+class AnalysisCache:
+    """
+    Two-tier cache of analysis results keyed by SkinAnalyzer.fingerprint
+    An in-process LRU bounded by entry count, total payload bytes and TTL,
+    backed by an optional SQLite file so gunicorn workers share hits.
+    Results are stored JSON-encoded, so callers always get a fresh copy.
+    """
+    
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES,
+                 ttl=CACHE_TTL_SECONDS, db_path=CACHE_DB_PATH,
+                 db_max_entries=CACHE_DB_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.db_max_entries = db_max_entries
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0
+        }
+        
+        self._db = None
+        if db_path and max_entries > 0:
+            self._db = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS analysis_cache '
+                '(key TEXT PRIMARY KEY, expires REAL NOT NULL, payload BLOB NOT NULL)'
+            )
+            self._db.execute(
+                'CREATE INDEX IF NOT EXISTS analysis_cache_expires ON analysis_cache (expires)'
+            )
+            self._db.commit()
+    
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+    
+    def get(self, key):
+        """Return cached results for key, or None"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, payload = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    self._counters['memory_hits'] += 1
+                    return json.loads(payload)
+                self._discard(key)
+                self._counters['expirations'] += 1
+            
+            if self._db is not None:
+                row = self._db.execute(
+                    'SELECT expires, payload FROM analysis_cache WHERE key = ? AND expires > ?',
+                    (key, now)
+                ).fetchone()
+                if row is not None:
+                    # Promote the shared hit into this worker's LRU
+                    self._insert(key, row[0], row[1])
+                    self._counters['hits'] += 1
+                    self._counters['disk_hits'] += 1
+                    return json.loads(row[1])
+            
+            self._counters['misses'] += 1
+            return None
+    
+    def put(self, key, results):
+        """Store results under key"""
+        if not self.enabled:
+            return
+        payload = json.dumps(results).encode('utf-8')
+        expires = time.time() + self.ttl
+        
+        with self._lock:
+            self._insert(key, expires, payload)
+            
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO analysis_cache (key, expires, payload) VALUES (?, ?, ?)',
+                    (key, expires, payload)
+                )
+                # Drop expired rows, then the soonest-expiring beyond the cap
+                self._db.execute('DELETE FROM analysis_cache WHERE expires <= ?', (time.time(),))
+                self._db.execute(
+                    'DELETE FROM analysis_cache WHERE key IN ('
+                    'SELECT key FROM analysis_cache ORDER BY expires DESC LIMIT -1 OFFSET ?)',
+                    (self.db_max_entries,)
+                )
+                self._db.commit()
+    
+    def stats(self):
+        """Counters and current size of the in-process tier"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        stats['enabled'] = self.enabled
+        stats['shared'] = self._db is not None
+        return stats
+    
+    def _insert(self, key, expires, payload):
+        if len(payload) > self.max_bytes:
+            return
+        self._discard(key)
+        self._entries[key] = (expires, payload)
+        self._bytes += len(payload)
+        
+        # Evict least recently used entries until within both limits
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._counters['evictions'] += 1
+    
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+
+# Where analyze_image runs: 'inline' in the request thread or 'process' in a warm pool
+ANALYSIS_EXECUTOR = os.environ.get('DERMAI_EXECUTOR', 'inline')
+ANALYSIS_WORKERS = int(os.environ.get('DERMAI_EXECUTOR_WORKERS', str(os.cpu_count() or 1)))
+# Jobs admitted at once (running plus queued) before new requests get a 503
+ANALYSIS_QUEUE_SIZE = int(os.environ.get('DERMAI_EXECUTOR_QUEUE', str(2 * ANALYSIS_WORKERS)))
+ANALYSIS_TIMEOUT = float(os.environ.get('DERMAI_ANALYSIS_TIMEOUT', '30'))
+RETRY_AFTER_SECONDS = int(os.environ.get('DERMAI_RETRY_AFTER', '2'))
+
+
+class ExecutorSaturated(Exception):
+    """Raised when the analysis queue is full"""
+
+
+class AnalysisTimeout(Exception):
+    """Raised when an analysis job exceeds its time limit"""
+
+
+def _warm_analysis_worker():
+    """Run a tiny frame through the pipeline so the first real job is not cold"""
+    analyzer.analyze_image(np.full((64, 64, 3), 180, dtype=np.uint8))
+    # Let the inference runtime size its buffers for a full micro-batch
+    classifier = analyzer.skin_type_classifier
+    if classifier is not None:
+        width, height = classifier.model.size
+        classifier.predict(np.zeros((classifier.max_batch, height, width, 3), dtype=np.uint8))
+
+
+def _analyze_shared_frame(name, shape, dtype, hydration_mode=None):
+    """
+    Pool entry point: analyze a frame the parent placed in shared memory
+    Returns the results and the stage timings.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    image = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    try:
+        timings = {}
+        return analyzer.analyze_image(image, timings=timings, hydration_mode=hydration_mode), timings
+    finally:
+        # Drop the view before unmapping the buffer it points into
+        del image
+        shm.close()
+
+
+class AnalysisExecutor:
+    """
+    Runs SkinAnalyzer.analyze_image inline or on a warm process pool
+    In process mode the decoded frame is copied once into shared memory and
+    the worker maps it instead of unpickling it. Both modes admit at most
+    queue_size jobs at a time and raise ExecutorSaturated beyond that; in
+    process mode jobs that exceed timeout raise AnalysisTimeout.
+    """
+    
+    def __init__(self, mode=ANALYSIS_EXECUTOR, workers=ANALYSIS_WORKERS,
+                 queue_size=ANALYSIS_QUEUE_SIZE, timeout=ANALYSIS_TIMEOUT):
+        if mode not in ('inline', 'process'):
+            raise ValueError(f"Unknown executor mode: {mode}")
+        self.mode = mode
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+    
+    def start(self):
+        """
+        Start and warm the worker processes, returning the pool
+        A no-op once they are running; returns None in inline mode.
+        """
+        if self.mode != 'process':
+            return None
+        warmups = []
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                warmups = [self._pool.submit(_warm_analysis_worker) for _ in range(self.workers)]
+            pool = self._pool
+        try:
+            for future in warmups:
+                future.result()
+        except BrokenProcessPool:
+            self._discard(pool)
+            raise
+        return pool
+    
+    def shutdown(self):
+        """Stop the worker processes; a later run() starts a fresh pool"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+    
+    def _discard(self, pool):
+        """Drop a broken pool so the next request starts a fresh one"""
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+    
+    @contextmanager
+    def slot(self):
+        """
+        Hold one admission slot for work run in the calling thread
+        Used by burst and batch analysis, which work through frames as they
+        are decoded and so cannot be shipped to a worker as one frame.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise ExecutorSaturated('Analysis queue is full')
+        try:
+            yield
+        finally:
+            self._slots.release()
+    
+    def run(self, image, timings=None, hydration_mode=None):
+        """
+        Analyze a decoded RGB frame, returning the results dict
+        Stage durations are added to timings if given.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise ExecutorSaturated('Analysis queue is full')
+        
+        if self.mode == 'inline':
+            try:
+                return analyzer.analyze_image(image, timings=timings, hydration_mode=hydration_mode)
+            finally:
+                self._slots.release()
+        
+        pool = shm = None
+        try:
+            pool = self.start()
+            image = np.ascontiguousarray(image)
+            shm = shared_memory.SharedMemory(create=True, size=max(1, image.nbytes))
+            np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[...] = image
+            future = pool.submit(
+                _analyze_shared_frame, shm.name, image.shape, image.dtype.str, hydration_mode
+            )
+        except BaseException as e:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            self._slots.release()
+            if isinstance(e, BrokenProcessPool) and pool is not None:
+                self._discard(pool)
+            raise
+        
+        # The slot and the frame are released only once the worker is done,
+        # so a timed-out job still counts against the queue while it runs
+        def _release(_):
+            shm.close()
+            shm.unlink()
+            self._slots.release()
+        future.add_done_callback(_release)
+        
+        try:
+            results, worker_timings = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise AnalysisTimeout(f'Analysis exceeded {self.timeout:g}s')
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next request
+            self._discard(pool)
+            raise
+        
+        if timings is not None:
+            timings.update(worker_timings)
+        return results
+    
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'workers': self.workers if self.mode == 'process' else 0,
+            'queueSize': self.queue_size,
+            'timeout': self.timeout
+        }
+
+
+# Background analysis jobs
+JOB_WORKERS = int(os.environ.get('DERMAI_JOB_WORKERS', '2'))
+JOB_QUEUE_SIZE = int(os.environ.get('DERMAI_JOB_QUEUE', '32'))
+# Seconds a job and its result are kept after submission
+JOB_TTL_SECONDS = float(os.environ.get('DERMAI_JOB_TTL', '600'))
+# Seconds between keep-alive comments on an idle event stream
+JOB_EVENT_HEARTBEAT = 15
+
+ANALYSIS_STAGES = ('decode', 'tone', 'type', 'hydration', 'barrier', 'quality')
+
+
+class AnalysisJobs:
+    """
+    In-process job queue for asynchronous analysis
+    Submitted uploads wait on a bounded queue for one of the worker threads.
+    Every status or stage change bumps the job version and wakes anyone
+    waiting on it, which is what the event stream is built on. Jobs are
+    dropped JOB_TTL_SECONDS after submission.
+    """
+    
+    def __init__(self, workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE, ttl=JOB_TTL_SECONDS):
+        self.workers = workers
+        self.ttl = ttl
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._jobs = {}
+        self._changed = threading.Condition()
+        self._threads = []
+    
+    def submit(self, image_data, hydration_mode=None, user_id=None):
+        """Queue an upload for analysis and return its job id"""
+        self._start()
+        self._expire()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {
+            'id': job_id,
+            'status': 'queued',
+            'stage': None,
+            'version': 0,
+            'createdAt': now,
+            'expiresAt': now + self.ttl,
+            'result': None,
+            'error': None
+        }
+        with self._changed:
+            self._jobs[job_id] = job
+        try:
+            self._queue.put_nowait((job_id, image_data, hydration_mode, user_id))
+        except queue.Full:
+            with self._changed:
+                del self._jobs[job_id]
+            raise ExecutorSaturated('Analysis job queue is full')
+        return job_id
+    
+    def get(self, job_id):
+        """Public view of a job, or None if unknown or expired"""
+        return self.snapshot(job_id)[1]
+    
+    def snapshot(self, job_id):
+        """(version, view) of a job; view is None if unknown or expired"""
+        self._expire()
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None, None
+            return job['version'], self._view(job)
+    
+    def wait(self, job_id, version, timeout):
+        """
+        Block until the job moves past version or timeout elapses
+        Returns (version, view); view is None once the job has expired.
+        """
+        with self._changed:
+            self._changed.wait_for(
+                lambda: self._jobs.get(job_id, {'version': version + 1})['version'] != version,
+                timeout=timeout
+            )
+            job = self._jobs.get(job_id)
+            if job is None:
+                return version, None
+            return job['version'], self._view(job)
+    
+    def _view(self, job):
+        view = {
+            'id': job['id'],
+            'status': job['status'],
+            'stage': job['stage'],
+            'createdAt': job['createdAt'],
+            'expiresAt': job['expiresAt']
+        }
+        if job['stage'] in ANALYSIS_STAGES:
+            view['progress'] = ANALYSIS_STAGES.index(job['stage']) / len(ANALYSIS_STAGES)
+        if job['status'] == 'done':
+            view['progress'] = 1.0
+            view['result'] = job['result']
+        elif job['status'] == 'failed':
+            view['error'] = job['error']
+        return view
+    
+    def _update(self, job_id, **changes):
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(changes)
+            job['version'] += 1
+            self._changed.notify_all()
+    
+    def _expire(self):
+        now = time.time()
+        with self._changed:
+            expired = [job_id for job_id, job in self._jobs.items() if job['expiresAt'] <= now]
+            for job_id in expired:
+                del self._jobs[job_id]
+            if expired:
+                self._changed.notify_all()
+    
+    def _start(self):
+        if self._threads:
+            return
+        with self._changed:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(
+                    target=self._work, name=f'analysis-job-{index}', daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+    
+    def _work(self):
+        while True:
+            job_id, image_data, hydration_mode, user_id = self._queue.get()
+            try:
+                self._run(job_id, image_data, hydration_mode, user_id)
+            finally:
+                self._queue.task_done()
+    
+    def _run(self, job_id, image_data, hydration_mode=None, user_id=None):
+        try:
+            self._update(job_id, status='running', stage='decode')
+            image = analyzer.decode_image(image_data)
+            del image_data
+            
+            key = analyzer.fingerprint(image, hydration_mode)
+            results = analysis_cache.get(key)
+            if results is None:
+                results = analyzer.analyze_image(
+                    image, progress=lambda stage: self._update(job_id, stage=stage),
+                    hydration_mode=hydration_mode
+                )
+                analysis_cache.put(key, results)
+            if user_id:
+                scan_history.record(user_id, results)
+            add_recommendations(results)
+            
+            self._update(job_id, status='done', stage=None, result=results)
+        except Exception as e:
+            self._update(job_id, status='failed', error=str(e))
+
+
+# Per-user scan history: an SQLite file of compact metric rows (never
+# images) with rolling trends per user; '' disables it
+HISTORY_DB_PATH = os.environ.get('DERMAI_HISTORY_DB', '')
+# Weight of the newest scan in each metric's exponentially weighted mean
+HISTORY_EWMA_ALPHA = float(os.environ.get('DERMAI_HISTORY_EWMA_ALPHA', '0.3'))
+# Recorded scans are written in one transaction once this many are waiting,
+# or HISTORY_FLUSH_INTERVAL seconds after the first; beyond
+# HISTORY_QUEUE_SIZE unwritten scans new ones are dropped
+HISTORY_BATCH_SIZE = int(os.environ.get('DERMAI_HISTORY_BATCH_SIZE', '64'))
+HISTORY_FLUSH_INTERVAL = float(os.environ.get('DERMAI_HISTORY_FLUSH_INTERVAL', '1'))
+HISTORY_QUEUE_SIZE = int(os.environ.get('DERMAI_HISTORY_QUEUE', '10000'))
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 200
+
+# Tracked metrics: result key -> scans column
+HISTORY_METRICS = {
+    'hydration': 'hydration',
+    'barrierScore': 'barrier_score',
+    'photoClarity': 'photo_clarity'
 }
 
+# Opaque client-chosen user ids, e.g. a random id kept by the app
+USER_ID_PATTERN = re.compile(r'[A-Za-z0-9_.:-]{1,64}')
+
+SECONDS_PER_DAY = 24 * 3600
+SECONDS_PER_WEEK = 7 * SECONDS_PER_DAY
+
+
+def history_week(timestamp):
+    """Index of the Monday-to-Sunday UTC week containing a Unix timestamp"""
+    # 1970-01-01 was a Thursday; shift so weeks start on Monday
+    return int((timestamp + 3 * SECONDS_PER_DAY) // SECONDS_PER_WEEK)
+
+
+def history_week_start(week):
+    """ISO date of the Monday starting a history_week index"""
+    timestamp = week * SECONDS_PER_WEEK - 3 * SECONDS_PER_DAY
+    return datetime.fromtimestamp(timestamp, timezone.utc).date().isoformat()
+
+
+class ScanHistory:
+    """
+    Per-user history of analysis metrics with incrementally kept trends
+    record() only queues a compact row; a writer thread stores queued rows
+    in one transaction and folds each into the user's running aggregates
+    (count, latest, EWMA, min, max and the means of the latest two weeks
+    with scans), so reading trends never scans history. Aggregates are
+    updated under BEGIN IMMEDIATE, so gunicorn workers can share the file.
+    Reads flush this worker's queue first; other workers' scans show up
+    within HISTORY_FLUSH_INTERVAL.
+    """
+    
+    def __init__(self, db_path=HISTORY_DB_PATH, alpha=HISTORY_EWMA_ALPHA,
+                 batch_size=HISTORY_BATCH_SIZE, flush_interval=HISTORY_FLUSH_INTERVAL,
+                 queue_size=HISTORY_QUEUE_SIZE):
+        self.db_path = db_path
+        self.alpha = alpha
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self._pending = []
+        self._wake = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._db = None
+        self._pid = None
+        self._writer_pid = None
+        self._counters = {'recorded': 0, 'written': 0, 'batches': 0, 'dropped': 0, 'failed': 0}
+    
+    @property
+    def enabled(self):
+        return bool(self.db_path)
+    
+    def record(self, user_id, results, scanned_at=None):
+        """Queue one analysis result for user_id; never blocks on the database"""
+        if not self.enabled:
+            return
+        row = (
+            user_id,
+            time.time() if scanned_at is None else scanned_at,
+            results['skinType'],
+            results['skinTone']['name'],
+            *(results[key] for key in HISTORY_METRICS)
+        )
+        self._ensure_writer()
+        with self._wake:
+            if len(self._pending) >= self.queue_size:
+                self._counters['dropped'] += 1
+                return
+            self._pending.append(row)
+            self._counters['recorded'] += 1
+            if len(self._pending) >= self.batch_size:
+                self._wake.notify()
+    
+    def flush(self):
+        """Write every queued row now"""
+        with self._write_lock:
+            with self._wake:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return
+            try:
+                self._write(rows)
+            except sqlite3.Error:
+                self._counters['failed'] += len(rows)
+                raise
+            self._counters['written'] += len(rows)
+            self._counters['batches'] += 1
+    
+    def trends(self, user_id):
+        """Scan count, latest skin type and tone, and per-metric trends; None if no scans"""
+        self.flush()
+        with self._write_lock:
+            db = self._connection()
+            user = db.execute(
+                'SELECT scans, first_at, last_at, skin_type, skin_tone FROM users WHERE user_id = ?',
+                (user_id,)
+            ).fetchone()
+            if user is None:
+                return None
+            rows = db.execute(
+                'SELECT metric, scans, latest, ewma, minimum, maximum, week, week_sum, week_count, '
+                'previous_week, previous_mean FROM user_trends WHERE user_id = ?',
+                (user_id,)
+            ).fetchall()
+        
+        metrics = {}
+        for (metric, scans, latest, ewma, minimum, maximum, week, week_sum, week_count,
+             previous_week, previous_mean) in rows:
+            week_mean = week_sum / week_count
+            metrics[metric] = {
+                'latest': latest,
+                'ewma': round(ewma, 2),
+                'min': minimum,
+                'max': maximum,
+                'scans': scans,
+                'latestWeek': {
+                    'start': history_week_start(week),
+                    'mean': round(week_mean, 2),
+                    'scans': week_count
+                },
+                'previousWeek': None if previous_week is None else {
+                    'start': history_week_start(previous_week),
+                    'mean': round(previous_mean, 2)
+                },
+                'weekOverWeek': None if previous_week is None else round(week_mean - previous_mean, 2)
+            }
+        
+        scans, first_at, last_at, skin_type, skin_tone = user
+        return {
+            'scans': scans,
+            'firstScanAt': first_at,
+            'lastScanAt': last_at,
+            'skinType': skin_type,
+            'skinTone': skin_tone,
+            'metrics': metrics
+        }
+    
+    def scans(self, user_id, limit=HISTORY_PAGE_SIZE, before=None):
+        """The user's newest scans, optionally only those before a timestamp"""
+        self.flush()
+        columns = ', '.join(HISTORY_METRICS.values())
+        with self._write_lock:
+            rows = self._connection().execute(
+                f'SELECT scanned_at, skin_type, skin_tone, {columns} FROM scans '
+                'WHERE user_id = ? AND scanned_at < ? ORDER BY scanned_at DESC LIMIT ?',
+                (user_id, float('inf') if before is None else before, limit)
+            ).fetchall()
+        return [
+            {
+                'scannedAt': scanned_at,
+                'skinType': skin_type,
+                'skinTone': skin_tone,
+                **dict(zip(HISTORY_METRICS, values))
+            }
+            for scanned_at, skin_type, skin_tone, *values in rows
+        ]
+    
+    def stats(self):
+        """Write counters and queue depth for this worker"""
+        with self._wake:
+            stats = dict(self._counters)
+            stats['queued'] = len(self._pending)
+        stats['enabled'] = self.enabled
+        return stats
+    
+    def fold(self, state, value, scanned_at):
+        """Aggregate state for a metric after one more scan; state is None for the first"""
+        week = history_week(scanned_at)
+        if state is None:
+            return {
+                'scans': 1, 'latest': value, 'ewma': float(value), 'minimum': value,
+                'maximum': value, 'week': week, 'week_sum': float(value), 'week_count': 1,
+                'previous_week': None, 'previous_mean': None
+            }
+        state = dict(state)
+        # Scans from other workers can land slightly out of order; one from
+        # an earlier week is counted in the latest week
+        if week > state['week']:
+            state['previous_week'] = state['week']
+            state['previous_mean'] = state['week_sum'] / state['week_count']
+            state['week'], state['week_sum'], state['week_count'] = week, 0.0, 0
+        state['week_sum'] += value
+        state['week_count'] += 1
+        state['scans'] += 1
+        state['latest'] = value
+        state['ewma'] += self.alpha * (value - state['ewma'])
+        state['minimum'] = min(state['minimum'], value)
+        state['maximum'] = max(state['maximum'], value)
+        return state
+    
+    def _write(self, rows):
+        db = self._connection()
+        fields = ('scans', 'latest', 'ewma', 'minimum', 'maximum', 'week', 'week_sum',
+                  'week_count', 'previous_week', 'previous_mean')
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.executemany(
+                f'INSERT INTO scans (user_id, scanned_at, skin_type, skin_tone, '
+                f'{", ".join(HISTORY_METRICS.values())}) VALUES ({", ".join("?" * (4 + len(HISTORY_METRICS)))})',
+                rows
+            )
+            
+            # Fold the batch into each user's aggregates, read once per user
+            states = {}
+            users = {}
+            for user_id, scanned_at, skin_type, skin_tone, *values in rows:
+                if user_id not in users:
+                    for metric, *state in db.execute(
+                        f'SELECT metric, {", ".join(fields)} FROM user_trends WHERE user_id = ?',
+                        (user_id,)
+                    ):
+                        states[user_id, metric] = dict(zip(fields, state))
+                    users[user_id] = [0, scanned_at, scanned_at, skin_type, skin_tone]
+                user = users[user_id]
+                user[0] += 1
+                user[1] = min(user[1], scanned_at)
+                if scanned_at >= user[2]:
+                    user[2:] = [scanned_at, skin_type, skin_tone]
+                for metric, value in zip(HISTORY_METRICS, values):
+                    states[user_id, metric] = self.fold(states.get((user_id, metric)), value, scanned_at)
+            
+            db.executemany(
+                'INSERT INTO users (user_id, scans, first_at, last_at, skin_type, skin_tone) '
+                'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (user_id) DO UPDATE SET '
+                'scans = scans + excluded.scans, first_at = min(first_at, excluded.first_at), '
+                'skin_type = CASE WHEN excluded.last_at >= last_at THEN excluded.skin_type ELSE skin_type END, '
+                'skin_tone = CASE WHEN excluded.last_at >= last_at THEN excluded.skin_tone ELSE skin_tone END, '
+                'last_at = max(last_at, excluded.last_at)',
+                [(user_id, *user) for user_id, user in users.items()]
+            )
+            db.executemany(
+                f'INSERT OR REPLACE INTO user_trends (user_id, metric, {", ".join(fields)}) '
+                f'VALUES (?, ?, {", ".join("?" * len(fields))})',
+                [(user_id, metric, *(state[field] for field in fields))
+                 for (user_id, metric), state in states.items()]
+            )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+    
+    def _connection(self):
+        # SQLite connections must not cross a fork; each worker opens its own
+        if self._db is None or self._pid != os.getpid():
+            db = sqlite3.connect(self.db_path, timeout=5, isolation_level=None, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS scans (user_id TEXT NOT NULL, scanned_at REAL NOT NULL, '
+                'skin_type TEXT, skin_tone TEXT, '
+                + ', '.join(f'{column} INTEGER' for column in HISTORY_METRICS.values()) + ')'
+            )
+            db.execute('CREATE INDEX IF NOT EXISTS scans_user_time ON scans (user_id, scanned_at)')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, scans INTEGER NOT NULL, '
+                'first_at REAL NOT NULL, last_at REAL NOT NULL, skin_type TEXT, skin_tone TEXT)'
+            )
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS user_trends (user_id TEXT NOT NULL, metric TEXT NOT NULL, '
+                'scans INTEGER NOT NULL, latest NUMERIC, ewma REAL, minimum NUMERIC, maximum NUMERIC, '
+                'week INTEGER, week_sum REAL, week_count INTEGER, previous_week INTEGER, '
+                'previous_mean REAL, PRIMARY KEY (user_id, metric)) WITHOUT ROWID'
+            )
+            self._db, self._pid = db, os.getpid()
+        return self._db
+    
+    def _ensure_writer(self):
+        # Threads do not survive a fork, so each worker process starts its own
+        with self._wake:
+            if self._writer_pid != os.getpid():
+                self._writer_pid = os.getpid()
+                threading.Thread(target=self._work, name='scan-history-writer', daemon=True).start()
+                atexit.register(self.flush)
+    
+    def _work(self):
+        while True:
+            with self._wake:
+                self._wake.wait_for(lambda: self._pending)
+                self._wake.wait_for(lambda: len(self._pending) >= self.batch_size,
+                                    timeout=self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error:
+                # Counted as failed; keep writing later batches
+                pass
+
+
 # Initialize analyzer
 analyzer = SkinAnalyzer()
+analysis_cache = AnalysisCache()
+analysis_executor = AnalysisExecutor()
+analysis_jobs = AnalysisJobs()
+product_catalog = ProductCatalog()
+scan_history = ScanHistory()
+
+# Warm the analyzer in the background at startup (DERMAI_WARMUP=0 to skip)
+WARMUP_ON_START = os.environ.get('DERMAI_WARMUP', '1') != '0'
+
+_warmup_state = {'pid': None, 'ready': False, 'error': None}
+_warmup_lock = threading.Lock()
+
+
+def _warm_up():
+    try:
+        _warm_analysis_worker()
+        analysis_executor.start()
+        _warmup_state['ready'] = True
+        _warmup_state['error'] = None
+    except Exception as e:
+        _warmup_state['error'] = str(e)
+
+
+def ensure_warmup():
+    """
+    Start warming the analyzer in this process if nothing has yet
+    Tracks the pid so a worker forked from a preloaded master before warm-up
+    finished starts its own instead of waiting on a thread it never inherited.
+    """
+    with _warmup_lock:
+        if _warmup_state['pid'] == os.getpid():
+            return
+        _warmup_state['pid'] = os.getpid()
+        if _warmup_state['ready']:
+            return
+        threading.Thread(target=_warm_up, name='analyzer-warmup', daemon=True).start()
+
+
+def is_ready():
+    """True once the analyzer has run a warm-up frame in this process"""
+    ensure_warmup()
+    return _warmup_state['ready']
+
+
+# Pool workers import this module too; only the serving process warms up
+if WARMUP_ON_START and multiprocessing.parent_process() is None:
+    ensure_warmup()
+
+
+def add_recommendations(results, lipsticks=None):
+    """
+    Attach product, lipstick and style recommendations to analysis results
+    lipsticks, if given, are shades already matched to this skin tone.
+    """
+    # Add product recommendations
+    results['products'] = product_catalog.products_for(results['skinType'])
+    
+    # Add lipstick shades matched to the measured skin colour
+    if lipsticks is None:
+        lipsticks = product_catalog.shades.match(results['skinTone']['rgb'])[0][0]
+    results['lipsticks'] = lipsticks
+    
+    # Add style recommendations
+    results['styleRecommendations'] = STYLE_RECOMMENDATIONS.get(
+        results['skinTone']['name'],
+        STYLE_RECOMMENDATIONS['Medium']
+    )
+    
+    return results
+
+
+def analysis_response(results, view=None):
+    """
+    JSON response for analysis results with the recommendations spliced in
+    The per-request part is encoded with placeholders where the catalog
+    sections go; the placeholders are then replaced by the pre-encoded
+    catalog fragments. The bytes are the same as json_response would
+    produce. Lipstick shades are matched to the measured skin colour per
+    request. view is a requested_view() (compact, fields) pair.
+    """
+    compact, fields = view or (False, None)
+    lipsticks = product_catalog.shades.match(results['skinTone']['rgb'])[0][0]
+    if compact:
+        data = compact_results(dict(
+            results, products=product_catalog.products_for(results['skinType']), lipsticks=lipsticks
+        ))
+        return json_response({'success': True, 'data': select_fields(data, fields)})
+    
+    skin_type = results['skinType']
+    skin_tone = results['skinTone']['name']
+    catalog_index = product_catalog.index
+    fragments = {
+        'products': catalog_index.fragment('products', skin_type, 'Normal'),
+        'styleRecommendations': catalog_index.fragment('styleRecommendations', skin_tone, 'Medium')
+    }
+    
+    data = dict(results)
+    data['lipsticks'] = lipsticks
+    for key in fragments:
+        data[key] = '\0' + key
+    data = select_fields(data, fields)
+    body = encode_json({'success': True, 'data': data})
+    for key, fragment in fragments.items():
+        if key in data:
+            body = body.replace(encode_json('\0' + key), fragment, 1)
+    
+    return app.response_class(body + b'\n', mimetype='application/json')
+
+
+def compact_results(data):
+    """A full analysis result cut to COMPACT_FIELDS, with ids for its products and shades"""
+    compact = {key: data[key] for key in COMPACT_FIELDS if key in data}
+    compact['productIds'] = [catalog_id(item) for item in data['products']]
+    compact['lipstickIds'] = [catalog_id(item) for item in data['lipsticks']]
+    compact['catalogVersion'] = product_catalog.index.version
+    return compact
+
+
+def select_fields(data, fields):
+    """data with only the top-level keys in fields, or all of it when fields is None"""
+    if fields is None:
+        return data
+    return {key: value for key, value in data.items() if key in fields}
+
+
+def shaped_results(data, view):
+    """A full analysis result (recommendations included) in the requested view"""
+    compact, fields = view
+    return select_fields(compact_results(data) if compact else data, fields)
+
+
+def catalog_response(body, etag):
+    """Serve a pre-encoded catalog body, answering matching conditional GETs with 304"""
+    # Weak comparison: compressed copies carry the ETag as weak
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={CATALOG_MAX_AGE}'
+    return response
+
+
+def decode_images(sources):
+    """Lazily decode (decoder, source) pairs, yielding the error for bad images"""
+    for decode, source in sources:
+        try:
+            yield decode(source)
+        except Exception as e:
+            yield e
+
+
+def video_frames(path, stride=BURST_VIDEO_STRIDE):
+    """
+    Lazily decode every stride-th frame of a video file as RGB
+    Skipped frames are only grabbed, not converted. A file OpenCV cannot
+    open yields the error instead of frames.
+    """
+    capture = cv2.VideoCapture(path)
+    try:
+        if not capture.isOpened():
+            yield ValueError('Unsupported or corrupt video')
+            return
+        try:
+            check_pixel_budget(int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                               int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        except ImageTooLarge as e:
+            yield e
+            return
+        index = 0
+        while capture.grab():
+            if index % stride == 0:
+                ok, frame = capture.retrieve()
+                yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) if ok else ValueError('Undecodable frame')
+            index += 1
+    finally:
+        capture.release()
+
+
+def animation_frames(fp):
+    """Lazily decode the frames of an animated GIF, WebP or PNG as RGB"""
+    try:
+        image = Image.open(fp)
+        check_pixel_budget(*image.size)
+        for frame in ImageSequence.Iterator(image):
+            yield np.array(frame.convert('RGB'))
+    except Exception as e:
+        yield e
+
+
+@contextmanager
+def burst_frames():
+    """
+    Frame iterator for the burst upload in the current request, or None
+    Videos are spooled to a temporary file for OpenCV, removed on exit;
+    every source is decoded lazily as the analyzer pulls frames.
+    """
+    if request.files:
+        frames = request.files.getlist('frames')
+        if frames:
+            yield decode_images((analyzer.load_image, f.stream) for f in frames)
+            return
+        video = request.files.get('video')
+        if video is None:
+            yield None
+            return
+        if video.mimetype in RAW_IMAGE_MIMETYPES or video.mimetype == 'image/gif':
+            yield animation_frames(video.stream)
+            return
+        stream = video.stream
+    elif request.mimetype.startswith('video/'):
+        stream = request.stream
+    else:
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            raise ValueError('Request body must be a JSON object with a "frames" list')
+        frames = data.get('frames') or []
+        yield decode_images((analyzer.preprocess_image, frame) for frame in frames) if frames else None
+        return
+    
+    with tempfile.NamedTemporaryFile(prefix='dermai-burst-') as clip:
+        shutil.copyfileobj(stream, clip, 1024 * 1024)
+        clip.flush()
+        yield video_frames(clip.name)
+
+@app.before_request
+def limit_upload_size():
+    """Refuse oversized bodies up front, before a route starts reading them"""
+    if request.content_length is not None and request.content_length > MAX_UPLOAD_BYTES:
+        return upload_too_large(None)
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    """JSON 413 for bodies over MAX_UPLOAD_BYTES, naming the limits to retry with"""
+    return jsonify({
+        'success': False,
+        'error': (f'Upload exceeds the {MAX_UPLOAD_BYTES / 2 ** 20:g} MB limit; downscale photos to '
+                  f'{UPLOAD_MAX_SIDE} px per side before uploading (see /api/config)'),
+        'maxBytes': MAX_UPLOAD_BYTES,
+        'maxSide': UPLOAD_MAX_SIDE
+    }), 413
+
+@app.after_request
+def compress_response(response):
+    """
+    Brotli or gzip encode JSON and text bodies for clients that accept it
+    Streams, partial content and bodies under COMPRESS_MIN_BYTES go out
+    as they are. A strong ETag becomes weak, since the bytes differ.
+    """
+    if COMPRESS_MIN_BYTES <= 0 or response.mimetype not in COMPRESS_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if (response.direct_passthrough or response.is_streamed or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or (response.content_length or 0) < COMPRESS_MIN_BYTES):
+        return response
+    
+    encoding = request.accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+@app.route('/', methods=['GET'])
+def home():
+    """Plain-text banner for the service root"""
+    return "DermAI Backend is running successfully!"
+
+@app.route('/api/config', methods=['GET'])
+def client_config():
+    """Upload contract and limits for clients, see UPLOAD_MAX_SIDE"""
+    return jsonify({
+        'upload': {
+            'maxSide': UPLOAD_MAX_SIDE,
+            'formats': list(UPLOAD_FORMATS),
+            'quality': UPLOAD_QUALITY,
+            'maxBytes': MAX_UPLOAD_BYTES
+        },
+        'accepts': list(RAW_IMAGE_MIMETYPES),
+        'maxBatchImages': MAX_BATCH_IMAGES,
+        'hydrationModes': list(HYDRATION_SMOOTHERS),
+        'history': scan_history.enabled
+    })
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -620,63 +3307,558 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'message': 'DermAI Backend is running',
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'ready': is_ready(),
+        'skinTypeModel': analyzer.skin_type_backend(),
+        'history': scan_history.stats()
     })
 
+@app.route('/api/health/live', methods=['GET'])
+def liveness_check():
+    """Liveness probe: answers as soon as the worker is serving requests"""
+    return jsonify({'status': 'alive'})
+
+@app.route('/api/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 503 until the analyzer has been warmed up"""
+    if not is_ready():
+        return jsonify({
+            'status': 'warming',
+            'error': _warmup_state['error']
+        }), 503
+    return jsonify({'status': 'ready'})
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze_skin():
-    """Main skin analysis endpoint"""
+    """
+    Main skin analysis endpoint
+    Accepts a JSON body {"image": data URL}, a raw image/jpeg, image/png or
+    image/webp body, or a multipart upload with an "image" file field.
+    """
     try:
-        data = request.json
+        with request_profiler.sample('analyze'):
+            image_data = read_image_upload()
+            if image_data is None:
+                return jsonify({'error': 'No image provided'}), 400
+            if request.content_length:
+                pipeline_metrics.observe_input(nbytes=request.content_length)
+            
+            hydration_mode = requested_hydration_mode()
+            user_id = requested_user_id()
+            view = requested_view()
+            
+            timings = {}
+            image = analyzer.decode_image(image_data, timings)
+            
+            # Serve repeated uploads of the same photo from the result cache
+            if wants_cache_bypass():
+                cache_status = 'BYPASS'
+                results = analysis_executor.run(image, timings, hydration_mode)
+            else:
+                key = analyzer.fingerprint(image, hydration_mode)
+                results = analysis_cache.get(key)
+                cache_status = 'HIT'
+                if results is None:
+                    cache_status = 'MISS'
+                    # Perform analysis
+                    results = analysis_executor.run(image, timings, hydration_mode)
+                    analysis_cache.put(key, results)
+            
+            if user_id:
+                scan_history.record(user_id, results)
+            response = analysis_response(results, view)
+        if analysis_cache.enabled:
+            response.headers['X-DermAI-Cache'] = cache_status
+        if SERVER_TIMING:
+            response.headers['Server-Timing'] = server_timing(
+                timings, cache_status if analysis_cache.enabled else None
+            )
+        return response
         
-        if 'image' not in data:
-            return jsonify({'error': 'No image provided'}), 400
+    except ExecutorSaturated as e:
+        response = jsonify({
+            'success': False,
+            'error': str(e)
+        })
+        response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+        return response, 503
         
-        # Perform analysis
-        results = analyzer.analyze(data['image'])
+    except ImageTooLarge as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 413
         
-        # Add product recommendations
-        results['products'] = INDIAN_PRODUCTS.get(
-            results['skinType'], 
-            INDIAN_PRODUCTS['Normal']
-        )
+    except AnalysisTimeout as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 504
         
-        # Add lipstick recommendations
-        results['lipsticks'] = LIPSTICK_RECOMMENDATIONS.get(
-            results['skinTone']['name'],
-            LIPSTICK_RECOMMENDATIONS['Medium']
-        )
+    except UnsupportedUpload as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 415
         
-        # Add style recommendations
-        results['styleRecommendations'] = STYLE_RECOMMENDATIONS.get(
-            results['skinTone']['name'],
-            STYLE_RECOMMENDATIONS['Medium']
+    except ValueError as e:
+        # Bad query parameters or JSON bodies; analysis failures raise AnalysisError
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+        
+    except AnalysisError as e:
+        # An upload that does not decode is the client's error, not ours
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400 if e.stage == 'decode' else 500
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def read_image_upload():
+    """
+    Return the uploaded image from the current request, or None
+    Raw image bodies and multipart files come back as binary streams,
+    JSON bodies as the data URL string. Raises UnsupportedUpload for other
+    content types and ValueError for JSON that is not {"image": string}.
+    """
+    if request.mimetype in RAW_IMAGE_MIMETYPES:
+        # Decode straight from the request stream
+        return request.stream
+    if request.mimetype == 'multipart/form-data':
+        if 'image' not in request.files:
+            return None
+        return request.files['image'].stream
+    if not request.is_json:
+        raise UnsupportedUpload(
+            f"Unsupported upload type {request.mimetype or '(none)'}; send a JSON body, "
+            f"a multipart form or one of {', '.join(RAW_IMAGE_MIMETYPES)}"
         )
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ValueError('Request body must be a JSON object with an "image" data URL')
+    image = data.get('image')
+    if image is not None and not isinstance(image, str):
+        raise ValueError('"image" must be a data URL string')
+    return image
+
+def requested_hydration_mode():
+    """
+    Hydration mode from the ?hydration= query parameter, or None for the default
+    Raises ValueError for unknown modes.
+    """
+    mode = request.args.get('hydration')
+    if mode is not None and mode not in HYDRATION_SMOOTHERS:
+        raise ValueError(f"Unknown hydration mode: {mode}")
+    return mode
+
+def requested_view():
+    """
+    (compact, fields) from the ?compact=1 and ?fields=a,b query parameters
+    Raises ValueError for fields no result has.
+    """
+    compact = request.args.get('compact', '0') not in ('0', '', 'false')
+    fields = request.args.get('fields')
+    if fields is None:
+        return compact, None
+    fields = {field.strip() for field in fields.split(',') if field.strip()}
+    unknown = fields - set(RESULT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return compact, fields
+
+def query_number(name, kind=float):
+    """Query parameter name parsed as kind, or None if absent; ValueError if it does not parse"""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return kind(value)
+    except ValueError:
+        raise ValueError(f"{name} must be {'an integer' if kind is int else 'a number'}") from None
+
+def check_user_id(user_id):
+    """Raise ValueError unless user_id matches USER_ID_PATTERN"""
+    if not USER_ID_PATTERN.fullmatch(user_id):
+        raise ValueError('User id must be 1-64 letters, digits or . _ : -')
+    return user_id
+
+def requested_user_id():
+    """
+    User id from the X-DermAI-User header or ?user= parameter, or None
+    Scans with a user id are recorded in the scan history when it is enabled.
+    """
+    user_id = request.headers.get('X-DermAI-User') or request.args.get('user')
+    return check_user_id(user_id) if user_id else None
+
+def wants_cache_bypass():
+    """True when the client asked to skip the result cache"""
+    if request.headers.get('X-DermAI-Cache', '').lower() == 'bypass':
+        return True
+    cache_control = request.headers.get('Cache-Control', '').lower()
+    return 'no-cache' in cache_control or 'no-store' in cache_control
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Result cache hit, miss and eviction counters for this worker"""
+    return jsonify({
+        'success': True,
+        'cache': analysis_cache.stats()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for the analysis pipeline, across all workers"""
+    if not pipeline_metrics.enabled:
+        return jsonify({'error': 'prometheus_client is not installed'}), 501
+    body, content_type = pipeline_metrics.export()
+    return Response(body, content_type=content_type)
+
+def admin_authorized():
+    """True when the request carries the configured admin token"""
+    token = request.headers.get('X-DermAI-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+@app.route('/api/admin/profiling', methods=['GET', 'PUT'])
+def profiling_settings():
+    """
+    Read or change the sampled profiler settings
+    PUT {"sampleRate": 0.01} profiles about 1% of analysis requests. Needs
+    the X-DermAI-Admin-Token header to match DERMAI_ADMIN_TOKEN.
+    """
+    if not admin_authorized():
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    if request.method == 'PUT':
+        data = request.get_json(silent=True)
+        try:
+            request_profiler.set_rate(float(data.get('sampleRate') if isinstance(data, dict) else None))
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({
+        'success': True,
+        'profiling': request_profiler.stats()
+    })
+
+@app.route('/api/analyze/jobs', methods=['POST'])
+def submit_analysis_job():
+    """
+    Queue a skin analysis and return its job id immediately
+    Accepts the same request bodies as /api/analyze. Poll the status URL or
+    follow the events URL for stage progress and the final result.
+    """
+    try:
+        image_data = read_image_upload()
+        if image_data is None:
+            return jsonify({'error': 'No image provided'}), 400
+        if not isinstance(image_data, str):
+            # The request stream closes with the request; keep the bytes
+            image_data = image_data.read()
+        
+        job_id = analysis_jobs.submit(image_data, requested_hydration_mode(), requested_user_id())
+        response = jsonify({
+            'success': True,
+            'jobId': job_id,
+            'status': 'queued',
+            'statusUrl': url_for('get_analysis_job', job_id=job_id),
+            'eventsUrl': url_for('stream_analysis_job', job_id=job_id)
+        })
+        response.headers['Location'] = url_for('get_analysis_job', job_id=job_id)
+        return response, 202
+        
+    except ExecutorSaturated as e:
+        response = jsonify({
+            'success': False,
+            'error': str(e)
+        })
+        response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+        return response, 503
+        
+    except UnsupportedUpload as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 415
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/analyze/jobs/<job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    """Current status of an analysis job, with its result once done"""
+    try:
+        view = requested_view()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown or expired job'}), 404
+    if job.get('result') is not None:
+        job['result'] = shaped_results(job['result'], view)
+    return json_response({
+        'success': True,
+        'job': job
+    })
+
+@app.route('/api/analyze/jobs/<job_id>/events', methods=['GET'])
+def stream_analysis_job(job_id):
+    """
+    Server-sent events for an analysis job
+    Emits a "progress" event on every status or stage change, then a final
+    "result" or "error" event.
+    """
+    version, job = analysis_jobs.snapshot(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown or expired job'}), 404
+    
+    def events():
+        current, view = version, job
+        while view is not None:
+            if view['status'] == 'done':
+                yield f"event: result\ndata: {json.dumps(view)}\n\n"
+                return
+            if view['status'] == 'failed':
+                yield f"event: error\ndata: {json.dumps(view)}\n\n"
+                return
+            yield f"event: progress\ndata: {json.dumps(view)}\n\n"
+            
+            seen = current
+            while view is not None and current == seen:
+                current, view = analysis_jobs.wait(job_id, seen, JOB_EVENT_HEARTBEAT)
+                if view is not None and current == seen:
+                    # Keep idle proxies from closing the stream
+                    yield ': keep-alive\n\n'
+        yield 'event: error\ndata: {"error": "Job expired"}\n\n'
+    
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/analyze/burst', methods=['POST'])
+def analyze_skin_burst():
+    """
+    Burst / video skin analysis endpoint
+    Accepts a multipart upload with a "video" file (a short clip or an
+    animated GIF/WebP) or several "frames" image files, a raw video/* body,
+    or a JSON body {"frames": [data URL, ...]}. Blurry frames are skipped
+    and the rest are folded into one result with a "burst" summary.
+    """
+    try:
+        hydration_mode = requested_hydration_mode()
+        user_id = requested_user_id()
+        view = requested_view()
+        with analysis_executor.slot(), burst_frames() as frames:
+            if frames is None:
+                return jsonify({'error': 'No video or frames provided'}), 400
+            results = analyzer.analyze_burst(frames, hydration_mode)
+        if user_id:
+            scan_history.record(user_id, results)
+        return analysis_response(results, view)
+        
+    except ExecutorSaturated as e:
+        response = jsonify({
+            'success': False,
+            'error': str(e)
+        })
+        response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+        return response, 503
+        
+    except ImageTooLarge as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 413
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+        
+    except AnalysisError as e:
+        # No frame decoded: the upload is the client's error
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400 if e.stage == 'decode' else 500
         
+    except Exception as e:
         return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/analyze/batch', methods=['POST'])
+def analyze_skin_batch():
+    """
+    Batch skin analysis endpoint
+    Accepts a JSON body {"images": [data URL, ...]} or a multipart upload
+    with one or more "images" file fields. A failing image only fails its
+    own entry in the results list.
+    """
+    try:
+        if request.files:
+            files = request.files.getlist('images')
+            sources = [(analyzer.load_image, f.stream) for f in files]
+        else:
+            data = request.get_json(silent=True) or {}
+            if not isinstance(data, dict):
+                raise ValueError('Request body must be a JSON object with an "images" list')
+            sources = [(analyzer.preprocess_image, image) for image in data.get('images') or []]
+        
+        if not sources:
+            return jsonify({'error': 'No images provided'}), 400
+        if len(sources) > MAX_BATCH_IMAGES:
+            return jsonify({'error': f'At most {MAX_BATCH_IMAGES} images per batch'}), 413
+        view = requested_view()
+        
+        with analysis_executor.slot():
+            results = analyzer.analyze_batch(decode_images(sources), requested_hydration_mode())
+        analyzed = [entry for entry in results if entry['success']]
+        if analyzed:
+            # Match lipstick shades for the whole batch in one query
+            matches, _ = product_catalog.shades.match([entry['data']['skinTone']['rgb'] for entry in analyzed])
+            for entry, lipsticks in zip(analyzed, matches):
+                entry['data'] = shaped_results(add_recommendations(entry['data'], lipsticks), view)
+        
+        return json_response({
             'success': True,
-            'data': results
+            'count': len(results),
+            'failed': sum(1 for entry in results if not entry['success']),
+            'results': results
         })
         
+    except ExecutorSaturated as e:
+        response = jsonify({
+            'success': False,
+            'error': str(e)
+        })
+        response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+        return response, 503
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+        
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+@app.route('/api/catalog', methods=['GET'])
+def get_catalog():
+    """
+    The whole recommendation catalog for resolving ?compact=1 results
+    Products and lipstick shades keyed by id, tips by skin type and style
+    recommendations by skin tone; "version" is the ETag.
+    """
+    return catalog_response(*product_catalog.index.response('catalog', None))
+
 @app.route('/api/products/<skin_type>', methods=['GET'])
 def get_products(skin_type):
-    """Get product recommendations for specific skin type"""
-    products = INDIAN_PRODUCTS.get(skin_type, INDIAN_PRODUCTS['Normal'])
-    return jsonify({
+    """
+    Get product recommendations for specific skin type
+    Optional filters: category, brand, min_price, max_price, min_rating;
+    sort is rating (highest first), price or name (ascending), with a
+    leading '-' to reverse the order. page and per_page (or limit)
+    paginate the filtered list and add total, page and perPage to the
+    response. Other parameters are ignored; numbers that do not parse
+    are a 400.
+    """
+    try:
+        filters = {
+            'category': request.args.get('category'),
+            'brand': request.args.get('brand'),
+            'min_price': query_number('min_price'),
+            'max_price': query_number('max_price'),
+            'min_rating': query_number('min_rating'),
+            'sort': request.args.get('sort')
+        }
+        page = query_number('page', int)
+        per_page = query_number('per_page', int)
+        if per_page is None:
+            per_page = query_number('limit', int)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    paginated = page is not None or per_page is not None
+    if not paginated and all(value is None for value in filters.values()):
+        cached = product_catalog.index.response('products', skin_type)
+        if cached is not None:
+            return catalog_response(*cached)
+        
+        products = product_catalog.products_for(skin_type)
+        return jsonify({
+            'success': True,
+            'skinType': skin_type,
+            'products': products
+        })
+    
+    if paginated:
+        page = max(1, page or 1)
+        per_page = min(CATALOG_MAX_PAGE_SIZE, max(1, per_page or CATALOG_PAGE_SIZE))
+    else:
+        page = 1
+    try:
+        products, total = product_catalog.query(skin_type, **filters, page=page, per_page=per_page)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    body = {
         'success': True,
         'skinType': skin_type,
         'products': products
-    })
+    }
+    if paginated:
+        body.update(total=total, page=page, perPage=per_page)
+    return jsonify(body)
 
 @app.route('/api/lipsticks/<skin_tone>', methods=['GET'])
 def get_lipsticks(skin_tone):
-    """Get lipstick recommendations for specific skin tone"""
+    """
+    Get lipstick recommendations for specific skin tone
+    With ?color=rrggbb (a measured skin colour) the shades are instead
+    ranked by ΔE against that colour and its undertone; ?limit= caps them.
+    """
+    if 'color' in request.args:
+        try:
+            skin_rgb = parse_hex_color(request.args['color'])
+            limit = request.args.get('limit', LIPSTICK_MATCHES, type=int)
+            if limit < 1:
+                raise ValueError('limit must be positive')
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        matches, undertones = product_catalog.shades.match(skin_rgb, limit)
+        return jsonify({
+            'success': True,
+            'skinTone': skin_tone,
+            'color': '#{:02x}{:02x}{:02x}'.format(*skin_rgb),
+            'undertone': undertones[0],
+            'lipsticks': matches[0]
+        })
+    
+    cached = product_catalog.index.response('lipsticks', skin_tone)
+    if cached is not None:
+        return catalog_response(*cached)
+    
     lipsticks = LIPSTICK_RECOMMENDATIONS.get(skin_tone, LIPSTICK_RECOMMENDATIONS['Medium'])
     return jsonify({
         'success': True,
@@ -684,6 +3866,49 @@ def get_lipsticks(skin_tone):
         'lipsticks': lipsticks
     })
 
+@app.route('/api/users/<user_id>/trends', methods=['GET'])
+def get_user_trends(user_id):
+    """
+    Rolling trends of a user's recorded scans
+    Per metric: latest value, EWMA, min, max, and the mean of the latest
+    week with scans against the week with scans before it.
+    """
+    if not scan_history.enabled:
+        return jsonify({'success': False, 'error': 'Scan history is disabled'}), 404
+    try:
+        check_user_id(user_id)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    trends = scan_history.trends(user_id)
+    if trends is None:
+        return jsonify({'success': False, 'error': 'No scans recorded for this user'}), 404
+    return jsonify({'success': True, 'userId': user_id, **trends})
+
+@app.route('/api/users/<user_id>/scans', methods=['GET'])
+def get_user_scans(user_id):
+    """
+    A user's recorded scans, newest first
+    ?limit= sets the page size; ?before= (a scannedAt value) continues
+    from the previous page.
+    """
+    if not scan_history.enabled:
+        return jsonify({'success': False, 'error': 'Scan history is disabled'}), 404
+    try:
+        check_user_id(user_id)
+        limit = min(HISTORY_MAX_PAGE_SIZE, max(1, request.args.get('limit', HISTORY_PAGE_SIZE, type=int)))
+        before = request.args.get('before', type=float)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    scans = scan_history.scans(user_id, limit, before)
+    return jsonify({
+        'success': True,
+        'userId': user_id,
+        'scans': scans,
+        'next': scans[-1]['scannedAt'] if len(scans) == limit else None
+    })
+
 if __name__ == '__main__':
     print("🚀 DermAI Backend Server Starting...")
     print("📊 Advanced AI Skin Analysis Engine Ready")
@@ -0,0 +1,188 @@
+"""
+DermAI - Skin-type classifier evaluation
+Scores the threshold rules and each learned model on a labelled fixture
+set: accuracy, single-frame latency, micro-batched throughput under
+concurrent requests, and whole-batch throughput.
+
+    python benchmarks/classifier.py --fixtures DIR model.onnx model.int8.onnx
+    python benchmarks/classifier.py --fixtures DIR --quantize model.onnx
+
+Fixtures are images under DIR/<skin type>/, one folder per label in
+SKIN_TYPE_LABELS. --quantize writes model.int8.onnx next to the model,
+statically quantised to int8 (QDQ) with the fixture images as
+calibration data; set DERMAI_SKIN_TYPE_QUANTIZED=1 to serve it.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+os.environ.setdefault('DERMAI_WARMUP', '0')
+os.environ.setdefault('DERMAI_CACHE_MAX_ENTRIES', '0')
+
+from backend_app import SKIN_TYPE_LABELS, AnalysisContext, SkinAnalyzer, analyzer  # noqa: E402
+
+DEFAULT_FIXTURES = os.path.join(BENCH_DIR, 'fixtures', 'skin_type')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def load_fixtures(directory):
+    """[(label, RGB frame)] for every image under directory/<label>/"""
+    fixtures = []
+    for label in SKIN_TYPE_LABELS:
+        folder = os.path.join(directory, label)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(folder, name), 'rb') as f:
+                    fixtures.append((label, analyzer.load_image(f)))
+    if not fixtures:
+        raise SystemExit(f'no fixtures under {directory}/<{"|".join(SKIN_TYPE_LABELS)}>/')
+    return fixtures
+
+
+def contexts(fixtures):
+    """Fresh analysis contexts with the skin region already located"""
+    result = []
+    for _, frame in fixtures:
+        ctx = AnalysisContext(frame)
+        ctx.roi
+        result.append(ctx)
+    return result
+
+
+def evaluate(name, skin_analyzer, fixtures, concurrency):
+    """Accuracy and timing of one backend"""
+    labels = [label for label, _ in fixtures]
+
+    # Accuracy and per-frame latency, one frame at a time
+    predictions = []
+    latencies = []
+    for ctx in contexts(fixtures):
+        start = time.perf_counter()
+        predictions.append(skin_analyzer.analyze_skin_type(ctx)['type'])
+        latencies.append(time.perf_counter() - start)
+    correct = sum(p == label for p, label in zip(predictions, labels))
+    recall = {
+        label: sum(p == label for p, l in zip(predictions, labels) if l == label) / labels.count(label)
+        for label in SKIN_TYPE_LABELS if label in labels
+    }
+
+    # Throughput with concurrent requests sharing micro-batches
+    classifier = skin_analyzer.skin_type_classifier
+    calls = [0]
+    if classifier is not None:
+        predict = classifier.model.predict
+
+        def counting_predict(frames):
+            calls[0] += 1
+            return predict(frames)
+        classifier.model.predict = counting_predict
+
+    pending = contexts(fixtures) * concurrency
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                ctx = pending.pop()
+            skin_analyzer.analyze_skin_type(ctx)
+
+    total = len(pending)
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    concurrent_throughput = total / (time.perf_counter() - start)
+
+    result = {
+        'backend': name,
+        'accuracy': correct / len(fixtures),
+        'recall': recall,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'concurrent_fps': concurrent_throughput,
+        'mean_batch': total / calls[0] if calls[0] else 1.0,
+    }
+
+    # Whole-batch inference, as analyze_batch does it
+    if classifier is not None:
+        inputs = np.stack([classifier.prepare(ctx) for ctx in contexts(fixtures)])
+        classifier.predict(inputs)
+        start = time.perf_counter()
+        classifier.predict(inputs)
+        result['batch_fps'] = len(inputs) / (time.perf_counter() - start)
+    return result
+
+
+def quantize(model_path, fixtures):
+    """Write <model>.int8.onnx, statically quantised with fixture calibration"""
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    classifier = SkinAnalyzer(skin_type_model=model_path).skin_type_classifier
+    if classifier is None:
+        raise SystemExit(f'cannot load {model_path}')
+    feeds = iter([classifier.model.feed(classifier.prepare(ctx)[None]) for ctx in contexts(fixtures)])
+
+    class FixtureReader(CalibrationDataReader):
+        def get_next(self):
+            return next(feeds, None)
+
+    stem, ext = os.path.splitext(model_path)
+    output = f'{stem}.int8{ext}'
+    # Only the weight-bearing ops are quantised, with per-channel weight
+    # scales; elementwise statistics stay float so narrow-range features
+    # are not rounded away
+    quantize_static(model_path, output, FixtureReader(), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QInt8, weight_type=QuantType.QInt8,
+                    op_types_to_quantize=['Conv', 'Gemm', 'MatMul'], per_channel=True)
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('models', nargs='*', help='.onnx or .tflite model files to compare with the rules')
+    parser.add_argument('--fixtures', default=DEFAULT_FIXTURES, help='labelled fixture directory')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent requests for the throughput run')
+    parser.add_argument('--quantize', metavar='MODEL', help='write an int8 variant of MODEL and exit')
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    print(f'{len(fixtures)} fixtures from {args.fixtures}', file=sys.stderr)
+
+    if args.quantize:
+        print(f'wrote {quantize(args.quantize, fixtures)}')
+        return 0
+
+    backends = [('rules', SkinAnalyzer(skin_type_model=''))]
+    for path in args.models:
+        skin_analyzer = SkinAnalyzer(skin_type_model=path)
+        if skin_analyzer.skin_type_classifier is None:
+            raise SystemExit(f'cannot load {path}: {skin_analyzer.skin_type_model_error}')
+        backends.append((os.path.basename(path), skin_analyzer))
+
+    print(f"{'backend':<24} {'accuracy':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'conc fps':>9} {'batch':>6} {'batch fps':>10}")
+    for name, skin_analyzer in backends:
+        result = evaluate(name, skin_analyzer, fixtures, args.concurrency)
+        batch_fps = f"{result['batch_fps']:>10.1f}" if 'batch_fps' in result else f"{'-':>10}"
+        print(f"{name:<24} {result['accuracy']:>8.3f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+              f"{result['concurrent_fps']:>9.1f} {result['mean_batch']:>6.1f} {batch_fps}")
+        print('    recall ' + ', '.join(f'{label} {value:.2f}' for label, value in result['recall'].items()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
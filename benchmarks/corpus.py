@@ -0,0 +1,120 @@
+"""
+DermAI - Synthetic benchmark corpus
+Deterministic skin-like test images: a lit, textured skin-toned ellipse on
+a darker background, in RGB, grayscale and RGBA, from 0.3 to 48 MP.
+Images are generated in row strips so a 48 MP frame never needs more than
+its own uint8 buffer, and encoded files are cached on disk between runs.
+"""
+
+import os
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# Bump when the generator changes so stale cached files are not reused
+CORPUS_VERSION = 1
+
+# (label, width, height)
+SIZES = (
+    ('0.3mp', 640, 480),
+    ('2mp', 1600, 1200),
+    ('12mp', 4000, 3000),
+    ('48mp', 8000, 6000),
+)
+
+# PIL mode and the container each mode is encoded as
+MODES = {
+    'rgb': ('RGB', 'JPEG'),
+    'gray': ('L', 'PNG'),
+    'rgba': ('RGBA', 'PNG'),
+}
+
+MIMETYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png'}
+
+# Base skin tones, light to deep (RGB)
+SKIN_TONES = np.array([
+    [236, 201, 176],
+    [214, 168, 132],
+    [181, 131, 94],
+    [141, 96, 66],
+    [96, 62, 42],
+], dtype=np.float32)
+
+STRIP_ROWS = 512
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.corpus')
+
+
+def skin_frame(width, height, seed):
+    """
+    Deterministic RGB uint8 frame of a skin-toned face-like region
+    Lighting gradient, low-frequency texture and per-pixel noise over a
+    base tone picked by seed; everything outside the ellipse is darkened.
+    """
+    tone = SKIN_TONES[seed % len(SKIN_TONES)]
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+
+    x = np.arange(width, dtype=np.float32)[None, :]
+    # Texture period scales with the frame so every size looks alike
+    texture_x = np.sin(x / (width / 53.0) + seed)
+    light_x = 0.85 + 0.25 * (x / width)
+    cx, cy = width / 2, height / 2
+    rx, ry = width * 0.36, height * 0.46
+
+    for top in range(0, height, STRIP_ROWS):
+        rows = min(STRIP_ROWS, height - top)
+        y = np.arange(top, top + rows, dtype=np.float32)[:, None]
+        rng = np.random.default_rng([seed, top])
+
+        light = light_x * (1.05 - 0.2 * (y / height))
+        texture = 6.0 * texture_x * np.cos(y / (height / 41.0))
+        strip = tone * light[..., None] + texture[..., None]
+        strip += rng.normal(0, 7, (rows, width, 1)).astype(np.float32)
+        strip += rng.normal(0, 2, (rows, width, 3)).astype(np.float32)
+
+        outside = ((x - cx) / rx) ** 2 + ((y - cy) / ry) ** 2 > 1
+        strip[outside] *= np.float32(0.35)
+        frame[top:top + rows] = np.clip(strip, 0, 255)
+
+    return frame
+
+
+def encode(frame, mode):
+    """Encode an RGB frame in the PIL mode and container for mode"""
+    pil_mode, fmt = MODES[mode]
+    image = Image.fromarray(frame)
+    if pil_mode != 'RGB':
+        image = image.convert(pil_mode)
+    buffer = BytesIO()
+    if fmt == 'JPEG':
+        image.save(buffer, fmt, quality=90)
+    else:
+        image.save(buffer, fmt, compress_level=1)
+    return buffer.getvalue()
+
+
+def corpus(sizes=None, modes=None, cache_dir=CACHE_DIR):
+    """
+    Yield (name, mimetype, encoded bytes) for every size and mode requested
+    sizes and modes filter by label ('12mp', 'rgba', ...); default is all.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    for seed, (size, width, height) in enumerate(SIZES):
+        if sizes and size not in sizes:
+            continue
+        frame = None
+        for mode, (_, fmt) in MODES.items():
+            if modes and mode not in modes:
+                continue
+            name = f'{size}-{mode}'
+            path = os.path.join(cache_dir, f'v{CORPUS_VERSION}-{name}.{fmt.lower()}')
+            if not os.path.exists(path):
+                if frame is None:
+                    frame = skin_frame(width, height, seed)
+                tmp_path = f'{path}.{os.getpid()}'
+                with open(tmp_path, 'wb') as f:
+                    f.write(encode(frame, mode))
+                os.replace(tmp_path, path)
+            with open(path, 'rb') as f:
+                yield name, MIMETYPES[fmt], f.read()
@@ -0,0 +1,265 @@
+"""
+DermAI - Analyzer benchmark
+Times every SkinAnalyzer stage and the full /api/analyze route over the
+synthetic corpus, and checks the analysis output against stored snapshots.
+
+    python benchmarks/run.py                      # run, compare with baseline.json if present
+    python benchmarks/run.py --save-baseline      # run and store the results as the baseline
+    python benchmarks/run.py --sizes 0.3mp,2mp    # quick run on the small images
+    python benchmarks/run.py --update-snapshots   # accept intentional output changes
+
+Each case reports throughput, p50/p99 latency and peak traced memory
+(Python and NumPy allocations, measured on a separate untimed pass).
+Exits 1 when a case is slower or uses more memory than the baseline by
+more than --tolerance, or when any analysis output differs from its
+snapshot. Baselines are machine specific and not committed; snapshots are.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# Benchmark the pipeline itself: no warm-up thread, no result cache
+os.environ.setdefault('DERMAI_WARMUP', '0')
+os.environ.setdefault('DERMAI_CACHE_MAX_ENTRIES', '0')
+
+import cv2  # noqa: E402
+import PIL  # noqa: E402
+
+import backend_app  # noqa: E402
+from backend_app import HYDRATION_SMOOTHERS, AnalysisContext, analyzer, detect_skin_roi  # noqa: E402
+from corpus import corpus  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+SNAPSHOT_PATH = os.path.join(BENCH_DIR, 'snapshots', 'analysis.json')
+
+# Smallest p50 (ms) or peak memory (MB) increase counted as a regression
+MIN_DELTA = 2.0
+
+# Per-stage cases, each run on a fresh AnalysisContext whose ROI is
+# already located so the stage pays only for the planes it uses itself
+STAGES = {
+    'analyze_skin_tone': analyzer.analyze_skin_tone,
+    'analyze_skin_type': analyzer.analyze_skin_type,
+    'calculate_hydration': analyzer.calculate_hydration,
+    'calculate_barrier_score': analyzer.calculate_barrier_score,
+    'assess_photo_quality': analyzer.assess_photo_quality,
+}
+
+
+def measure(fn, setup=None, min_runs=5, max_runs=50, budget=1.0):
+    """
+    Time fn over repeated runs after one warm-up call
+    setup, if given, builds the argument for each run outside the timing.
+    Runs until max_runs or until budget seconds have passed after min_runs.
+    Peak memory comes from one extra traced run.
+    """
+    arg = setup() if setup else None
+    fn(arg)
+
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < max_runs:
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        fn(arg)
+        samples.append(time.perf_counter() - start)
+        if len(samples) >= min_runs and time.perf_counter() - started > budget:
+            break
+
+    arg = setup() if setup else None
+    tracemalloc.start()
+    try:
+        fn(arg)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    samples = np.array(samples)
+    return {
+        'runs': len(samples),
+        'p50_ms': float(np.percentile(samples, 50) * 1000),
+        'p99_ms': float(np.percentile(samples, 99) * 1000),
+        'throughput': float(1 / samples.mean()),
+        'peak_mb': peak / 2 ** 20,
+    }
+
+
+def bench_image(client, name, mimetype, data):
+    """All cases for one corpus image, plus its analysis output"""
+    image = analyzer.decode_image(data)
+
+    def fresh_context(hydration_mode=None):
+        ctx = AnalysisContext(image, hydration_mode=hydration_mode)
+        ctx.roi
+        return ctx
+
+    cases = {
+        'decode': measure(lambda _: analyzer.decode_image(data)),
+        'detect_skin_roi': measure(lambda _: detect_skin_roi(image)),
+    }
+    for stage, method in STAGES.items():
+        cases[stage] = measure(method, setup=fresh_context)
+    # Hydration fidelity modes, timed on a ready texture plane so the
+    # cases differ only in the smoothing filter
+    for mode in HYDRATION_SMOOTHERS:
+        def texture_context(mode=mode):
+            ctx = fresh_context(mode)
+            ctx.texture_gray
+            return ctx
+        cases[f'hydration[{mode}]'] = measure(analyzer.calculate_hydration, setup=texture_context)
+    cases['analyze_image'] = measure(lambda _: analyzer.analyze_image(image))
+
+    def post(_):
+        response = client.post('/api/analyze', data=data, content_type=mimetype,
+                               headers={'X-DermAI-Cache': 'bypass'})
+        if response.status_code != 200:
+            raise RuntimeError(f'{name}: /api/analyze returned {response.status_code}')
+    # The route refuses bodies over the upload limit before decoding them
+    if len(data) <= backend_app.MAX_UPLOAD_BYTES:
+        cases['route'] = measure(post)
+
+    # Throughput per source megapixel; JPEG draft decoding may shrink the frame
+    width, height = Image.open(BytesIO(data)).size
+    megapixels = width * height / 1e6
+    for stats in cases.values():
+        stats['megapixels_per_s'] = stats['throughput'] * megapixels
+
+    output = json.loads(json.dumps(analyzer.analyze_image(image)))
+    return cases, output
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'pillow': PIL.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Regression messages for cases slower or larger than baseline"""
+    regressions = []
+    for image, cases in results.items():
+        for case, stats in cases.items():
+            base = baseline.get(image, {}).get(case)
+            if base is None:
+                continue
+            for metric in ('p50_ms', 'peak_mb'):
+                # Changes under MIN_DELTA ms or MB are scheduler and allocator noise
+                if stats[metric] > max(base[metric] * (1 + tolerance), base[metric] + MIN_DELTA):
+                    regressions.append(
+                        f'{image} {case} {metric}: {base[metric]:.2f} -> {stats[metric]:.2f}'
+                    )
+    return regressions
+
+
+def diff_outputs(outputs, snapshots):
+    """Messages for every output field that differs from its snapshot"""
+    changes = []
+
+    def walk(image, path, old, new):
+        if isinstance(old, dict) and isinstance(new, dict):
+            for key in sorted(set(old) | set(new)):
+                walk(image, f'{path}.{key}' if path else key, old.get(key), new.get(key))
+        elif old != new:
+            changes.append(f'{image} {path}: {old!r} -> {new!r}')
+
+    for image, output in outputs.items():
+        if image in snapshots:
+            walk(image, '', snapshots[image], output)
+    return changes
+
+
+def print_table(results):
+    print(f"{'image':<12} {'case':<24} {'p50 ms':>9} {'p99 ms':>9} {'img/s':>8} {'MP/s':>8} {'peak MB':>8}")
+    for image, cases in results.items():
+        for case, stats in cases.items():
+            print(f"{image:<12} {case:<24} {stats['p50_ms']:>9.2f} {stats['p99_ms']:>9.2f} "
+                  f"{stats['throughput']:>8.1f} {stats['megapixels_per_s']:>8.1f} {stats['peak_mb']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', help='comma-separated size labels, e.g. 0.3mp,2mp')
+    parser.add_argument('--modes', help='comma-separated modes: rgb, gray, rgba')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline results file')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='allowed slowdown or memory growth over baseline (default 0.15)')
+    parser.add_argument('--output', help='also write this run to a results file')
+    parser.add_argument('--update-snapshots', action='store_true', help='store outputs as the new snapshots')
+    args = parser.parse_args()
+
+    sizes = args.sizes.split(',') if args.sizes else None
+    modes = args.modes.split(',') if args.modes else None
+    client = backend_app.app.test_client()
+
+    results = {}
+    outputs = {}
+    for name, mimetype, data in corpus(sizes, modes):
+        print(f'benchmarking {name} ({len(data) / 2 ** 20:.1f} MB {mimetype})', file=sys.stderr)
+        results[name], outputs[name] = bench_image(client, name, mimetype, data)
+
+    print_table(results)
+    report = {'environment': environment(), 'results': results}
+    failed = False
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nbaseline saved to {args.baseline}')
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['environment'] != report['environment']:
+            print('\nnote: baseline was recorded in a different environment')
+        regressions = compare(results, baseline['results'], args.tolerance)
+        print(f'\n{len(regressions)} regression(s) against {args.baseline}')
+        for message in regressions:
+            print(f'  {message}')
+        failed |= bool(regressions)
+
+    snapshots = {}
+    if os.path.exists(SNAPSHOT_PATH):
+        with open(SNAPSHOT_PATH) as f:
+            snapshots = json.load(f)
+    if args.update_snapshots:
+        snapshots.update(outputs)
+        os.makedirs(os.path.dirname(SNAPSHOT_PATH), exist_ok=True)
+        with open(SNAPSHOT_PATH, 'w') as f:
+            json.dump(snapshots, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'\nsnapshots updated for {len(outputs)} image(s)')
+    else:
+        changes = diff_outputs(outputs, snapshots)
+        missing = sorted(set(outputs) - set(snapshots))
+        print(f'\n{len(changes)} output change(s) against snapshots'
+              + (f'; no snapshot for {", ".join(missing)}' if missing else ''))
+        for message in changes:
+            print(f'  {message}')
+        failed |= bool(changes)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,410 @@
+"""
+DermAI - Offline bulk scoring
+Runs SkinAnalyzer over every image in a directory, zip or tar archive and
+writes one result row per image, without going through the HTTP server.
+
+    python bulk_score.py photos/ results.jsonl
+    python bulk_score.py photos.tar.gz results.parquet --workers 8
+    python bulk_score.py photos.zip results.jsonl --hydration guided
+
+Images are read in archive or sorted directory order and decoded on a
+thread pool. The analysis runs on a warm process pool, with each frame
+passed through shared memory as the server's process executor does.
+Only a bounded window of images is in flight at a time. Decodes also
+share the DERMAI_DECODE_MEMORY_MB budget, so memory does not grow with
+the size of the input.
+
+Rows are {"path", "success", "data" or "error"} as JSON lines, or
+flattened into columns for Parquet (a directory of part files; needs
+pyarrow). The output doubles as the checkpoint: it is flushed every
+--checkpoint-rows rows or --checkpoint-interval seconds. Rerunning the
+same command skips every path already in it. Failed images are recorded
+too and are not retried on resume. Analyzer settings come from the usual
+DERMAI_* environment variables.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from io import BytesIO
+
+# Score the pipeline itself: no warm-up thread, no result cache
+os.environ.setdefault('DERMAI_WARMUP', '0')
+os.environ.setdefault('DERMAI_CACHE_MAX_ENTRIES', '0')
+
+import backend_app  # noqa: E402
+from backend_app import HYDRATION_SMOOTHERS, AnalysisExecutor, analyzer, encode_json  # noqa: E402
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+CHECKPOINT_ROWS = 1000
+CHECKPOINT_INTERVAL = 60.0
+PROGRESS_INTERVAL = 5.0
+
+
+def directory_entries(root, skip):
+    """(relative path, file path) for every image under root, in sorted order"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            if not skip(name):
+                yield name, path
+
+
+def zip_entries(path, skip):
+    """(member name, bytes) for every image in a zip archive"""
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            if not skip(info.filename):
+                yield info.filename, archive.read(info)
+
+
+def tar_entries(path, skip):
+    """
+    (member name, bytes) for every image in a tar archive
+    Read as a stream, so compressed archives are never seeked or unpacked
+    to disk; members are skipped without being read.
+    """
+    with tarfile.open(path, 'r|*') as archive:
+        for member in archive:
+            if not member.isfile() or not member.name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            if not skip(member.name):
+                yield member.name, archive.extractfile(member).read()
+
+
+def input_entries(path, skip=lambda name: False):
+    """
+    Lazily list the images at path as (name, payload) pairs
+    payload is a file path for directories and the encoded bytes for
+    archives; names for which skip returns True are left out.
+    """
+    if os.path.isdir(path):
+        return directory_entries(path, skip)
+    if zipfile.is_zipfile(path):
+        return zip_entries(path, skip)
+    if os.path.isfile(path) and tarfile.is_tarfile(path):
+        return tar_entries(path, skip)
+    raise SystemExit(f'{path}: not a directory, zip or tar archive')
+
+
+def count_entries(path, skip):
+    """Images left to score at path, or None for tar archives, which would have to be read twice"""
+    if os.path.isdir(path) or zipfile.is_zipfile(path):
+        return sum(1 for _ in input_entries(path, skip))
+    return None
+
+
+def score(name, payload, executor, hydration_mode=None):
+    """Decode and analyze one image, returning its output row and megapixels"""
+    try:
+        with open(payload, 'rb') if isinstance(payload, str) else BytesIO(payload) as fp:
+            image = analyzer.decode_image(fp)
+        megapixels = image.shape[0] * image.shape[1] / 1e6
+        results = executor.run(image, hydration_mode=hydration_mode)
+        return {'path': name, 'success': True, 'data': results}, megapixels
+    except Exception as e:
+        return {'path': name, 'success': False, 'error': str(e)}, 0.0
+
+
+class JsonlOutput:
+    """Result rows appended to a JSON lines file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def completed(self):
+        """
+        Paths already in the file
+        A torn last line left by an interrupted run is truncated away.
+        """
+        done = set()
+        if not os.path.exists(self.path):
+            return done
+        offset = 0
+        with open(self.path, 'r+b') as f:
+            for number, line in enumerate(f, 1):
+                if not line.endswith(b'\n'):
+                    f.truncate(offset)
+                    break
+                try:
+                    done.add(json.loads(line)['path'])
+                except (ValueError, KeyError):
+                    raise SystemExit(f'{self.path}:{number}: not a result row')
+                offset += len(line)
+        return done
+
+    def write(self, row):
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+        self._file.write(encode_json(row) + b'\n')
+
+    def checkpoint(self):
+        """Make every row written so far durable"""
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self.checkpoint()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def flatten(data, prefix=''):
+    """Nested dicts as one dict with dotted keys; lists are kept as values"""
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        else:
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def parquet_schema():
+    """Column types for flattened result rows"""
+    import pyarrow as pa
+
+    return pa.schema([
+        ('path', pa.string()),
+        ('success', pa.bool_()),
+        ('error', pa.string()),
+        ('skinType', pa.string()),
+        ('skinTypeConfidence', pa.float64()),
+        ('skinTone.name', pa.string()),
+        ('skinTone.hex', pa.string()),
+        ('skinTone.rgb', pa.list_(pa.int16())),
+        ('skinTone.brightness', pa.float64()),
+        ('hydration', pa.int32()),
+        ('barrierScore', pa.int32()),
+        ('photoClarity', pa.int32()),
+        ('concerns', pa.list_(pa.string())),
+        ('tips', pa.list_(pa.string())),
+        ('technicalMetrics.textureVariance', pa.float64()),
+        ('technicalMetrics.brightnessStd', pa.float64()),
+        ('technicalMetrics.toneBrightness', pa.float64()),
+        ('technicalMetrics.roi.x', pa.int32()),
+        ('technicalMetrics.roi.y', pa.int32()),
+        ('technicalMetrics.roi.width', pa.int32()),
+        ('technicalMetrics.roi.height', pa.int32()),
+        ('technicalMetrics.roi.method', pa.string()),
+    ])
+
+
+class ParquetOutput:
+    """
+    Result rows written as a directory of Parquet part files
+    Each checkpoint writes the rows since the last one as a new part,
+    renamed into place once complete, so a part is either whole or absent.
+    """
+
+    def __init__(self, path):
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise SystemExit('Parquet output needs pyarrow (pip install pyarrow); use a .jsonl output instead')
+        self.path = path
+        self.schema = parquet_schema()
+        self._rows = []
+        self._parts = 0
+        self._dropped = set()
+
+    def completed(self):
+        """Paths already in the part files; partial parts from an interrupted run are removed"""
+        import pyarrow.parquet as pq
+
+        os.makedirs(self.path, exist_ok=True)
+        for partial in glob.glob(os.path.join(self.path, '*.tmp')):
+            os.remove(partial)
+        done = set()
+        parts = sorted(glob.glob(os.path.join(self.path, 'part-*.parquet')))
+        for part in parts:
+            done.update(pq.read_table(part, columns=['path']).column('path').to_pylist())
+        self._parts = len(parts)
+        return done
+
+    def write(self, row):
+        flat = flatten({key: value for key, value in row.items() if key != 'data'})
+        flat.update(flatten(row.get('data', {})))
+        # Fields the schema does not know are reported once rather than lost silently
+        dropped = set(flat) - set(self.schema.names) - self._dropped
+        if dropped:
+            print(f'note: {", ".join(sorted(dropped))} not in the Parquet schema; '
+                  'use JSONL output to keep them', file=sys.stderr)
+            self._dropped |= dropped
+        self._rows.append(flat)
+
+    def checkpoint(self):
+        """Write the buffered rows as the next part file"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._rows:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        part = os.path.join(self.path, f'part-{self._parts:05d}.parquet')
+        table = pa.Table.from_pylist(self._rows, schema=self.schema)
+        pq.write_table(table, part + '.tmp', compression='zstd')
+        os.replace(part + '.tmp', part)
+        self._parts += 1
+        self._rows = []
+
+    def close(self):
+        self.checkpoint()
+
+
+OUTPUT_FORMATS = {
+    'jsonl': JsonlOutput,
+    'parquet': ParquetOutput
+}
+
+
+class Progress:
+    """Periodic progress and throughput lines on stderr"""
+
+    def __init__(self, total, resumed, interval=PROGRESS_INTERVAL, stream=sys.stderr):
+        self.total = total
+        self.resumed = resumed
+        self.interval = interval
+        self.stream = stream
+        self.scored = 0
+        self.failed = 0
+        self.megapixels = 0.0
+        self.started = time.perf_counter()
+        self._last = self.started
+
+    def update(self, row, megapixels):
+        self.scored += 1
+        self.failed += not row['success']
+        self.megapixels += megapixels
+
+    def report(self, force=False):
+        now = time.perf_counter()
+        if not force and now - self._last < self.interval:
+            return
+        self._last = now
+        elapsed = max(now - self.started, 1e-9)
+        rate = self.scored / elapsed
+        done = f'{self.scored}/{self.total}' if self.total is not None else f'{self.scored}'
+        line = (f'{done} scored, {self.failed} failed, {self.resumed} resumed | '
+                f'{rate:.1f} img/s, {self.megapixels / elapsed:.1f} MP/s | {elapsed:.0f}s')
+        if self.total is not None and rate > 0:
+            line += f', ETA {(self.total - self.scored) / rate:.0f}s'
+        print(line, file=self.stream, flush=True)
+
+
+def run(args):
+    output_format = args.format or ('parquet' if args.output.endswith('.parquet') else 'jsonl')
+    output = OUTPUT_FORMATS[output_format](args.output)
+    done = output.completed()
+    skip = done.__contains__
+
+    total = count_entries(args.input, skip)
+    if total is not None and args.limit is not None:
+        total = min(total, args.limit)
+    progress = Progress(total, len(done), args.progress_interval)
+
+    # Batch decodes wait for memory to free up rather than failing at the
+    # server's admission wait, but no longer than an image may take to
+    # analyze, so a stuck budget shows up as failed rows, not a hang
+    backend_app.decode_budget.wait = args.timeout
+    threads = args.threads or 2 * max(args.workers, 1)
+    # Entries read ahead of the decoders; bounds the encoded bytes held
+    window = 2 * threads
+    # Each thread runs one analysis at a time, but a finished job's slot is
+    # released by a pool callback that can trail its result, so the
+    # executor gets headroom rather than turning images away as saturated
+    executor = AnalysisExecutor(
+        mode='process' if args.workers else 'inline', workers=args.workers,
+        queue_size=window, timeout=args.timeout
+    )
+
+    pending = set()
+    since_checkpoint = 0
+    last_checkpoint = time.perf_counter()
+
+    def collect(finished):
+        nonlocal since_checkpoint, last_checkpoint
+        for future in finished:
+            row, megapixels = future.result()
+            output.write(row)
+            progress.update(row, megapixels)
+            since_checkpoint += 1
+        if (since_checkpoint >= args.checkpoint_rows
+                or time.perf_counter() - last_checkpoint >= args.checkpoint_interval):
+            output.checkpoint()
+            since_checkpoint = 0
+            last_checkpoint = time.perf_counter()
+        progress.report()
+
+    decoders = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='bulk-decode')
+    try:
+        executor.start()
+        for number, (name, payload) in enumerate(input_entries(args.input, skip)):
+            if args.limit is not None and number >= args.limit:
+                break
+            pending.add(decoders.submit(score, name, payload, executor, args.hydration))
+            if len(pending) >= window:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+    except KeyboardInterrupt:
+        # Keep every finished row; the rest are scored again on resume
+        collect([future for future in pending if future.done() and not future.cancelled()])
+        output.close()
+        progress.report(force=True)
+        print(f'interrupted; rerun the same command to resume into {args.output}', file=sys.stderr)
+        return 130
+    finally:
+        # However the run ends, queued images are dropped and the worker
+        # processes stopped, so an interrupt or error leaves none behind.
+        # Images already in a decode thread finish first (each within
+        # --timeout); stopping the pool under them would only restart it
+        decoders.shutdown(wait=True, cancel_futures=True)
+        executor.shutdown()
+
+    output.close()
+    progress.report(force=True)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', help='directory, zip or tar archive (optionally compressed) of images')
+    parser.add_argument('output', help='.jsonl file, or .parquet directory of part files')
+    parser.add_argument('--format', choices=sorted(OUTPUT_FORMATS), help='output format (default: from the extension)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='analysis processes; 0 analyzes in the decode threads (default: CPU count)')
+    parser.add_argument('--threads', type=int, help='decode threads (default: twice the workers)')
+    parser.add_argument('--hydration', choices=sorted(HYDRATION_SMOOTHERS), help='hydration fidelity mode')
+    parser.add_argument('--timeout', type=float, default=backend_app.ANALYSIS_TIMEOUT,
+                        help='seconds an image may take before it is recorded as failed')
+    parser.add_argument('--limit', type=int, help='score at most this many new images')
+    parser.add_argument('--checkpoint-rows', type=int, default=CHECKPOINT_ROWS,
+                        help='rows between checkpoints')
+    parser.add_argument('--checkpoint-interval', type=float, default=CHECKPOINT_INTERVAL,
+                        help='most seconds between checkpoints')
+    parser.add_argument('--progress-interval', type=float, default=PROGRESS_INTERVAL,
+                        help='seconds between progress lines')
+    return run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Shared test fixtures: the Flask test client and synthetic skin photos
+Photos are generated, never stored: a lit, textured, skin-toned ellipse on
+a darker background, varied in tone, texture and framing by seed.
+"""
+
+import base64
+import os
+import sys
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Test the pipeline itself: no warm-up thread at import
+os.environ.setdefault('DERMAI_WARMUP', '0')
+
+import backend_app  # noqa: E402
+
+# Base skin tones, light to deep (RGB)
+SKIN_TONES = np.array([
+    [236, 201, 176],
+    [214, 168, 132],
+    [181, 131, 94],
+    [141, 96, 66],
+    [98, 66, 46],
+])
+
+
+def skin_photo(seed=0, size=(800, 600), fmt='JPEG', mode='RGB'):
+    """Encoded synthetic skin photo; the same seed always gives the same bytes"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    cx = width * rng.uniform(0.4, 0.6)
+    cy = height * rng.uniform(0.4, 0.6)
+    rx = width * rng.uniform(0.25, 0.45)
+    ry = height * rng.uniform(0.3, 0.48)
+    inside = ((x - cx) / rx) ** 2 + ((y - cy) / ry) ** 2 <= 1
+    
+    tone = SKIN_TONES[seed % len(SKIN_TONES)] + rng.normal(0, 8, 3)
+    light = 0.8 + 0.35 * (1 - (x / width))[..., None]
+    skin = tone * light + rng.normal(0, rng.uniform(3, 25), (height, width, 3))
+    background = rng.uniform(20, 90, 3) + rng.normal(0, 6, (height, width, 3))
+    pixels = np.clip(np.where(inside[..., None], skin, background), 0, 255).astype(np.uint8)
+    
+    image = Image.fromarray(pixels).convert(mode)
+    buffer = BytesIO()
+    image.save(buffer, fmt, quality=90) if fmt == 'JPEG' else image.save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def data_url(data, mimetype='image/jpeg'):
+    """data: URL of encoded image bytes, as the JSON bodies carry them"""
+    return f'data:{mimetype};base64,{base64.b64encode(data).decode()}'
+
+
+@pytest.fixture
+def client():
+    return backend_app.app.test_client()
+
+
+@pytest.fixture(scope='session')
+def photos():
+    """Twelve distinct synthetic photos"""
+    return [skin_photo(seed) for seed in range(12)]
+
+
+@pytest.fixture
+def no_cache(monkeypatch):
+    """Route results straight through the analyzer, with no cache hits"""
+    monkeypatch.setattr(backend_app, 'analysis_cache', backend_app.AnalysisCache(max_entries=0))
@@ -0,0 +1,77 @@
+"""/api/analyze/batch: per-image entries, failure isolation and request limits"""
+
+from io import BytesIO
+
+import backend_app
+from conftest import data_url
+
+
+def analyze(client, photo):
+    response = client.post('/api/analyze', data=photo, content_type='image/jpeg',
+                           headers={'X-DermAI-Cache': 'bypass'})
+    assert response.status_code == 200
+    return response.get_json()['data']
+
+
+def test_json_batch_returns_one_result_per_image(client, photos):
+    response = client.post('/api/analyze/batch', json={'images': [data_url(p) for p in photos[:3]]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['success'] and body['count'] == 3 and body['failed'] == 0
+    single = analyze(client, photos[0])
+    for entry in body['results']:
+        assert entry['success']
+        assert set(entry['data']) == set(single)
+
+
+def test_batch_matches_single_analysis(client, photos):
+    body = client.post('/api/analyze/batch', json={'images': [data_url(p) for p in photos]}).get_json()
+    assert body['failed'] == 0
+    for photo, entry in zip(photos, body['results']):
+        assert entry['data'] == analyze(client, photo)
+
+
+def test_multipart_batch(client, photos):
+    files = [(BytesIO(photo), f'{index}.jpg') for index, photo in enumerate(photos[:2])]
+    response = client.post('/api/analyze/batch', data={'images': files},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert [entry['success'] for entry in response.get_json()['results']] == [True, True]
+
+
+def test_bad_image_fails_only_its_own_entry(client, photos):
+    images = [data_url(photos[0]), 'data:image/jpeg;base64,bm90IGFuIGltYWdl', data_url(photos[1])]
+    body = client.post('/api/analyze/batch', json={'images': images}).get_json()
+    assert body['count'] == 3 and body['failed'] == 1
+    assert [entry['success'] for entry in body['results']] == [True, False, True]
+    assert 'error' in body['results'][1]
+
+
+def test_batch_view_parameters(client, photos):
+    body = client.post('/api/analyze/batch?fields=skinType,hydration',
+                       json={'images': [data_url(photos[0])]}).get_json()
+    assert set(body['results'][0]['data']) == {'skinType', 'hydration'}
+
+
+def test_empty_batch_is_400(client):
+    assert client.post('/api/analyze/batch', json={'images': []}).status_code == 400
+    assert client.post('/api/analyze/batch', json={}).status_code == 400
+
+
+def test_oversized_batch_is_413(client, photos, monkeypatch):
+    monkeypatch.setattr(backend_app, 'MAX_BATCH_IMAGES', 2)
+    response = client.post('/api/analyze/batch', json={'images': [data_url(p) for p in photos[:3]]})
+    assert response.status_code == 413
+
+
+def test_bad_parameters_are_400(client, photos):
+    images = {'images': [data_url(photos[0])]}
+    assert client.post('/api/analyze/batch?fields=bogus', json=images).status_code == 400
+    assert client.post('/api/analyze/batch?hydration=bogus', json=images).status_code == 400
+
+
+def test_batch_takes_an_admission_slot(client, monkeypatch, photos):
+    monkeypatch.setattr(backend_app, 'analysis_executor', backend_app.AnalysisExecutor('inline', queue_size=0))
+    response = client.post('/api/analyze/batch', json={'images': [data_url(photos[0])]})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(backend_app.RETRY_AFTER_SECONDS)
@@ -0,0 +1,145 @@
+"""bulk_score.py: inputs, output rows, resume and Parquet part files"""
+
+import json
+import sys
+import tarfile
+import zipfile
+
+import pytest
+
+import backend_app
+import bulk_score
+from conftest import skin_photo
+
+NAMES = ['a.jpg', 'b.jpg', 'nested/c.jpg']
+
+
+@pytest.fixture(autouse=True)
+def restore_decode_budget(monkeypatch):
+    # run() lets batch decodes wait up to --timeout for memory
+    monkeypatch.setattr(backend_app.decode_budget, 'wait', backend_app.decode_budget.wait)
+
+
+@pytest.fixture
+def photo_dir(tmp_path):
+    root = tmp_path / 'photos'
+    for seed, name in enumerate(NAMES):
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(skin_photo(seed, size=(320, 240)))
+    (root / 'notes.txt').write_text('not an image')
+    return root
+
+
+def score(monkeypatch, *argv):
+    monkeypatch.setattr(sys, 'argv', ['bulk_score.py', *map(str, argv), '--workers', '0',
+                                      '--progress-interval', '60'])
+    return bulk_score.main()
+
+
+def read_rows(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_directory_to_jsonl(monkeypatch, tmp_path, photo_dir):
+    output = tmp_path / 'out.jsonl'
+    assert score(monkeypatch, photo_dir, output) == 0
+    rows = read_rows(output)
+    assert sorted(row['path'] for row in rows) == NAMES
+    with open(photo_dir / 'a.jpg', 'rb') as f:
+        expected = backend_app.analyzer.analyze_image(backend_app.analyzer.decode_image(f))
+    assert next(row for row in rows if row['path'] == 'a.jpg')['data'] == json.loads(json.dumps(expected))
+
+
+@pytest.mark.parametrize('kind', ['zip', 'tar.gz'])
+def test_archives(monkeypatch, tmp_path, photo_dir, kind):
+    archive = tmp_path / f'photos.{kind}'
+    if kind == 'zip':
+        with zipfile.ZipFile(archive, 'w') as f:
+            for name in NAMES:
+                f.write(photo_dir / name, name)
+    else:
+        with tarfile.open(archive, 'w:gz') as f:
+            for name in NAMES:
+                f.add(photo_dir / name, name)
+    output = tmp_path / 'out.jsonl'
+    assert score(monkeypatch, archive, output) == 0
+    rows = read_rows(output)
+    assert sorted(row['path'] for row in rows) == NAMES
+    assert all(row['success'] for row in rows)
+
+
+def test_corrupt_image_is_a_failed_row(monkeypatch, tmp_path, photo_dir):
+    (photo_dir / 'broken.jpg').write_bytes(b'not a jpeg')
+    output = tmp_path / 'out.jsonl'
+    score(monkeypatch, photo_dir, output)
+    rows = {row['path']: row for row in read_rows(output)}
+    assert rows['broken.jpg']['success'] is False and rows['broken.jpg']['error']
+    assert rows['a.jpg']['success']
+
+
+def test_resume_skips_done_paths(monkeypatch, tmp_path, photo_dir):
+    output = tmp_path / 'out.jsonl'
+    score(monkeypatch, photo_dir, output, '--limit', '1')
+    assert len(read_rows(output)) == 1
+    score(monkeypatch, photo_dir, output)
+    rows = read_rows(output)
+    assert sorted(row['path'] for row in rows) == NAMES
+
+
+def test_resume_truncates_a_torn_line(monkeypatch, tmp_path, photo_dir):
+    output = tmp_path / 'out.jsonl'
+    score(monkeypatch, photo_dir, output, '--limit', '2')
+    complete = output.read_bytes()
+    output.write_bytes(complete + b'{"path": "nested/c.jpg", "succ')
+    score(monkeypatch, photo_dir, output)
+    assert output.read_bytes().startswith(complete)
+    assert sorted(row['path'] for row in read_rows(output)) == NAMES
+
+
+def test_unreadable_output_stops(monkeypatch, tmp_path, photo_dir):
+    output = tmp_path / 'out.jsonl'
+    output.write_text('not json\n')
+    with pytest.raises(SystemExit):
+        score(monkeypatch, photo_dir, output)
+
+
+def test_parquet_parts_and_resume(monkeypatch, tmp_path, photo_dir):
+    pq = pytest.importorskip('pyarrow.parquet')
+    output = tmp_path / 'out.parquet'
+    score(monkeypatch, photo_dir, output, '--limit', '2', '--checkpoint-rows', '1')
+    (output / 'part-00009.parquet.tmp').write_bytes(b'partial')
+    score(monkeypatch, photo_dir, output)
+
+    assert not list(output.glob('*.tmp'))
+    table = pq.read_table(output)
+    assert sorted(table.column('path').to_pylist()) == NAMES
+    assert 'skinTone.name' in table.column_names
+
+
+def test_decode_wait_is_bounded(monkeypatch, tmp_path, photo_dir):
+    score(monkeypatch, photo_dir, tmp_path / 'out.jsonl', '--timeout', '12')
+    assert backend_app.decode_budget.wait == 12
+
+
+def test_interrupt_shuts_the_workers_down(monkeypatch, tmp_path, photo_dir):
+    executors = []
+
+    class Recording(bulk_score.AnalysisExecutor):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            executors.append(self)
+
+    def interrupted(path, skip):
+        yield from list(bulk_score.directory_entries(path, skip))[:1]
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(bulk_score, 'AnalysisExecutor', Recording)
+    monkeypatch.setattr(bulk_score, 'input_entries', interrupted)
+    monkeypatch.setattr(bulk_score, 'count_entries', lambda path, skip: None)
+    monkeypatch.setattr(sys, 'argv', ['bulk_score.py', str(photo_dir), str(tmp_path / 'out.jsonl'),
+                                      '--workers', '1', '--progress-interval', '60'])
+    assert bulk_score.main() == 130
+    [executor] = executors
+    assert executor.mode == 'process' and executor._pool is None
@@ -0,0 +1,74 @@
+"""/api/analyze/burst: frame uploads, animations, blur skipping and convergence"""
+
+from io import BytesIO
+
+from PIL import Image, ImageFilter
+
+from conftest import data_url, skin_photo
+
+
+def burst(client, **kwargs):
+    response = client.post('/api/analyze/burst', **kwargs)
+    assert response.status_code == 200
+    return response.get_json()['data']
+
+
+def test_multipart_frames(client, photos):
+    files = [(BytesIO(photo), f'{index}.jpg') for index, photo in enumerate(photos[:4])]
+    data = burst(client, data={'frames': files}, content_type='multipart/form-data')
+    assert data['burst'] == {'frames': 4, 'analyzed': 4, 'skippedBlurry': 0, 'failed': 0,
+                             'converged': False}
+    assert data['skinType'] and data['skinTone']
+
+
+def test_single_frame_matches_single_analysis(client, photos):
+    data = burst(client, json={'frames': [data_url(photos[0])]})
+    assert data.pop('burst')['analyzed'] == 1
+    single = client.post('/api/analyze', data=photos[0], content_type='image/jpeg',
+                         headers={'X-DermAI-Cache': 'bypass'}).get_json()['data']
+    assert data == single
+
+
+def test_bad_frame_is_counted_not_fatal(client, photos):
+    data = burst(client, json={'frames': [data_url(photos[0]), 'data:image/jpeg;base64,bm90']})
+    assert data['burst']['analyzed'] == 1 and data['burst']['failed'] == 1
+
+
+def test_animated_gif(client):
+    frames = [Image.open(BytesIO(skin_photo(seed))) for seed in range(3)]
+    gif = BytesIO()
+    frames[0].save(gif, 'GIF', save_all=True, append_images=frames[1:])
+    gif.seek(0)
+    data = burst(client, data={'video': (gif, 'clip.gif', 'image/gif')},
+                 content_type='multipart/form-data')
+    assert data['burst']['frames'] == 3
+
+
+def test_identical_frames_converge(client, photos):
+    data = burst(client, json={'frames': [data_url(photos[1])] * 8})
+    assert data['burst']['converged']
+    assert data['burst']['frames'] < 8
+
+
+def test_blurry_frames_fall_back_to_the_sharpest(client):
+    frames = []
+    for seed in range(3):
+        image = Image.open(BytesIO(skin_photo(seed))).filter(ImageFilter.GaussianBlur(8))
+        out = BytesIO()
+        image.save(out, 'JPEG')
+        frames.append(data_url(out.getvalue()))
+    data = burst(client, json={'frames': frames})
+    assert data['burst']['skippedBlurry'] == 3 and data['burst']['analyzed'] == 0
+    assert data['photoClarity']
+
+
+def test_no_frames_is_400(client):
+    assert client.post('/api/analyze/burst', json={}).status_code == 400
+    assert client.post('/api/analyze/burst', data={'note': 'x'},
+                       content_type='multipart/form-data').status_code == 400
+
+
+def test_only_bad_frames_is_400(client):
+    response = client.post('/api/analyze/burst', json={'frames': ['data:image/jpeg;base64,bm90']})
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
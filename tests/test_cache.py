@@ -0,0 +1,110 @@
+"""AnalysisCache tiers and limits, fingerprint keys, and the cache headers of /api/analyze"""
+
+import numpy as np
+import pytest
+
+import backend_app
+from backend_app import AnalysisCache, analyzer
+from conftest import skin_photo
+
+
+def test_lru_evicts_least_recently_used():
+    cache = AnalysisCache(max_entries=2, db_path='')
+    cache.put('a', {'n': 1})
+    cache.put('b', {'n': 2})
+    assert cache.get('a') == {'n': 1}
+    cache.put('c', {'n': 3})
+    assert cache.get('b') is None
+    assert cache.get('a') == {'n': 1} and cache.get('c') == {'n': 3}
+    assert cache.stats()['evictions'] == 1
+
+
+def test_byte_limit_and_oversized_entries():
+    cache = AnalysisCache(max_entries=10, max_bytes=40, db_path='')
+    cache.put('small', {'v': 'x' * 10})
+    cache.put('large', {'v': 'x' * 100})
+    assert cache.get('large') is None
+    assert cache.get('small') is not None
+    assert cache.stats()['bytes'] <= 40
+
+
+def test_ttl_expiry(monkeypatch):
+    cache = AnalysisCache(ttl=10, db_path='')
+    now = [1000.0]
+    monkeypatch.setattr(backend_app.time, 'time', lambda: now[0])
+    cache.put('k', {'v': 1})
+    now[0] += 11
+    assert cache.get('k') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_results_are_fresh_copies():
+    cache = AnalysisCache(db_path='')
+    cache.put('k', {'concerns': ['a']})
+    cache.get('k')['concerns'].append('b')
+    assert cache.get('k') == {'concerns': ['a']}
+
+
+def test_sqlite_tier_is_shared(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    AnalysisCache(db_path=path).put('k', {'v': 1})
+    other = AnalysisCache(db_path=path)
+    assert other.get('k') == {'v': 1}
+    assert other.stats()['disk_hits'] == 1
+
+
+def test_fingerprint_ignores_container():
+    pixels = np.random.default_rng(0).integers(0, 255, (64, 48, 3), dtype=np.uint8)
+    assert analyzer.fingerprint(pixels) == analyzer.fingerprint(pixels.copy())
+    assert analyzer.fingerprint(pixels) != analyzer.fingerprint(pixels[::-1])
+
+
+@pytest.mark.parametrize('name, value', [
+    ('ANALYZER_VERSION', 'next'),
+    ('ROI_MAX_SIDE', 512),
+])
+def test_fingerprint_follows_settings(monkeypatch, name, value):
+    pixels = np.zeros((32, 32, 3), dtype=np.uint8)
+    before = analyzer.fingerprint(pixels)
+    monkeypatch.setattr(backend_app, name, value)
+    assert analyzer.fingerprint(pixels) != before
+
+
+def test_fingerprint_follows_hydration_mode_and_calibration(monkeypatch):
+    pixels = np.zeros((32, 32, 3), dtype=np.uint8)
+    guided = analyzer.fingerprint(pixels, 'guided')
+    assert guided != analyzer.fingerprint(pixels, 'exact')
+    monkeypatch.setitem(backend_app.HYDRATION_CALIBRATION, 'guided', (1.0, 0.0))
+    assert analyzer.fingerprint(pixels, 'guided') != guided
+
+
+def test_route_cache_status(client, monkeypatch):
+    monkeypatch.setattr(backend_app, 'analysis_cache', AnalysisCache(db_path=''))
+    photo = skin_photo(4)
+    
+    def post(**headers):
+        return client.post('/api/analyze', data=photo, content_type='image/jpeg', headers=headers)
+    first, second, bypass = post(), post(), post(**{'X-DermAI-Cache': 'bypass'})
+    assert first.headers['X-DermAI-Cache'] == 'MISS'
+    assert second.headers['X-DermAI-Cache'] == 'HIT'
+    assert bypass.headers['X-DermAI-Cache'] == 'BYPASS'
+    assert first.get_data() == second.get_data() == bypass.get_data()
+    
+    stats = client.get('/api/cache/stats').get_json()['cache']
+    assert stats['hits'] == 1 and stats['misses'] == 1
+
+
+def test_shared_tier_misses_after_version_bump(client, monkeypatch, tmp_path):
+    path = str(tmp_path / 'cache.db')
+    photo = skin_photo(5)
+    
+    def post():
+        return client.post('/api/analyze', data=photo, content_type='image/jpeg')
+    monkeypatch.setattr(backend_app, 'analysis_cache', AnalysisCache(db_path=path))
+    assert post().headers['X-DermAI-Cache'] == 'MISS'
+    # A freshly started worker on the same file: shared hit, then none once the version moves
+    monkeypatch.setattr(backend_app, 'analysis_cache', AnalysisCache(db_path=path))
+    assert post().headers['X-DermAI-Cache'] == 'HIT'
+    monkeypatch.setattr(backend_app, 'ANALYZER_VERSION', backend_app.ANALYZER_VERSION + '-next')
+    monkeypatch.setattr(backend_app, 'analysis_cache', AnalysisCache(db_path=path))
+    assert post().headers['X-DermAI-Cache'] == 'MISS'
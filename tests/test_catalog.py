@@ -0,0 +1,108 @@
+"""Product catalog queries, lipstick matching and conditional GETs"""
+
+import pytest
+
+
+def products(client, query=''):
+    response = client.get(f'/api/products/Oily{query}')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def price(product):
+    return float(product['price'].lstrip('₹').replace(',', ''))
+
+
+def test_unfiltered_products_are_cached_with_etag(client):
+    response = client.get('/api/products/Oily')
+    etag = response.headers['ETag']
+    assert response.get_json()['products']
+    assert 'max-age' in response.headers['Cache-Control']
+
+    again = client.get('/api/products/Oily', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert not again.data
+    assert client.get('/api/products/Oily', headers={'If-None-Match': '"stale"'}).status_code == 200
+
+
+def test_rating_sorts_best_first(client):
+    best_first = [p['rating'] for p in products(client, '?sort=rating')['products']]
+    assert best_first == sorted(best_first, reverse=True)
+    worst_first = [p['rating'] for p in products(client, '?sort=-rating')['products']]
+    assert worst_first == sorted(worst_first)
+
+
+def test_price_and_name_sort_ascending(client):
+    prices = [price(p) for p in products(client, '?sort=price')['products']]
+    assert prices == sorted(prices)
+    prices = [price(p) for p in products(client, '?sort=-price')['products']]
+    assert prices == sorted(prices, reverse=True)
+    names = [p['name'].lower() for p in products(client, '?sort=name')['products']]
+    assert names == sorted(names)
+
+
+def test_filters(client):
+    everything = products(client)['products']
+    category = everything[0]['category']
+    body = products(client, f'?category={category.upper()}')
+    assert 'total' not in body
+    assert len(body['products']) == sum(p['category'] == category for p in everything)
+    assert all(p['category'] == category for p in body['products'])
+
+    floor = sorted(p['rating'] for p in everything)[len(everything) // 2]
+    assert all(p['rating'] >= floor for p in products(client, f'?min_rating={floor}')['products'])
+
+    ceiling = sorted(price(p) for p in everything)[1]
+    capped = products(client, f'?max_price={ceiling}')['products']
+    assert capped and all(price(p) <= ceiling for p in capped)
+
+
+def test_pagination(client):
+    body = products(client, '?per_page=2&page=2')
+    assert body['page'] == 2 and body['perPage'] == 2
+    assert len(body['products']) == min(2, body['total'] - 2)
+    whole = products(client, '?per_page=100')['products']
+    assert body['products'] == whole[2:4]
+
+
+def test_only_paging_params_paginate(client):
+    everything = products(client)['products']
+    assert products(client, '?utm_source=mail') == products(client)
+    assert products(client, '?sort=name')['products'] == sorted(everything, key=lambda p: p['name'].lower())
+    body = products(client, '?limit=2')
+    assert body['perPage'] == 2 and body['total'] == len(everything)
+    assert body['products'] == everything[:2]
+
+
+@pytest.mark.parametrize('query', ['?max_price=x', '?min_rating=high', '?limit=abc', '?page=abc', '?per_page=2.5'])
+def test_unparseable_numbers_are_400(client, query):
+    response = client.get(f'/api/products/Oily{query}')
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['success'] is False
+    assert query[1:].split('=')[0] in body['error']
+
+
+def test_unknown_sort_is_400(client):
+    response = client.get('/api/products/Oily?sort=popularity')
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_catalog_and_lipsticks_answer_conditional_gets(client):
+    for url in ('/api/catalog', '/api/lipsticks/Medium'):
+        response = client.get(url)
+        etag = response.headers['ETag']
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    catalog = client.get('/api/catalog').get_json()
+    assert catalog['version'] == client.get('/api/catalog').headers['ETag'].strip('"')
+    assert set(catalog) >= {'products', 'lipsticks', 'tips', 'styleRecommendations'}
+
+
+def test_lipstick_colour_matching(client):
+    body = client.get('/api/lipsticks/Medium?color=b5835e&limit=3').get_json()
+    assert body['color'] == '#b5835e'
+    assert len(body['lipsticks']) == 3
+    assert body['undertone']
+    assert client.get('/api/lipsticks/Medium?color=nothex').status_code == 400
+    assert client.get('/api/lipsticks/Medium?color=b5835e&limit=0').status_code == 400
@@ -0,0 +1,66 @@
+"""Many concurrent requests against the shared analyzer and static tables"""
+
+import copy
+import threading
+
+import pytest
+
+import backend_app
+from backend_app import AnalysisExecutor
+from conftest import skin_photo
+
+THREADS = 240
+
+TABLES = ('SKIN_CONCERNS', 'SKINCARE_TIPS', 'LIPSTICK_RECOMMENDATIONS',
+          'STYLE_RECOMMENDATIONS', 'SKIN_TONE_BRIGHTNESS')
+
+
+def requests_for(photos):
+    """(method, url, kwargs) cycling through analyses and catalog reads"""
+    cases = [('post', '/api/analyze', {'data': photo, 'content_type': 'image/jpeg',
+                                       'headers': {'X-DermAI-Cache': 'bypass'}})
+             for photo in photos]
+    for tone in ('Fair', 'Medium', 'Deep'):
+        cases.append(('get', f'/api/lipsticks/{tone}', {}))
+        cases.append(('get', f'/api/lipsticks/{tone}?color=b5835e&limit=4', {}))
+    for skin_type in ('Oily', 'Dry', 'Sensitive'):
+        cases.append(('get', f'/api/products/{skin_type}', {}))
+        cases.append(('get', f'/api/products/{skin_type}?sort=price&per_page=3', {}))
+    return cases
+
+
+def call(client, case):
+    method, url, kwargs = case
+    response = getattr(client, method)(url, **kwargs)
+    return response.status_code, response.get_data()
+
+
+def test_concurrent_requests_are_isolated(monkeypatch):
+    # Admit every thread at once; the stress is on shared state, not back-pressure
+    monkeypatch.setattr(backend_app, 'analysis_executor', AnalysisExecutor('inline', queue_size=THREADS))
+    tables = {name: copy.deepcopy(getattr(backend_app, name)) for name in TABLES}
+    cases = requests_for([skin_photo(seed, size=(320, 240)) for seed in range(4)])
+    client = backend_app.app.test_client()
+    expected = [call(client, case) for case in cases]
+    assert all(status == 200 for status, _ in expected)
+
+    results = [None] * THREADS
+    start = threading.Barrier(THREADS)
+
+    def worker(index):
+        thread_client = backend_app.app.test_client()
+        start.wait()
+        results[index] = call(thread_client, cases[index % len(cases)])
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for index, result in enumerate(results):
+        assert result == expected[index % len(cases)], cases[index % len(cases)][1]
+    for name, table in tables.items():
+        assert getattr(backend_app, name) == table
+        with pytest.raises(TypeError):
+            getattr(backend_app, name)['Medium'] = None
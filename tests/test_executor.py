@@ -0,0 +1,77 @@
+"""AnalysisExecutor modes, admission control and timeouts"""
+
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import backend_app
+from backend_app import AnalysisExecutor, analyzer
+from conftest import skin_photo
+
+
+@pytest.fixture
+def frame():
+    return analyzer.decode_image(skin_photo(6))
+
+
+def test_process_pool_matches_inline(frame):
+    executor = AnalysisExecutor('process', workers=1, queue_size=2)
+    try:
+        timings = {}
+        assert executor.run(frame, timings) == analyzer.analyze_image(frame)
+        assert 'tone' in timings
+    finally:
+        executor.shutdown()
+
+
+def test_start_twice_reuses_the_pool():
+    executor = AnalysisExecutor('process', workers=1, queue_size=2)
+    try:
+        pool = executor.start()
+        assert executor.start() is pool
+    finally:
+        executor.shutdown()
+    assert executor._pool is None
+
+
+def test_recovers_from_a_broken_pool(frame):
+    executor = AnalysisExecutor('process', workers=1, queue_size=2)
+    try:
+        broken = executor.start()
+        for process in list(broken._processes.values()):
+            process.kill()
+            process.join()
+        with pytest.raises(BrokenProcessPool):
+            executor.run(frame)
+        assert executor._pool is None
+        # Both slots are free again and a fresh pool serves the next job
+        assert executor.run(frame) == analyzer.analyze_image(frame)
+        assert executor._pool is not broken
+        # The release callback can trail the result by a moment
+        assert executor._slots.acquire(timeout=5) and executor._slots.acquire(timeout=5)
+    finally:
+        executor.shutdown()
+
+
+def test_process_timeout_is_504(client, monkeypatch, no_cache):
+    executor = AnalysisExecutor('process', workers=1, queue_size=2, timeout=1e-6)
+    monkeypatch.setattr(backend_app, 'analysis_executor', executor)
+    try:
+        executor.start()
+        response = client.post('/api/analyze', data=skin_photo(6), content_type='image/jpeg')
+        assert response.status_code == 504
+    finally:
+        executor.shutdown()
+
+
+def test_saturated_executor_is_503(client, monkeypatch, no_cache):
+    monkeypatch.setattr(backend_app, 'analysis_executor', AnalysisExecutor('inline', queue_size=0))
+    response = client.post('/api/analyze', data=skin_photo(6), content_type='image/jpeg')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(backend_app.RETRY_AFTER_SECONDS)
+    assert response.get_json()['success'] is False
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        AnalysisExecutor('threads')
@@ -0,0 +1,85 @@
+"""Per-user scan history: recording, trends and the history routes"""
+
+import pytest
+
+import backend_app
+from backend_app import SECONDS_PER_WEEK, ScanHistory, history_week
+
+# A Monday, so scans a day apart stay in one history week
+MONDAY = 1700438400.0
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    history = ScanHistory(db_path=str(tmp_path / 'history.db'), alpha=0.5)
+    monkeypatch.setattr(backend_app, 'scan_history', history)
+    return history
+
+
+def scan(hydration, barrier=80, clarity=90, skin_type='Oily'):
+    return {
+        'skinType': skin_type,
+        'skinTone': {'name': 'Medium'},
+        'hydration': hydration,
+        'barrierScore': barrier,
+        'photoClarity': clarity
+    }
+
+
+def test_trends_fold_every_scan(history):
+    assert history_week(MONDAY) == history_week(MONDAY + 6 * 86400)
+    history.record('ana', scan(70), scanned_at=MONDAY)
+    history.record('ana', scan(80), scanned_at=MONDAY + 86400)
+    history.record('ana', scan(90, skin_type='Combination'), scanned_at=MONDAY + SECONDS_PER_WEEK)
+
+    trends = history.trends('ana')
+    assert trends['scans'] == 3 and trends['skinType'] == 'Combination'
+    hydration = trends['metrics']['hydration']
+    assert (hydration['latest'], hydration['min'], hydration['max']) == (90, 70, 90)
+    assert hydration['ewma'] == 82.5
+    assert hydration['latestWeek']['mean'] == 90 and hydration['latestWeek']['scans'] == 1
+    assert hydration['previousWeek']['mean'] == 75
+    assert hydration['weekOverWeek'] == 15
+    assert history.trends('nobody') is None
+
+
+def test_scans_page_newest_first(history):
+    for day in range(5):
+        history.record('ana', scan(70 + day), scanned_at=MONDAY + day * 86400)
+    first = history.scans('ana', limit=2)
+    assert [row['hydration'] for row in first] == [74, 73]
+    rest = history.scans('ana', limit=10, before=first[-1]['scannedAt'])
+    assert [row['hydration'] for row in rest] == [72, 71, 70]
+
+
+def test_analysis_with_user_header_is_recorded(client, history, no_cache, photos):
+    response = client.post('/api/analyze', data=photos[0], content_type='image/jpeg',
+                           headers={'X-DermAI-User': 'ana'})
+    data = response.get_json()['data']
+
+    trends = client.get('/api/users/ana/trends').get_json()
+    assert trends['scans'] == 1 and trends['skinType'] == data['skinType']
+    assert trends['metrics']['hydration']['latest'] == data['hydration']
+
+    body = client.get('/api/users/ana/scans?limit=1').get_json()
+    assert body['scans'][0]['barrierScore'] == data['barrierScore']
+    assert body['next'] == body['scans'][0]['scannedAt']
+
+
+def test_routes_validate_users(client, history):
+    assert client.get('/api/users/bad%20id/trends').status_code == 400
+    assert client.get('/api/users/bad%20id/scans').status_code == 400
+    assert client.get('/api/users/nobody/trends').status_code == 404
+    assert client.get('/api/users/nobody/scans').get_json()['scans'] == []
+
+
+def test_bad_user_header_is_400(client, history, photos):
+    response = client.post('/api/analyze', data=photos[0], content_type='image/jpeg',
+                           headers={'X-DermAI-User': 'no spaces'})
+    assert response.status_code == 400
+
+
+def test_disabled_history_is_404(client, monkeypatch):
+    monkeypatch.setattr(backend_app, 'scan_history', ScanHistory(db_path=''))
+    assert client.get('/api/users/ana/trends').status_code == 404
+    assert client.get('/api/users/ana/scans').status_code == 404
@@ -0,0 +1,48 @@
+"""Hydration scoring: its range and the smoothing modes behind it"""
+
+import numpy as np
+
+from backend_app import AnalysisContext, analyzer
+from conftest import skin_photo
+
+
+def skin_frame(noise, seed=0, size=(600, 800)):
+    """A flat skin-toned frame with Gaussian texture of the given strength"""
+    rng = np.random.default_rng(seed)
+    tone = np.array([214, 168, 132]) + rng.normal(0, 10, 3)
+    pixels = tone + rng.normal(0, noise, (*size, 3))
+    return np.clip(pixels, 0, 255).astype(np.uint8)
+
+
+def hydration(frame, mode=None):
+    return analyzer.calculate_hydration(AnalysisContext(frame, detect_roi=False, hydration_mode=mode))
+
+
+def test_textured_skin_scores_lower():
+    smooth, rough = hydration(skin_frame(2)), hydration(skin_frame(40))
+    assert smooth >= 90
+    assert rough <= 55
+    scores = [hydration(skin_frame(noise)) for noise in (0, 5, 10, 20, 35, 50)]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_low_hydration_concern_fires():
+    results = analyzer.analyze_image(skin_frame(40))
+    assert results['hydration'] < 70
+    assert 'Low hydration detected' in results['concerns']
+    assert 'Low hydration detected' not in analyzer.analyze_image(skin_frame(2))['concerns']
+
+
+# Worst-case hydration points from exact, as stated with HYDRATION_CALIBRATION
+MODE_TOLERANCE = {'guided': 2, 'downsampled': 7, 'box': 14}
+
+
+def test_modes_track_exact_across_bands():
+    frames = [skin_frame(noise, seed) for seed in range(2) for noise in (2, 10, 20, 35, 50)]
+    frames += [analyzer.decode_image(skin_photo(seed)) for seed in (0, 5, 7, 9)]
+    exact = [hydration(frame) for frame in frames]
+    # Low, mid and high bands are all represented
+    assert min(exact) < 60 and max(exact) >= 80 and any(60 <= value < 80 for value in exact)
+    for mode, tolerance in MODE_TOLERANCE.items():
+        scores = [hydration(frame, mode) for frame in frames]
+        assert max(abs(a - b) for a, b in zip(scores, exact)) <= tolerance, mode
@@ -0,0 +1,91 @@
+"""Asynchronous analysis jobs: submission, polling and the event stream"""
+
+import json
+import time
+
+import pytest
+
+import backend_app
+from backend_app import AnalysisJobs
+from conftest import skin_photo
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    jobs = AnalysisJobs(workers=1, queue_size=4)
+    monkeypatch.setattr(backend_app, 'analysis_jobs', jobs)
+    return jobs
+
+
+def submit(client, photo):
+    response = client.post('/api/analyze/jobs', data=photo, content_type='image/jpeg')
+    assert response.status_code == 202
+    return response
+
+
+def poll(client, url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(url).get_json()['job']
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError('job did not finish')
+
+
+def parse_events(body):
+    events = []
+    for block in body.split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'event' in lines:
+            events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def test_submit_and_poll(client, jobs, no_cache):
+    photo = skin_photo(3)
+    response = submit(client, photo)
+    body = response.get_json()
+    assert response.headers['Location'] == body['statusUrl']
+    assert body['status'] == 'queued'
+
+    job = poll(client, body['statusUrl'])
+    assert job['status'] == 'done'
+    assert job['progress'] == 1.0
+    expected = client.post('/api/analyze', data=photo, content_type='image/jpeg').get_json()['data']
+    assert job['result'] == expected
+
+
+def test_event_stream_ends_with_result(client, jobs):
+    body = submit(client, skin_photo(4)).get_json()
+    response = client.get(body['eventsUrl'])
+    assert response.mimetype == 'text/event-stream'
+    events = parse_events(response.get_data(as_text=True))
+    assert events[-1][0] == 'result'
+    assert events[-1][1]['result']['skinType']
+    assert all(name == 'progress' for name, _ in events[:-1])
+
+
+def test_bad_image_fails_job(client, jobs):
+    body = submit(client, b'not an image').get_json()
+    job = poll(client, body['statusUrl'])
+    assert job['status'] == 'failed'
+    assert job['error']
+    events = parse_events(client.get(body['eventsUrl']).get_data(as_text=True))
+    assert [name for name, _ in events] == ['error']
+
+
+def test_unknown_job_is_404(client, jobs):
+    assert client.get('/api/analyze/jobs/missing').status_code == 404
+    assert client.get('/api/analyze/jobs/missing/events').status_code == 404
+
+
+def test_full_queue_is_503(client, monkeypatch):
+    # No workers drain the queue, so the second submission overflows it
+    jobs = AnalysisJobs(workers=1, queue_size=1)
+    monkeypatch.setattr(jobs, '_start', lambda: None)
+    monkeypatch.setattr(backend_app, 'analysis_jobs', jobs)
+    submit(client, skin_photo(5))
+    response = client.post('/api/analyze/jobs', data=skin_photo(5), content_type='image/jpeg')
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
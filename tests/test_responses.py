@@ -0,0 +1,76 @@
+"""Response shaping: compression, compact results and ?fields= views"""
+
+import gzip
+import json
+
+import pytest
+
+import backend_app
+from backend_app import COMPACT_FIELDS
+
+
+def test_gzip_over_threshold(client, monkeypatch):
+    monkeypatch.setattr(backend_app, 'brotli', None)
+    response = client.get('/api/catalog', headers={'Accept-Encoding': 'br, gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.headers['ETag'].startswith('W/')
+    assert json.loads(gzip.decompress(response.data))['version']
+
+
+def test_brotli_preferred_when_installed(client):
+    if backend_app.brotli is None:
+        pytest.skip('brotli is not installed')
+    response = client.get('/api/catalog', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert json.loads(backend_app.brotli.decompress(response.data))['version']
+
+
+def test_weak_etag_still_revalidates(client):
+    response = client.get('/api/catalog', headers={'Accept-Encoding': 'gzip'})
+    again = client.get('/api/catalog', headers={'Accept-Encoding': 'gzip',
+                                                 'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_small_or_unaccepted_bodies_are_not_encoded(client):
+    small = client.get('/api/cache/stats', headers={'Accept-Encoding': 'gzip'})
+    assert len(small.data) < backend_app.COMPRESS_MIN_BYTES
+    assert 'Content-Encoding' not in small.headers
+    plain = client.get('/api/catalog')
+    assert 'Content-Encoding' not in plain.headers
+    assert not plain.headers['ETag'].startswith('W/')
+
+
+def test_compression_can_be_turned_off(client, monkeypatch):
+    monkeypatch.setattr(backend_app, 'COMPRESS_MIN_BYTES', 0)
+    response = client.get('/api/catalog', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_compact_result_resolves_against_catalog(client, photos):
+    full = client.post('/api/analyze', data=photos[0], content_type='image/jpeg').get_json()['data']
+    compact = client.post('/api/analyze?compact=1', data=photos[0],
+                          content_type='image/jpeg').get_json()['data']
+    catalog = client.get('/api/catalog').get_json()
+
+    assert set(compact) == ({key for key in COMPACT_FIELDS if key in full}
+                            | {'productIds', 'lipstickIds', 'catalogVersion'})
+    assert compact['catalogVersion'] == catalog['version']
+    assert [catalog['products'][id] for id in compact['productIds']] == full['products']
+    # deltaE is measured against this photo, so only the full result has it
+    shades = [{key: value for key, value in shade.items() if key != 'deltaE'} for shade in full['lipsticks']]
+    assert [catalog['lipsticks'][id] for id in compact['lipstickIds']] == shades
+
+
+def test_fields_view(client, photos):
+    data = client.post('/api/analyze?fields=skinType,hydration', data=photos[0],
+                       content_type='image/jpeg').get_json()['data']
+    assert set(data) == {'skinType', 'hydration'}
+    data = client.post('/api/analyze?compact=1&fields=productIds', data=photos[0],
+                       content_type='image/jpeg').get_json()['data']
+    assert set(data) == {'productIds'}
+    response = client.post('/api/analyze?fields=skinType,nope', data=photos[0],
+                           content_type='image/jpeg')
+    assert response.status_code == 400
+    assert 'nope' in response.get_json()['error']
@@ -0,0 +1,21 @@
+"""Sharpness behind photoClarity: the tiled Laplacian variance"""
+
+import cv2
+import numpy as np
+import pytest
+
+from backend_app import AnalysisContext, laplacian_variance
+
+
+@pytest.mark.parametrize('shape', [(7, 5), (256, 300), (700, 513), (1024, 1024)])
+def test_tiled_variance_matches_opencv(shape):
+    gray = np.random.default_rng(shape[0]).integers(0, 256, shape, dtype=np.uint8)
+    expected = cv2.Laplacian(gray, cv2.CV_64F).var()
+    assert laplacian_variance(gray) == pytest.approx(expected, rel=1e-9)
+    assert laplacian_variance(gray, tile_rows=3) == pytest.approx(expected, rel=1e-9)
+
+
+def test_context_sharpness_is_full_resolution():
+    frame = np.random.default_rng(1).integers(0, 256, (600, 800, 3), dtype=np.uint8)
+    ctx = AnalysisContext(frame, detect_roi=False)
+    assert ctx.sharpness == pytest.approx(cv2.Laplacian(ctx.gray, cv2.CV_64F).var(), rel=1e-9)
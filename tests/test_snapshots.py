@@ -0,0 +1,28 @@
+"""Analyzer output against the benchmark snapshots in benchmarks/snapshots"""
+
+import json
+import os
+import sys
+
+import pytest
+
+from backend_app import analyzer
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from corpus import corpus  # noqa: E402
+
+with open(os.path.join(ROOT, 'benchmarks', 'snapshots', 'analysis.json')) as f:
+    SNAPSHOTS = json.load(f)
+
+# The larger sizes are covered by benchmarks/run.py; these keep the suite quick
+CASES = list(corpus(sizes=('0.3mp', '2mp')))
+
+
+@pytest.mark.parametrize('name, mimetype, data', CASES, ids=[case[0] for case in CASES])
+def test_analysis_matches_snapshot(client, no_cache, name, mimetype, data):
+    expected = SNAPSHOTS[name]
+    assert json.loads(json.dumps(analyzer.analyze_image(analyzer.decode_image(data)))) == expected
+    # The route adds recommendations on top of the analysis fields
+    data = client.post('/api/analyze', data=data, content_type=mimetype).get_json()['data']
+    assert {key: data[key] for key in expected} == expected
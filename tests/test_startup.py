@@ -0,0 +1,41 @@
+"""Importing the app and probing its health stay cheap on a cold worker"""
+
+import json
+import os
+import subprocess
+import sys
+
+import backend_app
+from conftest import ROOT
+
+IMPORT_BUDGET_SECONDS = 5.0
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import backend_app
+elapsed = time.perf_counter() - start
+print(json.dumps({'elapsed': elapsed, 'modules': sorted(sys.modules)}))
+"""
+
+
+def test_import_is_fast_and_lazy():
+    env = dict(os.environ, DERMAI_WARMUP='0')
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True, timeout=60
+    ).stdout
+    probe = json.loads(output.strip().splitlines()[-1])
+    assert probe['elapsed'] < IMPORT_BUDGET_SECONDS
+    for heavy in ('tensorflow', 'sklearn', 'onnxruntime'):
+        assert heavy not in probe['modules']
+
+
+def test_health_check_does_not_load_the_model(client, monkeypatch):
+    def load(path):
+        raise AssertionError('health check loaded the model')
+
+    monkeypatch.setattr(backend_app.SkinTypeClassifier, 'load', staticmethod(load))
+    monkeypatch.setattr(backend_app, 'analyzer', backend_app.SkinAnalyzer(skin_type_model='skin-type.onnx'))
+    model = client.get('/api/health').get_json()['skinTypeModel']
+    assert model == {'backend': None, 'loaded': False, 'model': 'skin-type.onnx', 'error': None}
@@ -0,0 +1,71 @@
+"""Upload bodies accepted by /api/analyze and /api/analyze/jobs, and the errors for the rest"""
+
+from io import BytesIO
+
+import pytest
+
+import backend_app
+from conftest import data_url, skin_photo
+
+
+@pytest.mark.parametrize('mimetype', ['image/jpeg', 'image/png', 'image/webp'])
+def test_raw_image_bodies(client, mimetype):
+    fmt = mimetype.split('/')[1].upper()
+    response = client.post('/api/analyze', data=skin_photo(1, fmt=fmt), content_type=mimetype)
+    assert response.status_code == 200
+    assert response.get_json()['success']
+
+
+def test_upload_forms_agree(client, no_cache):
+    photo = skin_photo(2)
+    raw = client.post('/api/analyze', data=photo, content_type='image/jpeg').get_json()
+    multipart = client.post('/api/analyze', data={'image': (BytesIO(photo), 'face.jpg')},
+                            content_type='multipart/form-data').get_json()
+    as_json = client.post('/api/analyze', json={'image': data_url(photo)}).get_json()
+    assert raw == multipart == as_json
+
+
+@pytest.mark.parametrize('route', ['/api/analyze', '/api/analyze/jobs'])
+def test_unsupported_content_type_is_415(client, route):
+    response = client.post(route, data='hello', content_type='text/plain')
+    assert response.status_code == 415
+    assert response.get_json()['success'] is False
+
+
+@pytest.mark.parametrize('route', ['/api/analyze', '/api/analyze/jobs'])
+@pytest.mark.parametrize('body', ['null', '[]', '"text"', '{"image": 5}', '{not json'])
+def test_malformed_json_is_400(client, route, body):
+    response = client.post(route, data=body, content_type='application/json')
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+@pytest.mark.parametrize('route', ['/api/analyze/batch', '/api/analyze/burst'])
+def test_batch_and_burst_reject_non_object_json(client, route):
+    assert client.post(route, data='[1, 2]', content_type='application/json').status_code == 400
+
+
+def test_missing_image_is_400(client):
+    assert client.post('/api/analyze', json={}).status_code == 400
+    response = client.post('/api/analyze', data={'other': 'x'}, content_type='multipart/form-data')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('body', [
+    {'data': b'not an image', 'content_type': 'image/jpeg'},
+    {'data': skin_photo(3)[:2000], 'content_type': 'image/jpeg'},
+    {'json': {'image': 'data:image/jpeg;base64,bm90IGFuIGltYWdl'}},
+    {'json': {'image': 'no data url'}},
+], ids=['garbage', 'truncated', 'data-url', 'malformed-url'])
+def test_undecodable_image_is_400_with_error(client, no_cache, body):
+    response = client.post('/api/analyze', **body)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+    assert response.get_json()['error']
+
+
+def test_oversized_body_is_413(client, monkeypatch):
+    monkeypatch.setattr(backend_app, 'MAX_UPLOAD_BYTES', 1000)
+    response = client.post('/api/analyze', data=skin_photo(3), content_type='image/jpeg')
+    assert response.status_code == 413
+    assert response.get_json()['maxBytes'] == 1000